@@ -0,0 +1,147 @@
+"""
+Benchmarks of the classification of sbi codes by SbiInfo
+
+Usage::
+
+    python benchmarks/benchmark_sbi.py --n_codes 1000000 10000000
+
+The codes are drawn from the sbi codes of the excel file in the data directory and stored as a
+fixed width byte array, as they are found in the company registers.
+
+Author: Eelco van Vliet
+"""
+
+import argparse
+import logging
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from cbs_utils.misc import (Timer, create_logger)
+from cbs_utils.readers import (SbiInfo, SbiLookup, sbi_codes_to_keys)
+
+logger = create_logger(console_log_level=logging.INFO)
+
+SBI_FILE = Path(__file__).parent.parent / "data" / "SBI 2008 versie 2018.xlsx"
+
+# the grouping of the sbi codes as used in many of the CBS publications
+CBS_SBI_GROUPS = {
+    "A": "Landbouw, bosbouw en visserij",
+    "B": "Delfstoffenwinning",
+    "10-12": "Voedings- en genotmiddelenindustrie",
+    "13-15": "Textiel-, kleding- en lederindustrie",
+    "16-18": "Hout-, papier- en grafische industrie",
+    "19-22": "Aardolie-, chemische, farmaceutische, rubber- en kunststofindustrie",
+    "23": "Bouwmaterialenindustrie",
+    "24-25": "Basismetaal- en metaalproductenindustrie",
+    "26-27": "Elektrotechnische en elektronische industrie",
+    "28": "Machine-industrie",
+    "29-30": "Transportmiddelenindustrie",
+    "31-33": "Overige industrie en reparatie",
+    "D": "Energievoorziening",
+    "E": "Waterbedrijven en afvalbeheer",
+    "F": "Bouwnijverheid",
+    "45": "Handel en reparatie van auto's",
+    "46": "Groothandel",
+    "47": "Detailhandel",
+    "49-53": "Vervoer en opslag",
+    "55-56": "Logies- en maaltijdverstrekking",
+    "58-60": "Uitgeverijen, film, radio en televisie",
+    "61": "Telecommunicatie",
+    "62-63": "IT-dienstverlening",
+    "64.19-64.92": "Banken",
+    "65": "Verzekeraars en pensioenfondsen",
+    "66": "Overige financiele dienstverlening",
+    "68": "Verhuur van en handel in onroerend goed",
+    "69-71": "Juridische dienstverlening, advies- en ingenieursbureaus",
+    "72": "Research",
+    "73-75": "Reclame, design en overige specialistische zakelijke diensten",
+    "77-82": "Verhuur en overige zakelijke diensten",
+    "O-P": "Openbaar bestuur en onderwijs",
+    "Q": "Gezondheids- en welzijnszorg",
+    "R-S": "Cultuur, recreatie en overige diensten",
+}
+
+
+def make_sbi_codes(sbi, n_codes, seed=1):
+    """ Draw *n_codes* random codes without dots, such as b'6210', from the sbi data """
+    data = sbi.data.reset_index()
+    data = data[data[sbi.level_names[1]] != 0]
+    codes = ["{:02d}{}{}{}".format(main, second, third, fourth if fourth else "")
+             for main, second, third, fourth in data[sbi.level_names[1:]].values]
+    rng = np.random.default_rng(seed)
+    return rng.choice(np.array(codes, dtype="S5"), n_codes)
+
+
+def benchmark_get_sbi_groups(sbi, n_codes, n_repeat=3):
+    """ Time the conversion of the codes into keys and the look up of the groups """
+    code_array = make_sbi_codes(sbi, n_codes)
+    logger.info(f"Benchmarking {n_codes} sbi codes")
+    for cnt in range(n_repeat):
+        with Timer(name=f"sbi_codes_to_keys {n_codes}", units="ms"):
+            sbi_codes_to_keys(code_array)
+        with Timer(name=f"get_sbi_groups {n_codes}", units="ms") as timer:
+            sbi.get_sbi_groups(code_array)
+        logger.info(f"get_sbi_groups: {n_codes / timer.secs:.0f} codes/s")
+
+
+def benchmark_lookup_file(sbi, n_codes, n_repeat=3):
+    """ Time the look up of the groups with the lookup table read as memory map from file """
+    code_array = make_sbi_codes(sbi, n_codes)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_name = Path(tmp_dir) / "sbi_lookup.npy"
+        sbi.get_lookup().save(file_name)
+        with Timer(name="load sbi lookup", units="ms"):
+            lookup = SbiLookup.load(file_name)
+        for cnt in range(n_repeat):
+            with Timer(name=f"memory mapped get_sbi_groups {n_codes}", units="ms") as timer:
+                lookup.get_sbi_groups(code_array)
+            logger.info(f"memory mapped get_sbi_groups: {n_codes / timer.secs:.0f} codes/s")
+
+
+def benchmark_create_sbi_groups(sbi, n_repeat=3):
+    """ Time the assignment of the standard CBS groups, once compiled and from the cache """
+    for cnt in range(n_repeat):
+        with Timer(name=f"create_sbi_groups {len(CBS_SBI_GROUPS)} groups", units="ms"):
+            sbi.create_sbi_groups(CBS_SBI_GROUPS)
+
+
+def benchmark_get_index_from_string(sbi, n_ranges=10000):
+    """ Time the resolution of random ranges of sbi codes such as '62.01-63.1' """
+    data = sbi.data.reset_index()
+    data = data[data[sbi.level_names[1]] != 0]
+    codes = ["{:02d}.{}{}".format(main, second, third)
+             for main, second, third in data[sbi.level_names[1:4]].values]
+    rng = np.random.default_rng(1)
+    ranges = ["-".join(sorted(pair)) for pair in rng.choice(codes, (n_ranges, 2))]
+    with Timer(name=f"get_index_from_string {n_ranges} ranges", units="ms") as timer:
+        for index_range in ranges:
+            sbi.get_index_from_string(index_range)
+    logger.info(f"get_index_from_string: {n_ranges / timer.secs:.0f} ranges/s")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the sbi code classification")
+    parser.add_argument("--n_codes", type=int, nargs="+", default=[1000000, 10000000],
+                        help="Number of codes per benchmark")
+    parser.add_argument("--n_repeat", type=int, default=3, help="Number of repetitions")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    with Timer(name="parse sbi excel", units="ms"):
+        sbi = SbiInfo(str(SBI_FILE), reset_cache=True)
+
+    benchmark_create_sbi_groups(sbi, n_repeat=args.n_repeat)
+    benchmark_get_index_from_string(sbi)
+
+    for n_codes in args.n_codes:
+        benchmark_get_sbi_groups(sbi, n_codes, n_repeat=args.n_repeat)
+        benchmark_lookup_file(sbi, n_codes, n_repeat=args.n_repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Benchmarks of the StatLineTable reader based on a synthetic table
+
+Usage::
+
+    python benchmarks/benchmark_statline.py --n_modules 100
+
+The synthetic table is written to a temporary cache directory, so no connection to
+opendata.cbs.nl is required.
+
+Author: Eelco van Vliet
+"""
+
+import argparse
+import logging
+import tempfile
+from pathlib import Path
+
+from cbs_utils.misc import (Timer, create_logger)
+from cbs_utils.readers import (CACHE_FORMATS, StatLineTable)
+
+from synthetic_statline import write_synthetic_statline
+
+logger = create_logger(console_log_level=logging.INFO)
+
+
+def benchmark_fill_question_list(table, n_repeat=3):
+    """ Time the conversion of the DataProperties json into the question/section/dimension df """
+    for cnt in range(n_repeat):
+        with Timer(name="fill_question_list", units="ms"):
+            table.initialize_dataframes()
+            table.fill_question_list()
+
+
+def benchmark_section_titles(cache_dir, image_dir, n_deep_levels=6, n_repeat=3):
+    """ Time the resolution of the section titles on a table with deeply nested sections """
+    table_id = "99998NED"
+    n_topics = write_synthetic_statline(cache_dir, table_id=table_id, n_modules=50,
+                                        n_questions=20, n_options=5, deep_every=1,
+                                        n_deep_levels=n_deep_levels)
+    logger.info(f"Benchmarking the section titles of {n_topics} topics in {n_deep_levels + 1} "
+                f"section levels")
+    table = StatLineTable(table_id=table_id,
+                          cache_dir_name=str(cache_dir),
+                          image_dir_name=str(image_dir),
+                          max_levels=n_deep_levels + 3,
+                          add_level_titles=True,
+                          lazy=True,
+                          to_pickle=False,
+                          write_info_to_image_dir=False)
+    table.materialize(stages=["raw"])
+    for cnt in range(n_repeat):
+        with Timer(name="section titles", units="ms"):
+            table.initialize_dataframes()
+            table.fill_question_list()
+
+
+def benchmark_fill_data(table, n_repeat=3):
+    """ Time the merge of the TypedDataSet values into the question_df """
+    for cnt in range(n_repeat):
+        table.initialize_dataframes()
+        table.fill_question_list()
+        with Timer(name="fill_data", units="ms"):
+            table.fill_data()
+    table.question_df.set_index(table.level_keys, inplace=True, drop=True)
+
+
+def benchmark_cache(table, cache_formats=("pickle", "parquet", "feather"), n_repeat=3):
+    """ Time writing and reading the question/section/dimension df in the various cache formats """
+    for cache_format in cache_formats:
+        table.cache_format = cache_format
+        table.cache_files = {label: file_name.with_suffix(CACHE_FORMATS[cache_format])
+                             for label, file_name in table.pickle_files.items()}
+        with Timer(name=f"write {cache_format}", units="ms"):
+            table.cache_data(mode="write")
+        for cnt in range(n_repeat):
+            with Timer(name=f"read {cache_format}", units="ms"):
+                table.cache_data(mode="read")
+        if cache_format != "pickle":
+            table.columns = ["Key", "Values"]
+            with Timer(name=f"read {cache_format} 2 col", units="ms"):
+                table.cache_data(mode="read")
+            table.columns = None
+
+
+def benchmark_cache_check(table, n_repeat=3):
+    """ Time the check of the manifest which decides if the cache can be used """
+    table.write_manifest()
+    for cnt in range(n_repeat):
+        with Timer(name="cache_is_valid", units="ms", n_digits=2):
+            table.cache_is_valid()
+
+
+def benchmark_sql(table, n_repeat=3):
+    """
+    Compare the insert throughput of the bulk sqlite export with the to_sql export
+
+    Note that the time of the bulk export includes the creation of the indices
+    """
+    n_rows = len(table.question_df)
+    for bulk in (False, True):
+        label = "bulk" if bulk else "to_sql"
+        for cnt in range(n_repeat):
+            with Timer(name=f"sqlite {label}", units="ms") as timer:
+                table.write_sql_data(bulk=bulk)
+            logger.info(f"sqlite {label}: {n_rows / timer.secs:.0f} rows/s")
+
+
+def benchmark_compaction(table, n_repeat=3):
+    """ Time the compaction of the question_df dtypes and report the memory per column """
+    question_df = table.question_df
+    for cnt in range(n_repeat):
+        table.question_df = question_df
+        with Timer(name="compact_question_df", units="ms"):
+            table.compact_question_df()
+    table.memory_report()
+    table.question_df = question_df
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the StatLineTable reader")
+    parser.add_argument("--n_modules", type=int, default=100, help="Number of modules")
+    parser.add_argument("--n_questions", type=int, default=20, help="Questions per module")
+    parser.add_argument("--n_options", type=int, default=5, help="Options per question")
+    parser.add_argument("--n_dimension_values", type=int, default=4,
+                        help="Number of values of the dimension")
+    parser.add_argument("--n_periods", type=int, default=1,
+                        help="Number of values of the second dimension 'Perioden'")
+    parser.add_argument("--n_deep_levels", type=int, default=6,
+                        help="Number of nested section levels of the section title benchmark")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache_dir = Path(tmp_dir) / "cache"
+        image_dir = Path(tmp_dir) / "images"
+        n_topics = write_synthetic_statline(cache_dir, table_id="99999NED",
+                                            n_modules=args.n_modules,
+                                            n_questions=args.n_questions,
+                                            n_options=args.n_options,
+                                            dimensions={"Bedrijfsgrootte":
+                                                        args.n_dimension_values,
+                                                        "Perioden": args.n_periods})
+        logger.info(f"Benchmarking a table with {n_topics} topics")
+
+        with Timer(name="cold import", units="s", n_digits=2):
+            table = StatLineTable(table_id="99999NED",
+                                  cache_dir_name=str(cache_dir),
+                                  image_dir_name=str(image_dir),
+                                  to_pickle=False,
+                                  write_info_to_image_dir=False)
+
+        benchmark_fill_question_list(table)
+        benchmark_fill_data(table)
+        benchmark_compaction(table)
+        benchmark_cache(table)
+        benchmark_cache_check(table)
+        benchmark_sql(table)
+        benchmark_section_titles(cache_dir, image_dir, n_deep_levels=args.n_deep_levels)
+
+
+if __name__ == "__main__":
+    main()
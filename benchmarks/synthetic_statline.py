@@ -0,0 +1,173 @@
+"""
+Create synthetic StatLine OpenData dumps which can be used to benchmark the *StatLineTable* reader
+without connecting to opendata.cbs.nl
+
+The files are written in the same layout as *cbsodata.get_data* uses to dump a table, so the
+directory can be used as *cache_dir_name* of the StatLineTable class.
+
+Author: Eelco van Vliet
+"""
+
+import json
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+def make_dimension(key, n_values):
+    """ Create the dimension properties and the dimension values of a dimension *key* """
+    values = list()
+    for cnt in range(n_values):
+        values.append({"Key": f"{key[:3].upper()}{cnt:03d}",
+                       "Title": f"{key} waarde {cnt}",
+                       "Description": None,
+                       "CategoryGroupID": None})
+    return values
+
+
+def write_synthetic_statline(cache_dir, table_id="99999NED",
+                             n_modules=10,
+                             n_questions=10,
+                             n_options=5,
+                             deep_every=2,
+                             n_deep_levels=2,
+                             dimensions=None):
+    """
+    Write a synthetic statline table to *cache_dir/table_id*
+
+    Parameters
+    ----------
+    cache_dir: str or Path
+        Cache directory as used by StatLineTable
+    table_id: str
+        Name of the table. Default = "99999NED"
+    n_modules: int
+        Number of modules in the questionnaire
+    n_questions: int
+        Number of questions per module
+    n_options: int
+        Number of options (topics) per question
+    deep_every: int
+        Every *deep_every* module is nested in *n_deep_levels* extra section levels, such that the
+        topics end up at level L(2 + n_deep_levels). The other modules have their topics at level
+        L2. Default = 2
+    n_deep_levels: int
+        Number of extra section levels of the deep modules. Note that the *max_levels* argument of
+        the StatLineTable must be at least 3 + n_deep_levels. Default = 2
+    dimensions: dict, optional
+        Dimension key and number of dimension values. Default = {"Bedrijfsgrootte": 4}
+
+    Returns
+    -------
+    int:
+        Number of topics written
+    """
+    if dimensions is None:
+        dimensions = {"Bedrijfsgrootte": 4}
+
+    output_directory = Path(cache_dir) / Path(table_id)
+    output_directory.mkdir(parents=True, exist_ok=True)
+
+    data_properties = list()
+    dimension_values = dict()
+    for cnt, (key, n_values) in enumerate(dimensions.items()):
+        data_properties.append({"odata.type": "Cbs.OData.Dimension",
+                                "ID": cnt,
+                                "Position": cnt,
+                                "ParentID": None,
+                                "Type": "Dimension",
+                                "Key": key,
+                                "Title": key,
+                                "Description": f"Beschrijving van {key}",
+                                "Default": "None",
+                                "MapYear": None,
+                                "ReleasePolicyKey": None})
+        dimension_values[key] = make_dimension(key, n_values)
+
+    topic_keys = list()
+    next_id = len(dimensions)
+    position = 1
+
+    def add_group(title, parent_id):
+        nonlocal next_id
+        group_id = next_id
+        next_id += 1
+        data_properties.append({"odata.type": "Cbs.OData.TopicGroup",
+                                "ID": group_id,
+                                "ParentID": parent_id,
+                                "Type": "TopicGroup",
+                                "Key": "",
+                                "Title": title,
+                                "Description": None})
+        return group_id
+
+    def add_topic(title, parent_id):
+        nonlocal next_id, position
+        key = f"T{position:06d}_1"
+        data_properties.append({"odata.type": "Cbs.OData.Topic",
+                                "ID": next_id,
+                                "Position": position,
+                                "ParentID": parent_id,
+                                "Type": "Double",
+                                "Key": key,
+                                "Title": title,
+                                "Description": None if position % 3 else f"Toelichting {title}",
+                                "Datatype": "Double",
+                                "Unit": "%",
+                                "Decimals": 1,
+                                "Default": "Impossible"})
+        topic_keys.append(key)
+        next_id += 1
+        position += 1
+
+    for i_mod in range(n_modules):
+        parent_id = add_group(f"Module {i_mod}", None)
+        if deep_every and i_mod % deep_every == deep_every - 1:
+            # put the questions of this module n_deep_levels section levels deeper
+            for i_level in range(n_deep_levels):
+                if i_level == 0:
+                    title = f"Hoofdstuk {i_mod}"
+                elif i_level == 1:
+                    title = f"Paragraaf {i_mod}"
+                else:
+                    title = f"Subparagraaf {i_mod}.{i_level - 1}"
+                parent_id = add_group(title, parent_id)
+        for i_quest in range(n_questions):
+            question_id = add_group(f"Vraag {i_mod}.{i_quest}", parent_id)
+            for i_opt in range(n_options):
+                add_topic(f"Optie {i_opt} van vraag {i_mod}.{i_quest}", question_id)
+
+    # the typed data set has one record per combination of dimension values
+    records = [dict()]
+    for key, values in dimension_values.items():
+        records = [dict(rec, **{key: val["Key"]}) for rec in records for val in values]
+    typed_data_set = list()
+    for row_id, record in enumerate(records):
+        row = {"ID": row_id}
+        row.update(record)
+        for cnt, key in enumerate(topic_keys):
+            row[key] = float((row_id * 7 + cnt * 3) % 101)
+        typed_data_set.append(row)
+
+    table_infos = [{"ID": 1,
+                    "Title": f"Synthetische tabel {table_id}",
+                    "ShortTitle": "Synthetische tabel",
+                    "Identifier": table_id,
+                    "Modified": "2019-06-01T02:00:00",
+                    "Frequency": "Eenmalig"}]
+
+    def dump(name, data):
+        with open(output_directory / Path(f"{name}.json"), "w") as stream:
+            json.dump(data, stream)
+
+    dump("DataProperties", data_properties)
+    dump("TypedDataSet", typed_data_set)
+    dump("TableInfos", table_infos)
+    for key, values in dimension_values.items():
+        dump(key, values)
+
+    logger.info(f"Wrote synthetic table {table_id} with {len(topic_keys)} topics and "
+                f"{len(typed_data_set)} records to {output_directory}")
+
+    return len(topic_keys)
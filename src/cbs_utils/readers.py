@@ -2,26 +2,34 @@
 A collection of utilities to read from several data formats
 
 * *StatLineTable*: class to read from Opendata.cbs.nl and store the table into a Pandas DataFrame
+* *QuestionnaireTree*: tree of the modules, sections and questions of a StatLineTable
 * *SbiInfo*: Class to read from a sbi Excel file and store all coding in a Pandas DataFrame
 
 Author: Eelco van Vliet
 """
 
+import atexit
 import collections
+import contextlib
+import hashlib
+import io
 import json
 import logging
 import math
 import os
 import re
+import shutil
 import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 
-import matplotlib.pylab as plt
+import numpy as np
 import pandas as pd
 import requests
 import yaml
 
-from .plotting import add_cbs_logo_to_plot
+from . import __version__
 from .misc import dataframe_clip_strings
 
 logger = logging.getLogger(__name__)
@@ -31,6 +39,109 @@ try:
 except ImportError as err:
     logger.warning(err)
 
+try:
+    # pyarrow is only required for the parquet and feather cache formats of the StatLineTable
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+try:
+    # ijson is only required for streaming the TypedDataSet.json with the *chunk_size* option. If
+    # it is not available, a slower pure python parser is used
+    import ijson
+except ImportError:
+    ijson = None
+
+# the characters which can continue a json number, used to detect a number split over two chunks
+NUMBER_CHARACTERS = "0123456789.eE+-"
+
+# the supported formats of the StatLineTable cache with their file extension
+CACHE_FORMATS = {"pickle": ".pkl", "parquet": ".parquet", "feather": ".feather"}
+
+# key of the schema metadata in which the index of a data frame stored to parquet/feather is kept
+ARROW_INDEX_METADATA_KEY = b"cbs_utils.index"
+
+# the python types which can be stored by sqlite3 without conversion
+SQL_PYTHON_TYPES = {type(None), int, float, str, bytes, bool}
+
+# the StatLine data types of which the values are integers
+STATLINE_INTEGER_TYPES = ("Integer", "Long", "Short", "Byte")
+
+# the number of values of the fourth level of the packed sbi keys
+SBI_FOURTH_LEVEL_SIZE = 10 ** 9
+
+# the number of positions of the dense sbi lookup table: a two digit main group and three levels
+# of one digit, such that a code such as '74283' is its own position
+SBI_DENSE_SIZE = 10 ** 5
+
+
+# the ways to combine the plot data of the questions into one workbook
+PLOT_DATA_BATCHES = (None, "module", "table")
+
+# the renderer of a process which renders figures for StatLineTable.plot(workers=N)
+_worker_renderer = None
+
+# the maximum number of compiled sbi group specifications kept by compile_sbi_group_spec
+SBI_GROUP_SPEC_CACHE_SIZE = 32
+
+# the compiled sbi group specifications of compile_sbi_group_spec by the hash of the specification,
+# with the least recently used specification first
+_sbi_group_specs = collections.OrderedDict()
+
+# the stages of the StatLineTable with the stages they require
+STATLINE_STAGES = collections.OrderedDict([
+    ("raw", []),
+    ("frames", ["raw"]),
+    ("info", ["raw", "frames"]),
+    ("info_files", ["raw", "frames", "info"]),
+    ("exports", ["raw", "frames"]),
+])
+
+
+class StageAttribute(object):
+    """
+    Attribute of a StatLineTable which is created by one of its stages
+
+    In case the attribute is accessed before it has been created, the stage is carried out with
+    the *materialize* method first. The value is stored in the instance under the attribute name
+    with a leading underscore
+
+    Parameters
+    ----------
+    stage: str
+        The stage which creates this attribute
+    invalidates: list, optional
+        Names of the attributes which are derived from this attribute. They are reset to None each
+        time a new value is assigned to this attribute. Default = None
+    """
+
+    def __init__(self, stage, invalidates=None):
+        self.stage = stage
+        self.name = None
+        if invalidates is not None:
+            self.invalidates = invalidates
+        else:
+            self.invalidates = list()
+
+    def __set_name__(self, owner, name):
+        self.name = "_" + name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = instance.__dict__.get(self.name)
+        if value is None and self.stage not in instance.__dict__.get("stages_done", {self.stage}):
+            instance.materialize(stages=[self.stage])
+            value = instance.__dict__.get(self.name)
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.name] = value
+        for name in self.invalidates:
+            instance.__dict__[name] = None
+
 
 class DataProperties(object):
     """
@@ -52,6 +163,620 @@ class DataProperties(object):
         self.default = indicator_dict.get("Default")
 
 
+class DimensionLookup(object):
+    """
+    The keys and titles of the values of a dimension, such as the periods or the size classes
+
+    Parameters
+    ----------
+    keys: array_like
+        The short keys of the dimension values, such as 'GK1'
+    titles: array_like
+        The titles of the dimension values, such as 'Klein'
+
+    Notes
+    -----
+    * Only the keys and the titles are stored in arrays, together with an index which gives the
+      position of each key. The titles of many keys are looked up at once with *get_titles*
+    """
+
+    __slots__ = ("index", "titles")
+
+    def __init__(self, keys, titles):
+        self.index = pd.Index(keys)
+        self.titles = np.asarray(titles, dtype=object)
+
+    def __len__(self):
+        return len(self.titles)
+
+    @property
+    def keys(self):
+        """ The keys of the dimension values """
+        return self.index.values
+
+    @classmethod
+    def from_json(cls, file_name, key_key="Key", title_key="Title"):
+        """
+        Read the dimension values from a json file such as 'Bedrijfsgrootte.json'
+
+        Parameters
+        ----------
+        file_name: Path
+            The json file with a list of records with at least the key and the title
+        key_key: str, optional
+            The field of the key. Default = "Key"
+        title_key: str, optional
+            The field of the title. Default = "Title"
+
+        Returns
+        -------
+        DimensionLookup:
+            The lookup of the dimension
+        """
+        with open(file_name, "r") as stream:
+            records = json.load(stream)
+        return cls(keys=[record[key_key] for record in records],
+                   titles=[record.get(title_key) for record in records])
+
+    def get_positions(self, keys):
+        """
+        Get the positions of *keys* in the dimension values
+
+        Parameters
+        ----------
+        keys: array_like
+            The keys to look up
+
+        Returns
+        -------
+        np.ndarray:
+            The position of each key
+
+        Raises
+        ------
+        KeyError:
+            In case a key is not a value of the dimension
+        """
+        positions = self.index.get_indexer(keys)
+        if (positions < 0).any():
+            missing = pd.unique(np.asarray(keys, dtype=object)[positions < 0])
+            raise KeyError(f"{list(missing)} not in the dimension values")
+        return positions
+
+    def get_titles(self, keys):
+        """
+        Get the titles of *keys*
+
+        Parameters
+        ----------
+        keys: array_like
+            The keys to look up
+
+        Returns
+        -------
+        np.ndarray:
+            The title of each key
+        """
+        return self.titles.take(self.get_positions(keys))
+
+    def to_data_frame(self, key_key="Key", title_key="Title"):
+        """ Get the dimension values as a data frame with the key as index """
+        return pd.DataFrame({title_key: self.titles}, index=pd.Index(self.index, name=key_key))
+
+
+def read_dimension_lookups(file_names, workers=None, key_key="Key", title_key="Title"):
+    """
+    Read the json files of the dimensions concurrently
+
+    Parameters
+    ----------
+    file_names: dict
+        The json file per dimension key
+    workers: int, optional
+        Number of threads used to read the files. Default = None, which means one thread per
+        file with a maximum of 8
+    key_key: str, optional
+        The field of the key. Default = "Key"
+    title_key: str, optional
+        The field of the title. Default = "Title"
+
+    Returns
+    -------
+    OrderedDict:
+        The *DimensionLookup* per dimension key, in the order of *file_names*
+
+    Notes
+    -----
+    * Reading the files is mostly waiting for the file system, which is slow on a network drive,
+      so it is carried out in threads
+    """
+    dimension_keys = list(file_names.keys())
+    if workers is None:
+        workers = min(len(dimension_keys), 8)
+
+    def read_lookup(dimension_key):
+        return DimensionLookup.from_json(file_names[dimension_key], key_key=key_key,
+                                         title_key=title_key)
+
+    if workers <= 1 or len(dimension_keys) <= 1:
+        lookups = [read_lookup(dimension_key) for dimension_key in dimension_keys]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            lookups = list(executor.map(read_lookup, dimension_keys))
+
+    return collections.OrderedDict(zip(dimension_keys, lookups))
+
+
+class QuestionnaireNode(object):
+    """
+    A node of the *QuestionnaireTree*, which is a module, section, question or topic
+
+    Parameters
+    ----------
+    tree: QuestionnaireTree
+        The tree to which the node belongs
+    position: int
+        The position of the node in the arrays of the tree
+
+    Notes
+    -----
+    * The node does not hold any data itself but refers to the arrays of the tree, so nodes are
+      cheap to create and are created on the fly by the methods of the tree
+    """
+
+    __slots__ = ("tree", "position")
+
+    def __init__(self, tree, position):
+        self.tree = tree
+        self.position = position
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(id={self.id}, level={self.level}, title={self.title!r})"
+
+    def __eq__(self, other):
+        return (isinstance(other, QuestionnaireNode) and other.tree is self.tree and
+                other.position == self.position)
+
+    def __hash__(self):
+        return hash((id(self.tree), self.position))
+
+    @property
+    def id(self):
+        """ The ID of the data property """
+        return int(self.tree.ids[self.position])
+
+    @property
+    def level(self):
+        """ The level of the node in the index of the question_df, where 0 is the module """
+        return int(self.tree.levels[self.position])
+
+    @property
+    def key(self):
+        """ The key of the data property, which is empty for a group """
+        return str(self.tree.keys[self.position])
+
+    @property
+    def title(self):
+        """ The title of the data property """
+        return str(self.tree.titles[self.position])
+
+    @property
+    def is_leaf(self):
+        """ True in case the node has no children """
+        return bool(self.tree.child_starts[self.position] ==
+                    self.tree.child_starts[self.position + 1])
+
+    @property
+    def parent(self):
+        """ The parent node, or None for a module """
+        parent = self.tree.parents[self.position]
+        if parent < 0:
+            return None
+        return QuestionnaireNode(self.tree, int(parent))
+
+    @property
+    def children(self):
+        """ The child nodes in the order of their ID """
+        start, stop = self.tree.child_starts[self.position:self.position + 2]
+        return [QuestionnaireNode(self.tree, int(child))
+                for child in self.tree.children[start:stop]]
+
+    @property
+    def ancestors(self):
+        """ The parent nodes of the node, starting with the module """
+        ancestors = list()
+        parent = self.tree.parents[self.position]
+        while parent >= 0:
+            ancestors.append(QuestionnaireNode(self.tree, int(parent)))
+            parent = self.tree.parents[parent]
+        return ancestors[::-1]
+
+    @property
+    def n_rows(self):
+        """ The number of rows in the question_df of the node and all its sub nodes """
+        return int(self.tree.row_stops[self.position] - self.tree.row_starts[self.position])
+
+
+class QuestionnaireTree(object):
+    """
+    Tree with the modules, sections, questions and topics of a StatLine table
+
+    Parameters
+    ----------
+    n_levels: int
+        The number of levels of the index of the question_df
+    data_frame: pd.DataFrame, optional
+        The question_df from which the tree was built. Required for *subtree_frame*
+    **arrays:
+        The arrays as given by *array_names*, which are created by *from_data_frame*
+
+    Notes
+    -----
+    * The structure of the questionnaire is only stored implicitly in the levels L0, L1, .. of the
+      index of the question_df. The tree stores each ID found in the levels as a node in arrays,
+      such that the structure does not have to be rediscovered by grouping the data frame
+    * The nodes are stored in pre-order, i.e. each node is followed by all its sub nodes, and the
+      children are sorted on their ID. All the sub nodes of the node at position *i* are
+      therefore found at the positions *i + 1* up to *subtree_stops[i]*
+    * The children of the node at position *i* are found at *children[child_starts[i]:
+      child_starts[i + 1]]*
+    * The rows of the question_df are sorted on the position of their deepest node in
+      *row_order*, so the rows of a node and all its sub nodes are found at
+      *row_order[row_starts[i]:row_stops[i]]*
+    * *min_leaf_levels* and *max_leaf_levels* give the lowest and highest level of the deepest
+      node of the rows of each node. In case they are equal, all the rows of the node have the
+      same number of empty levels
+
+    Examples
+    --------
+
+    >>> tree = QuestionnaireTree.from_data_frame(stat.question_df, stat.section_df)
+    >>> for node in tree.walk():
+    ...     print("  " * node.level + node.title)
+    >>> question_df = tree.subtree_frame(2)
+    """
+
+    array_names = ("ids", "levels", "parents", "subtree_stops", "child_starts", "children",
+                   "row_order", "row_starts", "row_stops", "min_leaf_levels", "max_leaf_levels",
+                   "keys", "titles")
+
+    def __init__(self, n_levels, data_frame=None, **arrays):
+        self.n_levels = n_levels
+        self.data_frame = data_frame
+
+        self.ids: np.ndarray = None
+        self.levels: np.ndarray = None
+        self.parents: np.ndarray = None
+        self.subtree_stops: np.ndarray = None
+        self.child_starts: np.ndarray = None
+        self.children: np.ndarray = None
+        self.row_order: np.ndarray = None
+        self.row_starts: np.ndarray = None
+        self.row_stops: np.ndarray = None
+        self.min_leaf_levels: np.ndarray = None
+        self.max_leaf_levels: np.ndarray = None
+        self.keys: np.ndarray = None
+        self.titles: np.ndarray = None
+
+        for name in self.array_names:
+            setattr(self, name, arrays[name])
+
+        # the lookup tables of the ids and keys are created on the first look up
+        self._id_order = None
+        self._key_positions = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return self.walk()
+
+    def __contains__(self, node_id):
+        return self.get_position(node_id) is not None
+
+    @property
+    def n_rows(self):
+        """ The number of rows of the question_df """
+        return len(self.row_order)
+
+    @property
+    def modules(self):
+        """ The nodes of the modules """
+        start, stop = self.child_starts[-2:]
+        return [QuestionnaireNode(self, int(child)) for child in self.children[start:stop]]
+
+    @classmethod
+    def from_data_frame(cls, question_df, section_df=None, key_key="Key", title_key="Title"):
+        """
+        Build the tree from the index of the question_df
+
+        Parameters
+        ----------
+        question_df: pd.DataFrame
+            The question_df of a StatLineTable with the levels L0, L1, ... as index
+        section_df: pd.DataFrame, optional
+            The section_df of the StatLineTable, from which the titles of the modules and the
+            sections are taken
+        key_key: str, optional
+            The column of the question_df with the key of the topics. Default = "Key"
+        title_key: str, optional
+            The column with the titles of the topics and sections. Default = "Title"
+
+        Returns
+        -------
+        QuestionnaireTree:
+            The tree of the question_df
+        """
+        index = question_df.index
+        if isinstance(index, pd.MultiIndex):
+            index_codes = [np.asarray(codes) for codes in index.codes]
+            index_levels = index.levels
+        else:
+            codes, uniques = pd.factorize(index)
+            index_codes = [codes]
+            index_levels = [uniques]
+
+        n_levels = len(index_codes)
+        n_rows = len(index)
+
+        # the id of each level per row, where -1 is used for an empty level. The ids of the
+        # data properties are never negative
+        row_ids = np.full((n_levels, n_rows), -1, dtype=np.int64)
+        for level, codes in enumerate(index_codes):
+            filled = codes >= 0
+            level_ids = np.asarray(index_levels[level], dtype=np.int64)
+            row_ids[level, filled] = level_ids[codes[filled]]
+        row_levels = n_levels - 1 - np.argmax(row_ids[::-1] >= 0, axis=0)
+
+        # each id found at a level is a node. Store the path of ids from the module to the node,
+        # which sorts the nodes in pre-order as an empty level is sorted before any id
+        paths = list()
+        first_rows = list()
+        for level in range(n_levels):
+            level_ids, first_row = np.unique(row_ids[level], return_index=True)
+            valid = level_ids >= 0
+            path = row_ids[:, first_row[valid]].copy()
+            path[level + 1:] = -1
+            paths.append(path)
+            first_rows.append(first_row[valid])
+        paths = np.concatenate(paths, axis=1)
+        order = np.lexsort(paths[::-1])
+        paths = paths[:, order]
+
+        levels = n_levels - 1 - np.argmax(paths[::-1] >= 0, axis=0)
+        n_nodes = len(levels)
+        node_positions = np.arange(n_nodes)
+        ids = paths[levels, node_positions]
+        id_order = np.argsort(ids, kind="stable")
+
+        def get_positions(node_ids):
+            return id_order[np.searchsorted(ids, node_ids, sorter=id_order)]
+
+        parents = np.full(n_nodes, -1, dtype=np.int64)
+        has_parent = levels > 0
+        parents[has_parent] = get_positions(paths[levels[has_parent] - 1,
+                                                  node_positions[has_parent]])
+
+        # the number of sub nodes is the number of nodes sharing the id at the level of the node
+        subtree_stops = np.zeros(n_nodes, dtype=np.int64)
+        for level in range(n_levels):
+            at_level = levels == level
+            level_ids, counts = np.unique(paths[level, levels >= level], return_counts=True)
+            subtree_stops[at_level] = (node_positions[at_level] +
+                                       counts[np.searchsorted(level_ids, ids[at_level])])
+
+        # the children per parent, where the modules are stored as children of the parent -1
+        # at the end
+        children = np.argsort(np.where(parents < 0, n_nodes, parents), kind="stable")
+        child_starts = np.searchsorted(np.where(parents < 0, n_nodes, parents)[children],
+                                       np.arange(n_nodes + 2))
+
+        # sort the rows on the position of their deepest node
+        row_nodes = get_positions(row_ids[row_levels, np.arange(n_rows)])
+        row_order = np.argsort(row_nodes, kind="stable")
+        sorted_row_nodes = row_nodes[row_order]
+        row_starts = np.searchsorted(sorted_row_nodes, node_positions)
+        row_stops = np.searchsorted(sorted_row_nodes, subtree_stops)
+        if n_nodes > 0:
+            sorted_row_levels = row_levels[row_order]
+            min_leaf_levels = np.minimum.reduceat(sorted_row_levels, row_starts)
+            max_leaf_levels = np.maximum.reduceat(sorted_row_levels, row_starts)
+        else:
+            min_leaf_levels = max_leaf_levels = np.zeros(0, dtype=np.int64)
+
+        # the keys of the topics and the titles of the nodes
+        first_rows = np.concatenate(first_rows)[order]
+        keys = np.full(n_nodes, "", dtype=object)
+        titles = np.full(n_nodes, "", dtype=object)
+        is_leaf = child_starts[:-2] == child_starts[1:-1]
+        leaf_rows = first_rows[is_leaf]
+        if key_key in question_df.columns:
+            keys[is_leaf] = question_df[key_key].to_numpy(dtype=object)[leaf_rows]
+        if title_key in question_df.columns:
+            titles[is_leaf] = question_df[title_key].to_numpy(dtype=object)[leaf_rows]
+        if section_df is not None and title_key in section_df.columns:
+            section_titles = section_df[title_key]
+            section_titles = section_titles[~section_titles.index.duplicated()]
+            group_titles = section_titles.reindex(ids[~is_leaf]).to_numpy(dtype=object)
+            titles[~is_leaf] = group_titles
+        keys = np.array(["" if key is None or key != key else str(key) for key in keys])
+        titles = np.array(["" if title is None or title != title else str(title)
+                           for title in titles])
+
+        tree = cls(n_levels=n_levels, data_frame=question_df, ids=ids, levels=levels,
+                   parents=parents, subtree_stops=subtree_stops, child_starts=child_starts,
+                   children=children, row_order=row_order, row_starts=row_starts,
+                   row_stops=row_stops, min_leaf_levels=min_leaf_levels,
+                   max_leaf_levels=max_leaf_levels, keys=keys, titles=titles)
+        tree._id_order = id_order
+
+        return tree
+
+    def save(self, file_name):
+        """
+        Write the arrays of the tree to a numpy npz file
+
+        Parameters
+        ----------
+        file_name: Path
+            The name of the npz file
+        """
+        with open(file_name, "wb") as stream:
+            np.savez(stream, n_levels=self.n_levels,
+                     **{name: getattr(self, name) for name in self.array_names})
+
+    @classmethod
+    def load(cls, file_name, data_frame=None):
+        """
+        Read the tree from a numpy npz file written by *save*
+
+        Parameters
+        ----------
+        file_name: Path
+            The name of the npz file
+        data_frame: pd.DataFrame, optional
+            The question_df belonging to the tree
+
+        Returns
+        -------
+        QuestionnaireTree:
+            The tree
+        """
+        with np.load(file_name, allow_pickle=False) as npz:
+            arrays = {name: npz[name] for name in cls.array_names}
+            n_levels = int(npz["n_levels"])
+        return cls(n_levels=n_levels, data_frame=data_frame, **arrays)
+
+    def get_position(self, node_id):
+        """
+        Get the position of the node with ID *node_id* in the arrays of the tree
+
+        Parameters
+        ----------
+        node_id: int
+            The ID of the node
+
+        Returns
+        -------
+        int or None:
+            The position of the node, or None if the ID is not in the tree
+        """
+        if self._id_order is None:
+            self._id_order = np.argsort(self.ids, kind="stable")
+        position = np.searchsorted(self.ids, node_id, sorter=self._id_order)
+        if position < len(self.ids) and self.ids[self._id_order[position]] == node_id:
+            return int(self._id_order[position])
+        return None
+
+    def get_node(self, node_id):
+        """
+        Get the node with ID *node_id*
+
+        Parameters
+        ----------
+        node_id: int
+            The ID of the node
+
+        Returns
+        -------
+        QuestionnaireNode:
+            The node
+
+        Raises
+        ------
+        KeyError:
+            In case the ID is not in the tree
+        """
+        position = self.get_position(node_id)
+        if position is None:
+            raise KeyError(node_id)
+        return QuestionnaireNode(self, position)
+
+    def find(self, key):
+        """
+        Find the topic with the StatLine key *key*
+
+        Parameters
+        ----------
+        key: str
+            The key of the topic, as stored in the Key column of the question_df
+
+        Returns
+        -------
+        QuestionnaireNode or None:
+            The node of the topic, or None in case the key is not found
+        """
+        if self._key_positions is None:
+            self._key_positions = {key: position for position, key in enumerate(self.keys)
+                                   if key != ""}
+        position = self._key_positions.get(key)
+        if position is None:
+            return None
+        return QuestionnaireNode(self, position)
+
+    def walk(self, node_id=None):
+        """
+        Iterate over the nodes in pre-order
+
+        Parameters
+        ----------
+        node_id: int, optional
+            Only iterate over the node with this ID and all its sub nodes. Default = None, which
+            means all the nodes of the tree
+
+        Yields
+        ------
+        QuestionnaireNode:
+            The nodes, where each node is followed by its sub nodes
+        """
+        if node_id is None:
+            start, stop = 0, len(self.ids)
+        else:
+            start = self.get_node(node_id).position
+            stop = self.subtree_stops[start]
+        for position in range(start, stop):
+            yield QuestionnaireNode(self, position)
+
+    def get_row_positions(self, node_id):
+        """
+        Get the positions of the rows of the question_df of a node and all its sub nodes
+
+        Parameters
+        ----------
+        node_id: int
+            The ID of the node
+
+        Returns
+        -------
+        np.ndarray:
+            The positions of the rows in the order of the question_df
+        """
+        position = self.get_node(node_id).position
+        return self._get_row_positions(position)
+
+    def _get_row_positions(self, position):
+        """ Get the sorted positions of the rows of the node at *position* """
+        return np.sort(self.row_order[self.row_starts[position]:self.row_stops[position]])
+
+    def subtree_frame(self, node_id):
+        """
+        Get the rows of the question_df of a node and all its sub nodes
+
+        Parameters
+        ----------
+        node_id: int
+            The ID of the node
+
+        Returns
+        -------
+        pd.DataFrame:
+            The rows of the question_df in their original order with the full index
+        """
+        if self.data_frame is None:
+            raise ValueError("The tree has no data frame. Set *data_frame* first")
+        return self.data_frame.take(self.get_row_positions(node_id))
+
+
 class StatLineTable(object):
     """
     
@@ -81,16 +806,18 @@ class StatLineTable(object):
     to_xls: bool, optional
         If True, store to Excel. Each table is stored to a seperate tab. Default = False
     to_pickle: bool, optional
-        If True, store the tables to pickle. In case a picke file exist, not even the downloaded
-        cache file are read, but the converted tables are directly obtained from the pickle files.
+        If True, store the tables to the cache in the format given by *cache_format*. In case a
+        cache file exist, the converted tables are directly obtained from the cache files.
         Default = True
     write_questions_only: bool, optional
         Only write the questions
     reset_pickles: bool, optional
         By default, the opendata is stored to cache first and then converted from the json format
         to a proper DataFrame. This DataFrame is stored to cache in case *to_pickle* is set to
-        True. In case a pickle file is found in the case, the DataFrame is directly obtained from
-        the case (speeding up processing/home/eelco/PycharmProjects/CBS/cbs_utils time). If you want to regenerate the picke file, set this
+        True. In case a valid pickle file is found in the cache, the DataFrame is directly obtained
+        from the cache (speeding up processing time). The pickle file is valid as long as the
+        json files, the package version and the options used to create it did not change, which
+        is tracked in a manifest file. If you want to regenerate the pickle file anyway, set this
         flag to true (or just empty the cache)
     section_key: str, optional
         Default column name to refer to a section. Default = "Section"
@@ -204,6 +931,65 @@ class StatLineTable(object):
 
     write_info_to_image_dir: bool, optional
         Write the information of the data structure to a file in the image directory. Default = True
+    chunk_size: int, optional
+        If given, the TypedDataSet.json file is not loaded as a whole, but streamed in chunks of
+        *chunk_size* bytes and fed record by record into the question_df. This keeps the memory
+        usage low for large tables. If the *ijson* module is installed it is used for parsing.
+        Default = None, which means the whole file is loaded with json.load
+    cache_format: {"pickle", "parquet", "feather"}, optional
+        Format of the cache files of the question, section and dimension data frames. The
+        "parquet" and "feather" formats require *pyarrow*. They are memory-mapped when read and
+        allow to read only a selection of the columns and rows of the question_df.
+        Default = "pickle"
+    columns: list, optional
+        Only read these columns of the question_df from the cache. The level columns L0..Ln are
+        always read. Default = None, which means that all columns are read
+    filters: list, optional
+        Only read the rows of the question_df from the cache which match the filters. The filters
+        are given in the same form as for *pyarrow.parquet.read_table*, e.g.
+        [("L0", "==", 15), ("Values", ">", 0)]. Only for the "parquet" and "feather" cache format.
+        Default = None
+    memory_map: bool, optional
+        Memory-map the parquet and feather cache files when reading them. Default = True
+    check_upstream: bool, optional
+        Check on opendata.cbs.nl if the table has been modified since it was downloaded to the
+        cache. If so, the table is downloaded again. Default = False
+    lazy: bool, optional
+        Do not read the table when creating the object. Each stage (reading the json files,
+        creating the data frames, creating the info data frames, ...) is carried out on the first
+        access of one of its attributes, such as *question_df* or *question_info_df*. Use
+        *materialize* to carry out the stages explicitly. The *make_the_plots* and
+        *describe_the_data* flags are ignored in the lazy mode. Default = False
+    source_dir: str, optional
+        Directory with the json files of the tables as dumped by *cbsodata.get_data*, with one
+        sub directory per table id. If given, the json files are copied from this directory
+        instead of downloaded from opendata.cbs.nl. Default = None
+    sql_if_exists: {"replace", "append"}, optional
+        How to write the tables to the sqlite database in case they exist already. With
+        *append*, the rows with the same dimension values (such as a period) are replaced and the
+        other rows are kept. Default = "replace"
+    add_level_titles: bool, optional
+        Add a column with the module/section title per level to the question_df, such as
+        *L0_title* and *L1_title*. This allows to filter on a section without splitting the
+        *Section* column. Empty columns are dropped. Default = False
+    incremental_plots: bool, optional
+        Only render the figures of which the data or the plot settings have changed since the
+        last run. A fingerprint of the inputs of each figure is stored in the plot manifest
+        *plot_manifest.json* in the image directory. Default = False
+    plot_data_batch: {None, "module", "table"}, optional
+        In case *store_plot_data_to_xls* is True, write the plot data of all the questions of a
+        module (*module*) or of the whole table (*table*) to one workbook with one sheet per
+        question, instead of one workbook per question. The batch workbooks are written by
+        *plot*. The figures rendered outside *plot*, such as with *make_the_plot*, get a workbook
+        per question. Default = None
+    compact_dtypes: bool, optional
+        Store the repeated strings of the question_df as categories and the values and integer
+        columns in the smallest dtype which holds them without loss. This reduces the memory of
+        the question_df and the size of the cache. Default = None, which means True for the
+        parquet and feather cache formats and False for pickle
+    dimension_workers: int, optional
+        Number of threads used to read the json files of the dimensions. Default = None, which
+        means one thread per dimension with a maximum of 8
 
     Attributes
     ----------
@@ -213,6 +999,11 @@ class StatLineTable(object):
         The names of the sections
     dimension_df: pd.DataFrame
         The names of the dimensions
+    question_tree: QuestionnaireTree
+        The tree of the modules, sections, questions and topics of the question_df
+    dimensions: OrderedDict
+        The *DimensionLookup* with the keys and titles of the values per dimension. Only filled
+        when the question_df is created from the json files
 
     Examples
     --------
@@ -256,6 +1047,21 @@ class StatLineTable(object):
 
     """
 
+    # the attributes which are created by the stages of the table. In the lazy mode, the stage is
+    # carried out on the first access of the attribute
+    data_properties = StageAttribute("raw")
+    table_infos = StageAttribute("raw")
+    question_df = StageAttribute("frames", invalidates=["question_tree",
+                                                       "memory_usage_before",
+                                                       "resolved_question_dfs",
+                                                       "question_blocks",
+                                                       "question_pivots"])
+    section_df = StageAttribute("frames")
+    dimension_df = StageAttribute("frames")
+    x_axis_key = StageAttribute("frames")
+    question_info_df = StageAttribute("info")
+    module_info_df = StageAttribute("info")
+
     def __init__(self, table_id,
                  reset: bool = False,
                  cache_dir_name: str = "cache",
@@ -297,6 +1103,20 @@ class StatLineTable(object):
                  describe_the_data: bool = False,
                  write_info_to_image_dir: bool = True,
                  rotate_latex_columns: bool = False,
+                 chunk_size: int = None,
+                 cache_format: str = "pickle",
+                 columns: list = None,
+                 filters: list = None,
+                 memory_map: bool = True,
+                 check_upstream: bool = False,
+                 lazy: bool = False,
+                 source_dir: str = None,
+                 sql_if_exists: str = "replace",
+                 add_level_titles: bool = False,
+                 incremental_plots: bool = False,
+                 plot_data_batch: str = None,
+                 compact_dtypes: bool = None,
+                 dimension_workers: int = None,
                  ):
         """
 
@@ -307,6 +1127,28 @@ class StatLineTable(object):
         self.max_levels = max_levels
         self.sort_choices = sort_choices
         self.rotate_latex_columns = rotate_latex_columns
+        self.chunk_size = chunk_size
+        self.add_level_titles = add_level_titles
+
+        if cache_format not in CACHE_FORMATS:
+            raise ValueError(f"cache_format must be one of {list(CACHE_FORMATS.keys())}. "
+                             f"Found {cache_format}")
+        if cache_format != "pickle" and pa is None:
+            raise ImportError(f"pyarrow is required for the {cache_format} cache format")
+        if cache_format == "pickle" and filters is not None:
+            raise ValueError("filters can only be used with the parquet or feather cache format")
+        self.cache_format = cache_format
+        if compact_dtypes is None:
+            compact_dtypes = cache_format != "pickle"
+        self.compact_dtypes = compact_dtypes
+        self.columns = columns
+        self.filters = filters
+        self.memory_map = memory_map
+        self.check_upstream = check_upstream
+        if source_dir is not None:
+            self.source_dir = Path(source_dir)
+        else:
+            self.source_dir = None
 
         self.image_dir = Path(image_dir_name)
         self.image_dir.mkdir(exist_ok=True)
@@ -353,13 +1195,19 @@ class StatLineTable(object):
         self.save_plot = save_plot
         self.store_plot_data_to_xls = store_plot_data_to_xls
         self.store_plot_data_to_tex = store_plot_data_to_tex
-
-        self.connection = None
+        self.incremental_plots = incremental_plots
+        if plot_data_batch not in PLOT_DATA_BATCHES:
+            raise ValueError(f"plot_data_batch must be one of {PLOT_DATA_BATCHES}. "
+                             f"Found {plot_data_batch}")
+        self.plot_data_batch = plot_data_batch
+        self.plot_manifest_file = self.image_dir / Path("plot_manifest.json")
 
         self.typed_data_set = None
+        self.typed_data_set_file = None
         self.table_infos = None
         self.data_properties = None
         self.dimensions = collections.OrderedDict()
+        self.dimension_workers = dimension_workers
 
         self.section_key = section_key
         self.title_key = title_key
@@ -377,62 +1225,172 @@ class StatLineTable(object):
         self.level_keys = [f"L{d}" for d in range(self.max_levels)]
         self.level_ids: collections.OrderedDict = None
 
+        # the tree of the questionnaire, which is built when the question_df is created or read
+        # from the cache, and reset each time a new question_df is assigned
+        self.question_tree: QuestionnaireTree = None
+        self.resolved_question_dfs: dict = None
+
+        # the memory usage per column of the question_df before it was compacted
+        self.memory_usage_before: pd.Series = None
+
+        # the blocks of rows forming a question, which are computed on the first plot
+        self.question_blocks: list = None
+
+        # the pivot tables of the questions as created by prepare_data_frame, and the positions of
+        # the selected columns per selection
+        self.question_pivots: dict = None
+        self.selection_positions: dict = None
+
         # these data frames will cary the structure of the questionnaire
         self.module_info_df: pd.DataFrame = None
         self.question_info_df: pd.DataFrame = None
 
         self.pickle_files = dict()
+        self.cache_files = dict()
         self.df_labels = ["question", "section", "dimensions"]
         for label in self.df_labels:
-            file_name = "_".join([self.table_id, label]) + ".pkl"
-            self.pickle_files[label] = self.cache_dir / Path(file_name)
+            file_base = "_".join([self.table_id, label])
+            self.pickle_files[label] = self.cache_dir / Path(file_base + ".pkl")
+            self.cache_files[label] = self.cache_dir / Path(file_base +
+                                                            CACHE_FORMATS[self.cache_format])
+        self.manifest_file = self.cache_dir / Path("_".join([self.table_id, "manifest"]) + ".json")
+        self.tree_file = self.cache_dir / Path("_".join([self.table_id, "tree"]) + ".npz")
 
-        updated_dfs = False
+        if legend_position is None:
+            self.legend_position = (1.05, 0)
+        else:
+            self.legend_position = legend_position
+
+        self.legend_title = legend_title
+
+        self.to_sql = to_sql
+        self.sql_if_exists = sql_if_exists
+        self.to_xls = to_xls
+        self.to_pickle = to_pickle
+        self.write_questions_only = write_questions_only
+        self.reset_pickles = reset_pickles
+        self.write_info_to_image_dir = write_info_to_image_dir
+
+        # the stages which have been carried out already
+        self.stages_done = set()
+
+        if not lazy:
+            self.materialize()
+
+            if make_the_plots:
+                self.plot()
+
+            if describe_the_data:
+                self.describe()
+
+    def materialize(self, stages=None):
+        """
+        Carry out the stages to read the table and create the data frames
+
+        Parameters
+        ----------
+        stages: list, optional
+            The stages to carry out. The stages which are required by these stages are carried out
+            first. Stages which have been done already are skipped. Possible stages are
+
+            * *raw*: read (and download if required) the json files of the table
+            * *frames*: create the question, section and dimension data frames from the cache or
+              from the json files, and write them to the cache
+            * *info*: create the question and module info data frames
+            * *info_files*: write the table, question and module information to the image dir
+            * *exports*: export the data frames to sqlite or Excel as set by *to_sql* and *to_xls*
+
+            Default = None, which means all stages. The *info_files* and *exports* stages are then
+            only carried out if *write_info_to_image_dir* or *to_sql*/*to_xls* are set
+        """
+        if stages is None:
+            stages = ["raw", "frames", "info"]
+            if self.write_info_to_image_dir:
+                stages.append("info_files")
+            if self.to_sql or self.to_xls:
+                stages.append("exports")
+        elif isinstance(stages, str):
+            stages = [stages]
+
+        for stage in stages:
+            if stage not in STATLINE_STAGES:
+                raise ValueError(f"stage must be one of {list(STATLINE_STAGES.keys())}. "
+                                 f"Found {stage}")
+            for required_stage in STATLINE_STAGES[stage] + [stage]:
+                if required_stage in self.stages_done:
+                    continue
+                logger.debug(f"Carrying out stage {required_stage}")
+                # mark the stage as done before it is carried out, such that accessing the
+                # attributes inside the stage does not trigger it again
+                self.stages_done.add(required_stage)
+                try:
+                    getattr(self, "_stage_" + required_stage)()
+                except Exception:
+                    self.stages_done.discard(required_stage)
+                    raise
+
+    def _stage_raw(self):
+        """ Read the json files of the table """
         self.read_table_data()
-        if self.pickle_files["question"].exists() and not (reset_pickles or self.reset):
-            self.pkl_data(mode="read")
+
+    def _stage_frames(self):
+        """ Create the question, section and dimension data frames """
+        updated_dfs = False
+        if not (self.reset_pickles or self.reset) and self.cache_is_valid():
+            self.cache_data(mode="read")
         else:
             self.initialize_dataframes()
             self.fill_question_list()
             self.fill_data()
             self.question_df.set_index(self.level_keys, inplace=True, drop=True)
+            if self.compact_dtypes:
+                self.compact_question_df()
             updated_dfs = True
 
-        if x_axis_key is None:
-            # no xlabel for the bar graph has been given. Take the first dimension
-            self.x_axis_key = self.dimension_df.loc[0, self.key_key]
-        else:
-            self.x_axis_key = x_axis_key
+        if updated_dfs and (self.columns is not None or self.filters is not None):
+            if self.to_pickle:
+                # the selection of the columns and rows is done while reading the cache
+                self.cache_data(mode="write")
+                self.cache_data(mode="read")
+            else:
+                logger.warning("The columns and filters selection is only applied when reading "
+                               "from the cache. Set to_pickle to True")
+        elif self.to_pickle and updated_dfs:
+            self.cache_data(mode="write")
 
-        if legend_position is None:
-            self.legend_position = (1.05, 0)
-        else:
-            self.legend_position = legend_position
+        if self.to_pickle and updated_dfs:
+            self.write_manifest()
 
-        self.legend_title = legend_title
+        if self.x_axis_key is None:
+            # no xlabel for the bar graph has been given. Take the first dimension
+            self.x_axis_key = self.dimension_df.loc[0, self.key_key]
 
-        if to_sql:
-            self.write_sql_data(write_questions_only=write_questions_only)
-        if to_xls:
-            self.write_xls_data(write_questions_only=write_questions_only)
-        if to_pickle and updated_dfs:
-            self.pkl_data(mode="write")
+        self.get_question_tree()
 
+    def _stage_info(self):
+        """ Create the info data frames """
         self.make_info_dataframes()
-        if write_info_to_image_dir:
-            self.write_info()
 
-        if make_the_plots:
-            self.plot()
+    def _stage_info_files(self):
+        """ Write the info files to the image directory """
+        self.write_info()
 
-        if describe_the_data:
-            self.describe()
+    def _stage_exports(self):
+        """ Export the data frames to sqlite and/or Excel """
+        if self.to_sql:
+            self.write_sql_data(write_questions_only=self.write_questions_only,
+                                if_exists=self.sql_if_exists)
+        if self.to_xls:
+            self.write_xls_data(write_questions_only=self.write_questions_only)
 
     def make_info_dataframes(self):
         """
         Make info data frames by taking the proper selections
         """
-        col_sel = [self.key_key, self.title_key, self.units_key]
+        # in case only a selection of the columns was read from the cache, only use the available
+        # columns
+        col_sel = [col for col in (self.key_key, self.title_key, self.units_key)
+                   if col in self.question_df.columns]
         self.question_info_df = self.question_df[col_sel].drop_duplicates()
 
         col_sel = [self.parent_id_key, self.title_key]
@@ -498,47 +1456,192 @@ class StatLineTable(object):
                 else:
                     raise AssertionError("label must be question, section, or dimension")
 
-    def write_xls_data(self, write_questions_only=True):
-
-        """
-        Write all the data to excel. Each table is written to a seperate sheet
+    def cache_data(self, mode="read"):
         """
-        xls = self.cache_dir / Path(self.table_id + ".xlsx")
-        logger.info(f"Writing to excel database {xls}")
-        with pd.ExcelWriter(xls) as stream:
-            self.question_df.to_excel(stream, sheet_name="Questions", na_rep='NA')
-            if not write_questions_only:
-                self.section_df.to_excel(stream, sheet_name="Sections", na_rep='NA')
-                self.dimension_df.to_excel(stream, sheet_name="Dimensions", na_rep='NA')
+        Read or write all the data from or to the cache in the format given by *cache_format*
 
-    def write_sql_data(self, write_questions_only=True):
+        Parameters
+        ----------
+        mode: {"read", "write")
+            Option to control reading or writing
 
+        Notes
+        -----
+        * For the pickle format *pkl_data* is used, otherwise *arrow_data*
+        * The selection given by *columns* and *filters* is only applied to the question_df
+        * The questionnaire tree is stored next to the data frames in a npz file
+        """
+
+        assert mode in ("read", "write")
+
+        if self.cache_format == "pickle":
+            self.pkl_data(mode=mode)
+            if mode == "read" and self.columns is not None:
+                columns = [col for col in self.columns if col in self.question_df.columns]
+                self.question_df = self.question_df[columns]
+        else:
+            self.arrow_data(mode=mode)
+
+        if mode == "write":
+            logger.info(f"Writing questionnaire tree {self.tree_file}")
+            self.get_question_tree().save(self.tree_file)
+        elif self.filters is None and self.tree_file.exists():
+            # with filters, other rows are selected than the ones of the stored tree, so then the
+            # tree is built again from the question_df
+            logger.info(f"Reading questionnaire tree {self.tree_file}")
+            question_tree = QuestionnaireTree.load(self.tree_file, data_frame=self.question_df)
+            if question_tree.n_rows == len(self.question_df):
+                self.question_tree = question_tree
+
+    def arrow_data(self, mode="read"):
+        """
+        Read or write all the data from or to the parquet or feather cache
+
+        Parameters
+        ----------
+        mode: {"read", "write")
+            Option to control reading or writing
+        """
+
+        attributes = dict(question="question_df", section="section_df",
+                          dimensions="dimension_df")
+
+        for label, cache_file in self.cache_files.items():
+            if mode == "read":
+                logger.info(f"Reading from {self.cache_format} database {cache_file}")
+                if label == "question":
+                    data_frame = read_arrow_data_frame(cache_file, self.cache_format,
+                                                       columns=self.columns,
+                                                       filters=self.filters,
+                                                       memory_map=self.memory_map)
+                else:
+                    data_frame = read_arrow_data_frame(cache_file, self.cache_format,
+                                                       memory_map=self.memory_map)
+                setattr(self, attributes[label], data_frame)
+            else:
+                logger.info(f"Writing to {self.cache_format} database {cache_file}")
+                write_arrow_data_frame(getattr(self, attributes[label]), cache_file,
+                                       self.cache_format)
+
+    def write_xls_data(self, write_questions_only=True):
+
+        """
+        Write all the data to excel. Each table is written to a seperate sheet
+        """
+        xls = self.cache_dir / Path(self.table_id + ".xlsx")
+        logger.info(f"Writing to excel database {xls}")
+        with pd.ExcelWriter(xls) as stream:
+            self.question_df.to_excel(stream, sheet_name="Questions", na_rep='NA')
+            if not write_questions_only:
+                self.section_df.to_excel(stream, sheet_name="Sections", na_rep='NA')
+                self.dimension_df.to_excel(stream, sheet_name="Dimensions", na_rep='NA')
+
+    def write_sql_data(self, write_questions_only=True, if_exists="replace", bulk=True):
+
+        """
+        Write all the data to the sql lite database. Each table is written in the same database
+
+        Parameters
+        ----------
+        write_questions_only: bool, optional
+            Only write the question data frame. Default = True
+        if_exists: {"replace", "append"}, optional
+            Replace the tables in case they exist already, or append the rows. In the latter case,
+            the rows with the same dimension values (e.g. the same period) are replaced. A table
+            without dimension key columns is always replaced, as the rows can not be matched.
+            Only used for the bulk export. Default = "replace"
+        bulk: bool, optional
+            Insert all the rows with *executemany* in a single transaction, using the WAL journal
+            mode, and create indices on the level, key and dimension key columns. If False, the
+            data frames are written with *DataFrame.to_sql*. Default = True
         """
-        Write all the data to the sql lite database. Each table is written in the same database
-        """
         # write the result
         sqlite_db = self.cache_dir / "sqlite.db"
-        self.connection = sqlite3.connect(sqlite_db)
         logger.info(f"Writing to sqlite database {sqlite_db}")
-        self.question_df.to_sql("_".join([self.table_id, "question"]), self.connection,
-                                if_exists="replace")
+
+        data_frames = collections.OrderedDict()
+        data_frames["question"] = self.question_df
         if not write_questions_only:
             # also write the help dataframes
-            self.section_df.to_sql("_".join([self.table_id, "section"]), self.connection,
-                                   if_exists="replace")
-            self.dimension_df.to_sql("_".join([self.table_id, "dimension"]), self.connection,
-                                     if_exists="replace")
+            data_frames["section"] = self.section_df
+            data_frames["dimension"] = self.dimension_df
+
+        if not bulk:
+            with contextlib.closing(sqlite3.connect(sqlite_db)) as connection:
+                for label, data_frame in data_frames.items():
+                    data_frame.to_sql("_".join([self.table_id, label]), connection,
+                                      if_exists="replace")
+            return
+
+        # the dimension key columns of the question data frame, such as Perioden_Key
+        dimension_keys = [key + "_" + self.key_key for key in self.dimension_df[self.key_key]]
+        dimension_keys = [key for key in dimension_keys if key in self.question_df.columns]
+        if if_exists == "append" and not dimension_keys:
+            logger.warning(f"Can not append to the question table of {self.table_id} without "
+                           f"dimension key columns. Replacing the table instead")
+            if_exists = "replace"
+
+        question_level_keys = [key for key in self.question_df.index.names if key is not None]
+        index_columns = [question_level_keys, [self.key_key]] + [[key] for key in dimension_keys]
+
+        with contextlib.closing(sqlite3.connect(sqlite_db, isolation_level=None)) as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            with sql_transaction(connection):
+                for label, data_frame in data_frames.items():
+                    table_name = "_".join([self.table_id, label])
+                    if label == "question":
+                        write_sql_table(connection, table_name, data_frame, if_exists=if_exists,
+                                        index_columns=index_columns,
+                                        replace_columns=dimension_keys)
+                    else:
+                        index_names = [name for name in data_frame.index.names if name is not None]
+                        write_sql_table(connection, table_name, data_frame, if_exists="replace",
+                                        index_columns=[index_names or ["index"]])
 
     def read_table_data(self):
         """
         Read the open data tables
+
+        Notes
+        -----
+        * The table is downloaded in case one of the json files is missing, in case *reset* is
+          True, or in case *check_upstream* is True and the table was modified on opendata
+        * The TypedDataSet is not read here, but only when it is needed by *fill_data*
         """
 
         type_data_set_file = self.output_directory / Path("TypedDataSet.json")
         table_infos_file = self.output_directory / Path("TableInfos.json")
         data_properties_file = self.output_directory / Path("DataProperties.json")
 
-        if not data_properties_file.exists() or self.reset:
+        json_files = (type_data_set_file, table_infos_file, data_properties_file)
+        download = self.reset or not all([json_file.exists() for json_file in json_files])
+
+        if not download and self.check_upstream:
+            with open(table_infos_file, "r") as stream:
+                modified = json.load(stream)[0].get("Modified")
+            if self.source_dir is not None:
+                source_table_infos_file = self.source_dir / Path(self.table_id) / Path(
+                    "TableInfos.json")
+                with open(source_table_infos_file, "r") as stream:
+                    upstream_modified = json.load(stream)[0].get("Modified")
+            else:
+                import cbsodata
+                upstream_modified = cbsodata.get_info(self.table_id).get("Modified")
+            if upstream_modified != modified:
+                logger.info(f"Table {self.table_id} was modified at {upstream_modified}")
+                download = True
+
+        if download and self.source_dir is not None:
+            source_directory = self.source_dir / Path(self.table_id)
+            logger.info(f"Copying table {self.table_id} from {source_directory} "
+                        f"to {self.output_directory}")
+            source_files = list(source_directory.glob("*.json"))
+            if not source_files:
+                raise FileNotFoundError(f"No json files found in {source_directory}")
+            for source_file in source_files:
+                shutil.copy2(source_file, self.output_directory / source_file.name)
+        elif download:
             logger.info(f"Importing table {self.table_id} and store to {self.output_directory}")
             # We cannot import the cbsodata module when using the debugger in PyCharm, therefore
             # only call import here
@@ -554,16 +1657,154 @@ class StatLineTable(object):
         with open(data_properties_file, "r") as stream:
             self.data_properties = json.load(stream)
 
-        logger.info(f"Reading json {type_data_set_file}")
-        with open(type_data_set_file, "r") as stream:
-            self.typed_data_set = json.load(stream)
+        self.typed_data_set_file = type_data_set_file
+        self.typed_data_set = None
+
         logger.info(f"Reading json {table_infos_file}")
         with open(table_infos_file, "r") as stream:
             self.table_infos = json.load(stream)
 
+    def get_manifest(self, with_hashes=False):
+        """
+        Get the manifest describing the inputs of the cached data frames
+
+        Parameters
+        ----------
+        with_hashes: bool, optional
+            Also calculate the sha256 hash of all the json input files. Default = False
+
+        Returns
+        -------
+        dict:
+            The manifest with the package version, the options which affect the data frames, the
+            modification time stamp of the table and the size, mtime and hash of the input files
+        """
+        options = dict(max_levels=self.max_levels,
+                       add_level_titles=self.add_level_titles,
+                       compact_dtypes=self.compact_dtypes,
+                       section_key=self.section_key,
+                       title_key=self.title_key,
+                       value_key=self.value_key,
+                       units_key=self.units_key,
+                       key_key=self.key_key,
+                       datatype_key=self.datatype_key,
+                       id_key=self.id_key,
+                       parent_id_key=self.parent_id_key)
+
+        inputs = dict()
+        for json_file in sorted(self.output_directory.glob("*.json")):
+            stat = json_file.stat()
+            inputs[json_file.name] = dict(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            if with_hashes:
+                inputs[json_file.name]["sha256"] = get_file_hash(json_file)
+
+        manifest = dict(table_id=self.table_id,
+                        version=__version__,
+                        cache_format=self.cache_format,
+                        modified=self.table_infos[0].get("Modified"),
+                        options=options,
+                        inputs=inputs)
+
+        return manifest
+
+    def write_manifest(self):
+        """
+        Write the manifest of the inputs of the cached data frames to the cache directory
+        """
+        logger.info(f"Writing manifest {self.manifest_file}")
+        with open(self.manifest_file, "w") as stream:
+            json.dump(self.get_manifest(with_hashes=True), stream, indent=2)
+
+    def cache_is_valid(self):
+        """
+        Check if the cached data frames are still valid
+
+        Returns
+        -------
+        bool:
+            True in case the cache files exist and the manifest matches the current inputs
+
+        Notes
+        -----
+        * The input files are first compared on size and modification time, which is cheap. Only
+          in case these are different, the hash of the file is calculated to see if the content
+          has changed. If the content is the same, the new size and modification time are
+          written to the manifest, such that the next check does not need the hash again
+        """
+        if not all([cache_file.exists() for cache_file in self.cache_files.values()]):
+            logger.info(f"No {self.cache_format} cache found for {self.table_id}")
+            return False
+        if not self.manifest_file.exists():
+            logger.info(f"No manifest found for {self.table_id}")
+            return False
+
+        with open(self.manifest_file, "r") as stream:
+            manifest = json.load(stream)
+
+        current = self.get_manifest()
+        for key in ("table_id", "version", "cache_format", "modified", "options"):
+            if manifest.get(key) != current[key]:
+                logger.info(f"Cache of {self.table_id} is outdated: {key} has changed")
+                return False
+
+        if set(manifest["inputs"].keys()) != set(current["inputs"].keys()):
+            logger.info(f"Cache of {self.table_id} is outdated: the input files have changed")
+            return False
+
+        touched = False
+        for file_name, file_info in current["inputs"].items():
+            cached_info = manifest["inputs"][file_name]
+            if (file_info["size"] == cached_info["size"] and
+                    file_info["mtime_ns"] == cached_info["mtime_ns"]):
+                continue
+            file_hash = get_file_hash(self.output_directory / Path(file_name))
+            if file_hash != cached_info.get("sha256"):
+                logger.info(f"Cache of {self.table_id} is outdated: {file_name} has changed")
+                return False
+            # the file has been touched or written again with the same content
+            cached_info.update(size=file_info["size"], mtime_ns=file_info["mtime_ns"])
+            touched = True
+
+        if touched:
+            logger.debug(f"Updating the file times in manifest {self.manifest_file}")
+            try:
+                with open(self.manifest_file, "w") as stream:
+                    json.dump(manifest, stream, indent=2)
+            except OSError as err:
+                logger.warning(f"Could not update manifest {self.manifest_file}: {err}")
+
+        return True
+
+    def iter_typed_data_set(self):
+        """
+        Iterate over the records of the TypedDataSet
+
+        Yields
+        ------
+        dict:
+            One record of the TypedDataSet, belonging to one combination of dimension values
+
+        Notes
+        -----
+        * In case no *chunk_size* is given, the TypedDataSet is loaded as a whole and stored to the
+          *typed_data_set* attribute. Otherwise the records are streamed from the json file in
+          chunks of *chunk_size* bytes
+        """
+        if self.typed_data_set is None and self.chunk_size is None:
+            logger.info(f"Reading json {self.typed_data_set_file}")
+            with open(self.typed_data_set_file, "r") as stream:
+                self.typed_data_set = json.load(stream)
+
+        if self.typed_data_set is not None:
+            yield from self.typed_data_set
+        else:
+            logger.info(f"Streaming json {self.typed_data_set_file} in chunks of "
+                        f"{self.chunk_size} bytes")
+            yield from iter_json_array(self.typed_data_set_file, chunk_size=self.chunk_size)
+
     def initialize_dataframes(self):
         """
-        Create empty data frame for the questions, sections and dimensions
+        Initialise the level ids and clear the data frame for the questions, sections and dimensions
 
         Notes
         -----
@@ -572,6 +1813,7 @@ class StatLineTable(object):
           as GroupTopics.
         * In this script, the current level of the topics are kept track of, such that we can group
           items that belong to the same level
+        * The data frames themselves are created in one go by *fill_question_list*
         """
 
         # level ids is going to contain the level id of the last seen level L0 (module),
@@ -582,35 +1824,9 @@ class StatLineTable(object):
             # initialise all levels to None
             self.level_ids[label] = None
 
-        # the questions dataframe will contain a column for each variable in the Topics + the label
-        # for the levels + one extra column called 'Section' in which we store the multiline string
-        # giving the Module/Section/Subsection/Paragraph
-        question_columns = level_labels + ["Section"]
-        section_columns = list()
-        dimension_columns = list()
-        n_dim = 0
-        n_sec = 0
-        n_quest = 0
-
-        for indicator in self.data_properties:
-            if indicator["Type"] == "TopicGroup":
-                n_sec += 1
-                keys = [_ for _ in list(indicator.keys()) if _ not in section_columns]
-                section_columns.extend(keys)
-            elif indicator["Type"] == "Dimension":
-                n_dim += 1
-                keys = [_ for _ in list(indicator.keys()) if _ not in dimension_columns]
-                dimension_columns.extend(keys)
-            else:
-                n_quest += 1
-                keys = [_ for _ in list(indicator.keys()) if _ not in question_columns]
-                question_columns.extend(keys)
-
-        # create all the data frames. The question_df contains the questions, the section_df
-        # all the sections, and the dimensions all the dimensions
-        self.question_df = pd.DataFrame(index=range(1, n_quest), columns=question_columns)
-        self.section_df = pd.DataFrame(index=range(1, n_sec), columns=section_columns)
-        self.dimension_df = pd.DataFrame(index=range(1, n_dim), columns=dimension_columns)
+        self.question_df = None
+        self.section_df = None
+        self.dimension_df = None
 
     def fill_question_list(self):
         """
@@ -622,6 +1838,24 @@ class StatLineTable(object):
           This method keeps track of the level of the current question
         """
 
+        # the questions dataframe will contain a column for each variable in the Topics + the label
+        # for the levels + one extra column called 'Section' in which we store the multiline string
+        # giving the Module/Section/Subsection/Paragraph
+        level_labels = list(self.level_ids.keys())
+        question_columns = level_labels + ["Section"]
+        section_columns = list()
+        dimension_columns = list()
+
+        # the records of each block are collected per row label first. In case a label is found
+        # twice, the record is updated with the new values. The data frames are created at the end
+        # with a single call, which is much faster than filling the data frames cell by cell
+        question_records = collections.OrderedDict()
+        section_records = collections.OrderedDict()
+        dimension_records = collections.OrderedDict()
+        n_dim = 0
+        n_sec = 0
+        n_quest = 0
+
         # loop over all the data properties and store the questions, topic and dimensions
         for indicator in self.data_properties:
             data_props = DataProperties(indicator_dict=indicator)
@@ -652,30 +1886,36 @@ class StatLineTable(object):
                         self.level_ids[self.level_keys[this_level]] = None
 
             if data_props.type == "Dimension":
-                # the current block is a dimension. Store it to the dimensions_df
+                # the current block is a dimension. Store it to the dimension records
                 logger.debug(f"Reading dimension properties {data_props.key}")
-                for key, value in indicator.items():
-                    self.dimension_df.loc[data_props.id, key] = value
+                n_dim += 1
+                add_new_keys(dimension_columns, indicator)
+                dimension_records.setdefault(data_props.id, dict()).update(indicator)
             elif data_props.type == "TopicGroup":
                 # the current block is a TopicGroup (such as a Module or a Section. Store it to
-                # the sections_df
+                # the section records
                 logger.debug(f"Reading topic group properties {data_props.key}")
-                for key, value in indicator.items():
-                    self.section_df.loc[data_props.id, key] = value
+                n_sec += 1
+                add_new_keys(section_columns, indicator)
+                section_records.setdefault(data_props.id, dict()).update(indicator)
             else:
                 # The current block mush be a question because it is not a dimension and not a
                 # section
+                n_quest += 1
+                add_new_keys(question_columns, indicator)
 
-                # get the index in the question_df from the position property of this block
+                # get the index in the question_df from the position property of this block and
+                # copy all the values from the current dict plus the current levels to the record
                 index = int(data_props.position)
+                record = question_records.setdefault(index, dict())
+                record.update(indicator)
+                record.update(self.level_ids)
 
-                # copy all the values from the current dict  to the data frame
-                for key, value in indicator.items():
-                    self.question_df.loc[index, key] = value
-
-                section_title = None
-                for level, level_id in self.level_ids.items():
-                    self.question_df.loc[index, level] = level_id
+        # create all the data frames. The question_df contains the questions, the section_df
+        # all the sections, and the dimensions all the dimensions
+        self.question_df = records_to_data_frame(question_records, question_columns, n_quest)
+        self.section_df = records_to_data_frame(section_records, section_columns, n_sec)
+        self.dimension_df = records_to_data_frame(dimension_records, dimension_columns, n_dim)
 
         # we have looped over all the block. Clean up the dataframes
 
@@ -687,15 +1927,16 @@ class StatLineTable(object):
 
         # the dimensions dataframe contains the variables of the axis (such as 'Bedrijven'). Create
         # a column in the question_df dataframe per dimension
+        dimension_files = collections.OrderedDict()
         for dimension_key in self.dimension_df[self.key_key]:
             self.question_df.loc[:, dimension_key] = None
             # the dimension name is retrieved here. Each dimension has its own json datafile which
-            # contains more properties about this dimension, such as the Description. Read the
-            # json data file here, such as e.g. 'Bedrijven.json' and store in the dimensions dict
-            dimension_file = self.output_directory / Path(f"{dimension_key}.json")
-            with open(dimension_file, "r") as stream:
-                self.dimensions[dimension_key] = pd.DataFrame(
-                    json.load(stream)).set_index(self.key_key)
+            # contains the keys and titles of this dimension, such as e.g. 'Bedrijven.json'
+            dimension_files[dimension_key] = self.output_directory / Path(f"{dimension_key}.json")
+
+        # read all the dimension files at once and store the lookups in the dimensions dict
+        self.dimensions = read_dimension_lookups(dimension_files, workers=self.dimension_workers,
+                                                 key_key=self.key_key, title_key=self.title_key)
 
         # the section df contains all the TopicGroups which we have encountered, such that we can
         # keep track of all the module and section titles. Clean the data frame here and set the
@@ -707,28 +1948,51 @@ class StatLineTable(object):
 
         # Based on the the level id which we have stored in the L0, L1, L2, L3 column we are going
         # to build a complete description of the module/section/subsection leading to the current
-        # question
+        # question. The titles are looked up for all the rows of one level column at once
         level_labels = list(self.level_ids.keys())
-        for index, row in self.question_df.iterrows():
-            level_ids = row[level_labels]
-            section_title = None
-            for lev_id in level_ids.values:
-                # loop over all the L0, L1, L2, L3 values stored in this row. In case that the
-                # level is equal to the row ID, it means we are dealing with the current question
-                # so we can stop
-                if lev_id == row["ID"]:
-                    break
-                # If we passed this, it means we got a level L0, L1 which is referring to a module/
-                # section title. Look up the title belong to the stored ID from the section df
-                # and append it
-                if section_title is None:
-                    section_title = self.section_df.loc[lev_id, self.title_key]
-                else:
-                    section_title += "\n" + self.section_df.loc[lev_id, self.title_key]
-
-            # we have build a whole module/section/subsection title for this question. Store it
-            # to the Section column
-            self.question_df.loc[index, self.section_key] = section_title
+        title_map = self.section_df[self.title_key].to_dict()
+        question_ids = self.question_df["ID"].values
+        n_rows = len(self.question_df)
+        reached_question = np.zeros(n_rows, dtype=bool)
+        section_titles = np.full(n_rows, None, dtype=object)
+        level_title_columns = collections.OrderedDict()
+        unknown_ids = set()
+        for level_label in level_labels:
+            level_ids = self.question_df[level_label].values
+            # in case that the level is equal to the row ID, it means we are dealing with the
+            # current question, so this level and the next levels do not refer to a section
+            reached_question |= level_ids == question_ids
+            level_id_series = pd.Series(level_ids, dtype=object)
+            is_unknown = ~(reached_question | level_id_series.isna().values |
+                           level_id_series.isin(self.section_df.index).values)
+            unknown_ids.update(level_ids[is_unknown])
+            level_titles = level_id_series.map(title_map).values
+            has_title = ~(reached_question | pd.isna(level_titles))
+            level_titles = np.where(has_title, level_titles, None)
+            level_title_columns["_".join([level_label, "title"])] = level_titles
+
+            # append the title of this level to the titles of the previous levels
+            has_section = pd.notna(section_titles)
+            append_title = has_title & has_section
+            section_titles[append_title] = section_titles[append_title] + "\n" + \
+                level_titles[append_title]
+            first_title = has_title & ~has_section
+            section_titles[first_title] = level_titles[first_title]
+
+        if unknown_ids:
+            logger.warning(f"Could not find the section titles of level ids "
+                           f"{sorted(unknown_ids)}. These levels are skipped in the "
+                           f"{self.section_key} column")
+
+        # we have build a whole module/section/subsection title for all questions. Store it
+        # to the Section column
+        self.question_df[self.section_key] = section_titles
+
+        if self.add_level_titles:
+            # store the title of each level in a separate column after the Section column
+            location = self.question_df.columns.get_loc(self.section_key)
+            for cnt, (column, level_titles) in enumerate(level_title_columns.items()):
+                self.question_df.insert(location + cnt + 1, column, level_titles)
 
         # finally, we can drop any empty column in case we have any to make it cleaning
         self.question_df.dropna(axis=1, inplace=True, how="all")
@@ -743,40 +2007,118 @@ class StatLineTable(object):
         Notes
         -----
         * We must have a questions_df filled by 'fill_question_list' already. Now
-        * We loop over all the dimensions and store a new data frame for each dimension value.
+        * Each record in the TypedDataSet belongs to one combination of dimension values, such as
+          'Bedrijven van 10 en groter', and contains one value per question. The values of all
+          records are collected in one long array. The question_df is then repeated once for each
+          record with a single *take*, and the dimension titles are looked up for all records in
+          one go, such that no copy of the question_df is made per record.
         """
 
-        df_list = list()
-        for typed_data_set in self.typed_data_set:
+        n_questions = len(self.question_df.index)
+
+        # the dimension keys in the order in which they appear in the records
+        dimension_keys = None
+        dimension_values = collections.OrderedDict()
+        values = list()
+        n_records = 0
+        for typed_data_set in self.iter_typed_data_set():
+
+            if dimension_keys is None:
+                dimension_keys = [key for key in typed_data_set.keys() if key in self.dimensions]
+                for key in dimension_keys:
+                    dimension_values[key] = list()
 
             # loop over all the variables of the current block (belonging to one dimension value,
-            # such as 'Bedrijven van 10 en groter'
-            values = list()
+            # such as 'Bedrijven van 10 en groter'. The first value is always an ID, the dimension
+            # values are stored per dimension, and the rest of the values belong to the questions
+            record_values = list()
             for key, data in typed_data_set.items():
                 if key == "ID":
-                    # the first value is always an ID, Make a copy of the question dataframe to
-                    # a new data frame which we can fill with values for this dimension
-                    logger.debug(f"Collecting data of {data}")
-                    df = self.question_df.copy()
-                elif key in list(self.dimensions.keys()):
-                    # the next rows contain dimension properties. Get the values and store those
-                    # in the dimension column of are question dataframe. Store both the Title
-                    # and the short key
-                    df.loc[:, key] = self.dimensions[key].loc[data, self.title_key]
-                    df.loc[:, key + "_" + self.key_key] = data
+                    continue
+                elif key in dimension_values:
+                    dimension_values[key].append(data)
                 else:
-                    # the rest of the rows in this block are the values belonging to the questions
-                    # store them in a list
-                    values.append(data)
+                    record_values.append(data)
 
-            # now copy the whole list of values to our question data frame and add them to a list
-            df.loc[:, self.value_key] = values
-            df_list.append(df)
+            if len(record_values) != n_questions:
+                raise ValueError(f"Record {typed_data_set.get('ID')} has {len(record_values)} "
+                                 f"values, but {n_questions} questions are defined")
+            values.extend(record_values)
+            n_records += 1
 
-        # we have create a dataframe for each dimension. Now append all the data frames to one
-        # big one
+        # repeat the question data frame for each record. This gives the same frame as a
+        # concatenation of one copy per record
         logger.info("Merging all the dataframes")
-        self.question_df = pd.concat(df_list, axis=0)
+        question_df = self.question_df.take(np.tile(np.arange(n_questions), n_records))
+
+        # store both the Title and the short key of the dimension values
+        for key, data in dimension_values.items():
+            dimension_titles = self.dimensions[key].get_titles(data)
+            question_df[key] = np.repeat(dimension_titles, n_questions)
+            question_df[key + "_" + self.key_key] = np.repeat(np.array(data, dtype=object),
+                                                              n_questions)
+
+        question_df[self.value_key] = values
+
+        self.question_df = question_df
+
+    def compact_question_df(self):
+        """
+        Reduce the memory of the question_df by using smaller dtypes
+
+        Notes
+        -----
+        * See *compact_data_frame*. The values are converted according to the *datatype_key*
+          column
+        * The memory usage before the compaction is stored in *memory_usage_before*, which is
+          used by *memory_report*
+        """
+        memory_usage_before = self.question_df.memory_usage(deep=True)
+        self.question_df = compact_data_frame(self.question_df, value_key=self.value_key,
+                                              datatype_key=self.datatype_key)
+        self.memory_usage_before = memory_usage_before
+
+    def memory_report(self):
+        """
+        Report the memory usage per column of the question_df before and after the compaction
+
+        Returns
+        -------
+        pd.DataFrame:
+            The bytes per column before and after the compaction and their ratio, with the index
+            on the first row and the total on the last row
+
+        Notes
+        -----
+        * In case the question_df was read from the cache, the memory usage before the compaction
+          is not known. It is then estimated by converting the categories to objects and the
+          numbers to 64 bit
+        """
+        memory_usage_after = self.question_df.memory_usage(deep=True)
+        if self.memory_usage_before is not None:
+            memory_usage_before = self.memory_usage_before
+        else:
+            expanded_df = self.question_df.copy(deep=False)
+            for column_name, column in expanded_df.items():
+                if isinstance(column.dtype, pd.CategoricalDtype):
+                    expanded_df[column_name] = column.astype(object)
+                elif column.dtype.kind == "f":
+                    expanded_df[column_name] = column.astype(np.float64)
+                elif column.dtype.kind in "iu":
+                    expanded_df[column_name] = column.astype(np.int64)
+            memory_usage_before = expanded_df.memory_usage(deep=True)
+
+        report = pd.DataFrame(dict(before=memory_usage_before, after=memory_usage_after))
+        report.loc["Total"] = report.sum()
+        report["ratio"] = report["before"] / report["after"]
+
+        if tabulate is not None:
+            logger.info("Memory usage of the question_df in bytes\n{}".format(
+                tabulate(report, headers="keys", tablefmt="psql", floatfmt=".1f")))
+        else:
+            logger.info("Memory usage of the question_df in bytes\n{}".format(report))
+
+        return report
 
     def describe(self):
         """
@@ -792,18 +2134,15 @@ class StatLineTable(object):
         unique_x_values = self.question_df[self.x_axis_key].unique()
         logger.info("Unique x-labels\n{}".format(unique_x_values))
 
-        for module_id, module_df in self.question_df.groupby(level=0):
-            section_title = module_df[self.section_key].values[0]
-            logger.info(f"module {module_id}: {section_title}")
+        for module in self.get_question_tree().modules:
+            logger.info(f"module {module.id}: {module.title}")
 
-            reported = list()
-            for level_id, level_df in module_df.groupby(level=1):
-
-                if level_id not in reported:
-                    # report the questions in this module
-                    logger.debug("Available questions in {}".format(level_id))
-                    logger.debug("\n{}".format(level_df[self.key_key].drop_duplicates()))
-                    reported.append(level_id)
+            for child in module.children:
+                # report the questions in this module
+                logger.debug("Available questions in {}".format(child.id))
+                logger.debug("\n{}".format("\n".join([node.key for node in
+                                                      self.question_tree.walk(child.id)
+                                                      if node.is_leaf])))
 
     def show_question_table(self, max_width=None):
         """ Make a nice print of all questions """
@@ -843,7 +2182,30 @@ class StatLineTable(object):
         else:
             logger.info("The available index are stored after the first plot")
 
-    def get_question_df(self, question_id: int):
+    def get_question_tree(self):
+        """
+        Get the tree of the modules, sections, questions and topics of the question_df
+
+        Returns
+        -------
+        QuestionnaireTree:
+            The tree of the question_df
+
+        Notes
+        -----
+        * The tree is built only once and reset when a new question_df is assigned. In case the
+          index of the question_df is modified in place, the question_tree must be reset to None
+        """
+        if self.question_tree is None:
+            self.question_tree = QuestionnaireTree.from_data_frame(self.question_df,
+                                                                   self.section_df,
+                                                                   key_key=self.key_key,
+                                                                   title_key=self.title_key)
+        if self.resolved_question_dfs is None:
+            self.resolved_question_dfs = dict()
+        return self.question_tree
+
+    def get_question_df(self, question_id: int, copy: bool = False):
         """
         Get the question belonging to the id *question_id*
 
@@ -851,6 +2213,9 @@ class StatLineTable(object):
         ----------
         question_id: int
             Id of the question you want to get
+        copy: bool, optional
+            Return a copy of the stored data frames, which can be modified without changing the
+            result of later calls. Default = False
 
         Returns
         -------
@@ -860,69 +2225,365 @@ class StatLineTable(object):
         Notes
         -----
         * The question id is not in a fixed column as it depends on the depth of the current level.
-          Therefore, the levels are scanned until we got the question
+          Therefore, the rows of the question are looked up in the *question_tree* and the
+          section levels are removed from the index
+        * The result is stored, so the next call with the same id does not need to look up the
+          rows again. Without *copy*, the stored data frames are returned and should not be
+          modified
 
         """
-        df_list = None
-        for module_id, module_df in self.question_df.groupby(level=0):
-            for level_id, level_df in module_df.groupby(level=1):
-                if level_id != question_id:
-                    continue
-                sub_level_df = self._remove_all_section_levels(level_df)
-                is_question = self._has_equal_number_of_nans(level_id, sub_level_df=sub_level_df)
-                df_list = list()
-                if not is_question:
-                    # the block we have is not a question, because the is an unequal amount of nans
-                    # in the index. Loop over the blocks and call this function again with the
-                    # subsubblocks
-                    logger.debug(f"looping over all levels  for {level_id}")
-                    try:
-                        for id, df in sub_level_df.groupby(level=1):
-                            logger.debug(f"Recursive call for {level_id}: {id}")
-                            df_list.append(self.get_question_df(id, df))
-                    except ValueError:
-                        logger.debug(f"Failed getting next level for {level_id}: {id}")
-                else:
-                    df_list.append(sub_level_df)
+        question_tree = self.get_question_tree()
+        if question_id in self.resolved_question_dfs:
+            result_df = self.resolved_question_dfs[question_id]
+            return copy_question_dfs(result_df) if copy else result_df
 
-        if df_list is None:
+        position = question_tree.get_position(question_id)
+        if position is None or question_tree.levels[position] == 0:
             logger.warning(f"Could not find any question belonging to {question_id}. Please check ")
-            result_df = None
-        elif len(df_list) == 1:
+            return None
+        level = int(question_tree.levels[position])
+        positions = question_tree._get_row_positions(position)
+
+        level_df = self.question_df.take(positions)
+        if level > 1:
+            # drop the levels above the question, except the one removed by
+            # _remove_all_section_levels
+            level_df = level_df.droplevel(list(range(level - 1)))
+
+        sub_level_df = self._remove_all_section_levels(level_df)
+        if sub_level_df.index.nlevels == 1:
+            # only the level of the options is left because the questions are at the deepest
+            # level. The block is one question if all the options have the same parent
+            parent_level = self.question_df.index.nlevels - 2
+            parent_ids = self.question_df.index.get_level_values(parent_level)[positions].unique()
+            is_question = parent_level <= level or len(parent_ids) == 1
+        else:
+            parent_ids = sub_level_df.index.get_level_values(1).dropna().unique()
+            is_question = self._has_equal_number_of_nans(question_id, sub_level_df=sub_level_df)
+
+        df_list = list()
+        if not is_question:
+            # the block we have is not a question, because the is an unequal amount of nans
+            # in the index. Get all the questions of the next level
+            logger.debug(f"looping over all levels  for {question_id}")
+            for level_id in parent_ids:
+                logger.debug(f"Recursive call for {question_id}: {level_id}")
+                result_df = self.get_question_df(int(level_id))
+                if isinstance(result_df, list):
+                    df_list.extend(result_df)
+                elif result_df is not None:
+                    df_list.append(result_df)
+        else:
+            df_list.append(sub_level_df)
+
+        if len(df_list) == 1:
             # if we have only on match, do not return as a list but a a dataframe
             result_df = df_list[0]
         else:
             result_df = df_list
 
-        return result_df
+        self.resolved_question_dfs[question_id] = result_df
 
-    def plot(self):
+        return copy_question_dfs(result_df) if copy else result_df
+
+    def plot(self, workers=None):
         """
         Loop over all the modules and plot all questions per module
+
+        Parameters
+        ----------
+        workers: int, optional
+            Number of processes used to render and save the figures. The data of all the figures
+            is prepared first, after which the rendering is distributed over a process pool using
+            the Agg backend. In this mode the figures can not be shown. Default = None, which
+            means that the figures are rendered one by one in the current process
+
+        Returns
+        -------
+        dict:
+            The errors per figure file base name. Only collected when using *workers*, otherwise
+            the error is raised
+        """
+        plot_jobs = self.get_plot_jobs(batch_plot_data=True)
+        all_plot_jobs = plot_jobs
+
+        if self.incremental_plots:
+            plot_manifest = self.read_plot_manifest()
+            fingerprints = dict()
+            changed_plot_jobs = list()
+            for plot_job in plot_jobs:
+                file_base = plot_job["file_base"]
+                fingerprints[file_base] = get_plot_fingerprint(plot_job)
+                if plot_job["show_plot"] or \
+                        plot_manifest.get(file_base) != fingerprints[file_base] or \
+                        not all([file_name.exists() for file_name in get_plot_files(plot_job)]):
+                    changed_plot_jobs.append(plot_job)
+            logger.info(f"Skipping {len(plot_jobs) - len(changed_plot_jobs)} unchanged figures")
+            plot_jobs = changed_plot_jobs
+
+        errors = collections.OrderedDict()
+        rendered = list()
+        try:
+            if workers is None or workers <= 1:
+                with PlotRenderer() as renderer:
+                    for plot_job in plot_jobs:
+                        renderer.render(plot_job)
+                        rendered.append(plot_job["file_base"])
+            else:
+                if self.show_plot:
+                    logger.warning("The figures can not be shown when rendering with workers")
+
+                logger.info(f"Rendering {len(plot_jobs)} figures with {workers} workers")
+                with ProcessPoolExecutor(max_workers=workers,
+                                         initializer=init_plot_worker) as executor:
+                    futures = collections.OrderedDict()
+                    for plot_job in plot_jobs:
+                        plot_job["show_plot"] = False
+                        futures[plot_job["file_base"]] = executor.submit(render_plot_job,
+                                                                         plot_job)
+                    for file_base, future in futures.items():
+                        try:
+                            future.result()
+                        except Exception as err:
+                            logger.warning(f"Failed to render {file_base}: {err}")
+                            errors[file_base] = f"{type(err).__name__}: {err}"
+                        else:
+                            rendered.append(file_base)
+            if self.plot_data_batch is not None:
+                write_plot_data_batches(all_plot_jobs, updated_file_bases=rendered)
+        finally:
+            if self.incremental_plots:
+                # store the fingerprints of the figures which have been rendered successfully and
+                # remove the ones which failed, such that they are rendered again the next run
+                for plot_job in plot_jobs:
+                    plot_manifest.pop(plot_job["file_base"], None)
+                for file_base in rendered:
+                    plot_manifest[file_base] = fingerprints[file_base]
+                self.write_plot_manifest(plot_manifest)
+
+        return errors
+
+    def read_plot_manifest(self):
+        """
+        Read the plot manifest with the fingerprints of the figures in the image directory
+
+        Returns
+        -------
+        dict:
+            The fingerprint per figure file base name. Empty in case no manifest exists yet
+        """
+        try:
+            with open(self.plot_manifest_file, "r") as stream:
+                plot_manifest = json.load(stream)
+        except (FileNotFoundError, json.JSONDecodeError):
+            plot_manifest = dict()
+        return plot_manifest
+
+    def write_plot_manifest(self, plot_manifest):
+        """
+        Write the plot manifest with the fingerprints of the figures to the image directory
+
+        Parameters
+        ----------
+        plot_manifest: dict
+            The fingerprint per figure file base name
+        """
+        logger.debug(f"Writing plot manifest {self.plot_manifest_file}")
+        with open(self.plot_manifest_file, "w") as stream:
+            json.dump(plot_manifest, stream, indent=2, sort_keys=True)
+
+    def get_plot_jobs(self, batch_plot_data=False):
+        """
+        Get the plot jobs of all the questions to plot
+
+        Parameters
+        ----------
+        batch_plot_data: bool, optional
+            Store the plot data in the batch workbook of *plot_data_batch* instead of a workbook
+            per question. The batch workbooks must then be written with
+            *write_plot_data_batches*, as *plot* does. Default = False
+
+        Returns
+        -------
+        list:
+            The plot jobs as created by *get_plot_job* for all the modules and questions selected
+            by *modules_to_plot* and *questions_to_plot*
         """
         if isinstance(self.modules_to_plot, int):
             # turn modules_to_plot into a list if only a integer was given
             self.modules_to_plot = [self.modules_to_plot]
+        if isinstance(self.questions_to_plot, int):
+            # if the questions_to_plot is given as a single int, make it a list
+            self.questions_to_plot = [self.questions_to_plot]
+
+        if self.plot_all_modules:
+            modules = None
+        else:
+            modules = self.modules_to_plot
+        if self.plot_all_questions:
+            questions = None
+        else:
+            questions = self.questions_to_plot
 
-        for module_id, module_df in self.question_df.groupby(level=0):
+        plot_jobs = list()
+        for module_id, question_id, sub_level_df in self.iter_question_sub_level_dfs(
+                modules=modules, questions=questions):
+            logger.debug("Preparing plot")
+            plot_jobs.append(self.get_plot_job(sub_level_df=sub_level_df,
+                                               batch_plot_data=batch_plot_data,
+                                               question_id=question_id))
 
-            if self.modules_to_plot is not None:
-                if module_id not in self.modules_to_plot and not self.plot_all_modules:
-                    logger.debug(f"Skipping module {module_id}")
-                    continue
+        return plot_jobs
+
+    def iter_question_frames(self, modules=None, questions=None):
+        """
+        Iterate over the questions and yield the prepared data frame of each question
+
+        Parameters
+        ----------
+        modules: list, optional
+            The ids of the modules to include. Default = None, which means all modules
+        questions: list, optional
+            The ids of the questions to include. A question is included as well if one of its
+            parents is in the list. Default = None, which means all questions
+
+        Yields
+        ------
+        tuple (int, int, pd.DataFrame):
+            The module id, the question id and the prepared data frame as created by
+            *prepare_data_frame*, with the question options as index and the values per
+            *x_axis_key* in the columns
+
+        Notes
+        -----
+        * The data frames are prepared one by one, so the next question is only prepared when it
+          is requested. Matplotlib is not used
+
+        Examples
+        --------
+
+        >>> stat = StatLineTable(table_id="84410NED")
+        >>> for module_id, question_id, question_df in stat.iter_question_frames(modules=[2]):
+        ...     print(question_df)
+        """
+        for module_id, question_id, sub_level_df in self.iter_question_sub_level_dfs(
+                modules=modules, questions=questions):
+            yield module_id, question_id, self.prepare_data_frame(sub_level_df=sub_level_df,
+                                                                  question_id=question_id)
+
+    def iter_question_sub_level_dfs(self, modules=None, questions=None):
+        """
+        Iterate over the questions and yield the rows of each question
+
+        Parameters
+        ----------
+        modules: list, optional
+            The ids of the modules to include. Default = None, which means all modules
+        questions: list, optional
+            The ids of the questions to include. A question is included as well if one of its
+            parents is in the list. Default = None, which means all questions
+
+        Yields
+        ------
+        tuple (int, int, pd.DataFrame):
+            The module id, the question id and the rows of the question_df of the question, with
+            the section levels removed from the index
+        """
+        if isinstance(modules, int):
+            modules = [modules]
 
-            logger.info(f"Processing module {module_id}:")
+        for module_id, question_id, positions, first_level in self.get_question_blocks(
+                questions=questions):
 
-            reported = list()
-            for level_id, level_df in module_df.groupby(level=1):
+            if modules is not None and module_id not in modules:
+                continue
 
-                if level_id not in reported:
-                    # report the questions in this module
-                    logger.debug("Available questions in {}".format(level_id))
-                    logger.debug("\n{}".format(level_df[self.key_key].drop_duplicates()))
-                    reported.append(level_id)
+            logger.debug(f"Question {question_id} of module {module_id}")
+            sub_level_df = self.question_df.take(positions)
+            sub_level_df = sub_level_df.droplevel(list(range(first_level)))
 
-                self._plot_module_questions(level_id=level_id, level_df=level_df)
+            yield module_id, question_id, sub_level_df
+
+    def get_question_blocks(self, questions=None):
+        """
+        Get the blocks of rows of the question_df which form a question
+
+        Parameters
+        ----------
+        questions: list, optional
+            The ids of the questions to include. A question is included as well if one of its
+            parents is in the list. Default = None, which means all questions
+
+        Returns
+        -------
+        list:
+            For each question a tuple with the module id, the question id, the positions of the
+            rows in the question_df and the number of levels to remove from the index, in the
+            order of the modules and questions
+
+        Notes
+        -----
+        * The blocks are found by walking the *question_tree*: the section levels are skipped
+          and a block is a question if all rows have the same number of empty levels. Otherwise,
+          the block is split on the nodes at the next level
+        * Without *questions*, the blocks are computed once and reset when a new question_df is
+          assigned
+        """
+        if questions is None and self.question_blocks is not None:
+            return self.question_blocks
+
+        if isinstance(questions, int):
+            questions = [questions]
+
+        tree = self.get_question_tree()
+        n_levels = tree.n_levels
+        blocks = list()
+        if questions is not None:
+            selected = np.isin(tree.ids, questions)
+        else:
+            selected = None
+
+        def add_blocks(module_id, position, first_level):
+            if selected is not None:
+                # the block is selected if the node, one of its sub nodes or its parent is in the
+                # list of questions
+                parent = tree.parents[position]
+                if not (selected[position:tree.subtree_stops[position]].any() or
+                        (parent >= 0 and selected[parent])):
+                    logger.debug(f"Skipping question {tree.ids[position]}")
+                    return
+
+            # skip the levels which belong to a section, i.e. as long as the next level is filled
+            # for all rows
+            level = first_level + 1
+            while level + 1 < n_levels and tree.min_leaf_levels[position] >= level + 1:
+                level += 1
+
+            if level + 1 >= n_levels:
+                # only one level is left, so the block can not be split
+                logger.debug(f"Failed getting next level for {tree.ids[position]}")
+                return
+
+            if tree.min_leaf_levels[position] == tree.max_leaf_levels[position]:
+                blocks.append((module_id, int(tree.ids[position]),
+                               tree._get_row_positions(position), level))
+            else:
+                # the block is not a question, because there is an unequal amount of nans in the
+                # index. Split the block on the sub nodes at the next level
+                sub_positions = np.arange(position + 1, tree.subtree_stops[position])
+                sub_positions = sub_positions[tree.levels[sub_positions] == level + 1]
+                sub_positions = sub_positions[np.argsort(tree.ids[sub_positions], kind="stable")]
+                for sub_position in sub_positions:
+                    add_blocks(module_id, sub_position, level)
+
+        for module in sorted(tree.modules, key=lambda node: node.id):
+            for child in module.children:
+                add_blocks(module.id, child.position, 0)
+
+        if questions is None:
+            self.question_blocks = blocks
+
+        return blocks
 
     @staticmethod
     def _remove_all_section_levels(level_df):
@@ -940,172 +2601,292 @@ class StatLineTable(object):
         first level always applies to the module, so we can drop it here. Then, there more be
         section levels we we may also drop. We can see that by looking at the next level: if that
         has at least a nan, the current level can not be a section and we can continue. Otherwise
-        we drop the current level too
+        we drop the current level too. The levels to drop are found from the codes of the index,
+        which are -1 for a nan, and dropped at once
         """
 
-        try:
-            # for pandas version >= 0.24.0
-            sub_level_df = level_df.droplevel(0)
-        except AttributeError:
-            # for pandas version < 0.24.0
-            sub_level_df = level_df.copy()
-            sub_level_df.index = level_df.index.droplevel(level=0)
+        sub_level_df = level_df.droplevel(0)
 
-        while True:
-            try:
-                if sub_level_df.index.get_level_values(1).isnull().any():
-                    break
-            except IndexError:
-                break
-            else:
-                # we have found only valid values at the next level, so we can drop the current one
-                # because it belongs to a section
-                try:
-                    sub_level_df = sub_level_df.droplevel(0)
-                except AttributeError:
-                    sub_level_df.index = sub_level_df.index.droplevel(level=0)
+        index = sub_level_df.index
+        if isinstance(index, pd.MultiIndex):
+            n_drop = 0
+            while n_drop + 1 < index.nlevels and (index.codes[n_drop + 1] >= 0).all():
+                # we have found only valid values at the next level, so we can drop the current
+                # one because it belongs to a section
+                n_drop += 1
+            if n_drop > 0:
+                sub_level_df = sub_level_df.droplevel(list(range(n_drop)))
 
         return sub_level_df
 
     @staticmethod
     def _has_equal_number_of_nans(level_id, sub_level_df):
+        """
+        Check if all the rows of *sub_level_df* have the same number of nans in the index
 
-        equal_number = False
-        last_number = None
-        for index, row in sub_level_df.iterrows():
-            try:
-                # count number of nans in de index of the current row
-                number_of_nan = sum([math.isnan(x) for x in index])
-            except TypeError:
-                return equal_number
-            if last_number is not None and number_of_nan != last_number:
-                logger.debug("Need to go one level deeper")
-                return equal_number
-
-            last_number = number_of_nan
-
-        equal_number = True
+        Parameters
+        ----------
+        level_id: int
+            The id of the level
+        sub_level_df: pd.DataFrame
+            The rows of the level with the section levels removed from the index
+
+        Returns
+        -------
+        bool:
+            True in case all rows have the same number of nans, which means that the rows form
+            a question. False in case the index has a single level
+        """
+        index = sub_level_df.index
+        if not isinstance(index, pd.MultiIndex):
+            return False
+
+        number_of_nans = (np.array([np.asarray(codes) for codes in index.codes]) < 0).sum(axis=0)
+        equal_number = bool((number_of_nans == number_of_nans[:1]).all())
+        if not equal_number:
+            logger.debug(f"Need to go one level deeper for {level_id}")
 
         return equal_number
 
-    def question_or_its_parent_in_index(self, level_df):
+    def question_or_its_parent_in_index(self, level_df, questions=None):
         """
         Check if a question or any of the parent is in de index.
 
+        Parameters
+        ----------
+        level_df: pd.DataFrame
+            The rows of the question
+        questions: list, optional
+            The question ids to look for. Default = None, which means *questions_to_plot*
+
         Return
         ------
         bool:
             True in case a question of its parents is in de inex
         """
-        if isinstance(self.questions_to_plot, int):
-            # if the questions_to_plot is given as a single int, make it a list
-            self.questions_to_plot = [self.questions_to_plot]
+        if questions is None:
+            if isinstance(self.questions_to_plot, int):
+                # if the questions_to_plot is given as a single int, make it a list
+                self.questions_to_plot = [self.questions_to_plot]
+            questions = self.questions_to_plot
         in_index = False
         for question_index in level_df.index.values:
-            if set(question_index).intersection(set(self.questions_to_plot)):
+            if set(question_index).intersection(set(questions)):
                 in_index = True
                 break
         return in_index
 
-    def _plot_module_questions(self, level_id: int, level_df: pd.DataFrame):
+    def prepare_data_frame(self, sub_level_df, question_id=None):
         """
-        Plot the questions of a module
+        Create the data frame of a question with the options on the index and the values per
+        *x_axis_key* value in the columns
 
         Parameters
         ----------
-        level_id: int
-            The id number of a module
-        level_df: pd.DataFrame
-            A pandas dataframe of the current module questions
+        sub_level_df: pd.DataFrame
+            The rows of the question_df belonging to one question
+        question_id: int, optional
+            The id of the question in case *sub_level_df* contains all the rows of the question
+            block, as yielded by *iter_question_sub_level_dfs*. Only then the pivot table is
+            stored. Default = None, which means that the pivot table is created every call
+
+        Returns
+        -------
+        pd.DataFrame
+            The values of the question with the options as index and the *x_axis_key* values as
+            columns. In case *apply_selection* is True only the selected columns are included.
+            In case *sort_choices* is True, the options are sorted, otherwise the original order
+            is kept
+
+        Notes
+        -----
+        * The pivot table of a question is stored by the id of the question block, such that
+          preparing the same question again with another *selection* or *sort_choices* only
+          needs to select the rows and columns. The stored pivot tables are reset when a new
+          question_df is assigned. In case the values of the question_df are modified in place,
+          reset *question_pivots* to None
+        * A subset of the rows of a question, such as the rows of one period, must be prepared
+          without *question_id*, as it would otherwise get the pivot table of the whole block
+        * The *sub_level_df* is not modified, and the result is a new data frame which can be
+          modified without changing the stored pivot table
         """
+        pivot = self.get_question_pivot(sub_level_df, question_id=question_id)
 
-        if self.questions_to_plot is not None and not self.plot_all_questions:
-            plot_question = self.question_or_its_parent_in_index(level_df)
-            if not plot_question:
-                logger.debug(f"Skipping question {level_id}")
-                return
+        if pivot is None:
+            # the values could not be put in a table. Return the values as a series
+            return self._get_question_series(sub_level_df)
 
-        logger.debug(f"Question {level_id}")
+        pivot_df, x_values, sorted_positions = pivot
 
-        sub_level_df = self._remove_all_section_levels(level_df)
+        # keep the original order of the size classes and the options
+        self.selection_options = x_values
 
-        is_question = self._has_equal_number_of_nans(level_id, sub_level_df=sub_level_df)
+        if self.apply_selection:
+            # in case the apply selection flag is true, we don't use all items in a group but take
+            # a selection defined the selection secions
+            logger.debug("Selecting from\n{}".format(x_values))
+            column_positions = self.get_selection_positions(x_values)
+        else:
+            column_positions = slice(None)
 
-        if not is_question:
-            # the block we have is not a question, because the is an unequal amount of nans in the
-            # index. Loop over the blocks and call this fucntion again with the subsubblocks
-            logger.debug(f"looping over all levels  for {level_id}")
-            try:
-                for id, df in sub_level_df.groupby(level=1):
-                    logger.debug(f"Calling plot for {level_id}: {id}")
-                    self._plot_module_questions(id, df)
-            except ValueError:
-                logger.debug(f"Failed getting next level for {level_id}: {id}")
-            finally:
-                return
+        if self.sort_choices:
+            row_positions = sorted_positions
+        else:
+            row_positions = slice(None)
 
-        logger.debug("Making plot")
+        return pivot_df.iloc[row_positions, column_positions].copy()
 
-        self.make_the_plot(sub_level_df=sub_level_df)
+    def get_selection_positions(self, x_values):
+        """
+        Get the positions of the selected *x_axis_key* values
 
-    def prepare_data_frame(self, sub_level_df):
+        Parameters
+        ----------
+        x_values: pd.Index
+            The *x_axis_key* values of the question in the original order
 
-        datatype = sub_level_df[self.datatype_key].values[0]
+        Returns
+        -------
+        np.ndarray:
+            The positions of the values in *x_values* which are in the *selection*. The positions
+            are stored per selection and *x_values*, as the selection is the same for all questions
+        """
+        if isinstance(self.selection, list):
+            selection = self.selection
+        elif isinstance(self.selection, dict):
+            selection = list(self.selection.values())
+        else:
+            raise AssertionError("selection should either be a list or a dict")
 
-        if datatype == "Integer":
-            # make sure that integers are printed as integers
-            sub_level_df.loc[:, self.value_key] = sub_level_df[self.value_key].astype(int).values
+        cache_key = (tuple(selection), tuple(x_values))
+        try:
+            positions = self.selection_positions[cache_key]
+        except (KeyError, TypeError):
+            selected = set(selection)
+            positions = np.array([position for position, x_value in enumerate(x_values)
+                                  if x_value in selected], dtype=int)
+            if self.selection_positions is None:
+                self.selection_positions = dict()
+            self.selection_positions[cache_key] = positions
 
-        # we have to create a dataframe with the questions on the indices and all the values
-        # per size class in the columns.
-        sub_level_df.reset_index(inplace=True)
-        sub_level_df.set_index([self.title_key, self.x_axis_key], drop=True, inplace=True)
-        sub_level_df = sub_level_df[self.value_key]
+        logger.debug("\n{}".format(x_values[positions].values))
 
-        # keep the original order of the size classes, as unstack is going to sorted
-        # alphabetically, which is not correct.
-        sorted_index_0 = sub_level_df.index.get_level_values(0).unique()
-        sorted_index_1 = sub_level_df.index.get_level_values(1).unique()
-        self.selection_options = sorted_index_1
+        return positions
 
-        if self.apply_selection:
-            # in case the apply selection flag is true, we don't use all items in a group but take
-            # a selection defined the selection secions
-            logger.debug("Selecting from\n{}".format(sorted_index_1))
-            if isinstance(self.selection, list):
-                sorted_index_1 = sorted_index_1.intersection(set(self.selection))
-            elif isinstance(self.selection, dict):
-                sorted_index_1 = sorted_index_1.intersection(set(self.selection.values()))
-            else:
-                raise AssertionError("selection should either be a list or a dict")
+    def get_question_pivot(self, sub_level_df, question_id=None):
+        """
+        Get the pivot table of the values of a question
 
-        logger.debug("\n{}".format(sorted_index_1.values))
+        Parameters
+        ----------
+        sub_level_df: pd.DataFrame
+            The rows of the question_df belonging to one question
+        question_id: int, optional
+            The id of the question block of which *sub_level_df* contains all the rows. Default =
+            None, which means that the pivot table is not stored
 
-        # for a proper bar plot, we need to unstack the dataframe
-        try:
+        Returns
+        -------
+        tuple (pd.DataFrame, pd.Index, np.ndarray) or None:
+            The values with the options as index and the *x_axis_key* values as columns, both in
+            the original order, the *x_axis_key* values and the positions of the options in the
+            sorted order. None in case an option has more than one value per *x_axis_key* value
 
-            sub_level_df = sub_level_df.unstack()
-        except ValueError as err:
-            logger.error(err)
-        else:
-            # reset the size class order in the columns
-            sub_level_df = sub_level_df[sorted_index_1.values]
+        Notes
+        -----
+        * The table is created by the codes of the options and the *x_axis_key* values, which is
+          the same as an unstack, but without sorting and creating a multi index first
+        * The pivot tables are stored per question block and reset when a new question_df is
+          assigned. The key contains a hash of the option, *x_axis_key* and value columns, such
+          that a change of the question_df in place is picked up as well. A data frame without
+          *question_id* may be any selection of rows, so its pivot table is not stored
+        """
+        if question_id is not None:
+            columns = [self.title_key, self.x_axis_key, self.value_key]
+            data_hash = hashlib.sha256(pd.util.hash_pandas_object(
+                sub_level_df[columns], index=False).values.tobytes()).hexdigest()
+            cache_key = (question_id, self.x_axis_key, self.value_key, data_hash)
+            if self.question_pivots is None:
+                self.question_pivots = dict()
+            try:
+                return self.question_pivots[cache_key]
+            except KeyError:
+                pass
 
-            # also restore the order of the index values which was sorted by unstack
-            if not self.sort_choices:
-                sub_level_df = sub_level_df.reindex(sorted_index_0.values)
+        values = self._get_question_values(sub_level_df)
 
-        return sub_level_df
+        # the codes of the options and x values in the order of appearance
+        title_codes, titles = pd.factorize(sub_level_df[self.title_key].to_numpy())
+        x_codes, x_values = pd.factorize(sub_level_df[self.x_axis_key].to_numpy())
 
-    def make_the_plot(self, sub_level_df):
+        n_cells = len(titles) * len(x_values)
+        cell_codes = title_codes * len(x_values) + x_codes
+        if (title_codes < 0).any() or (x_codes < 0).any() or \
+                len(np.unique(cell_codes)) != len(cell_codes):
+            logger.error("Index contains duplicate entries, cannot reshape")
+            pivot = None
+        else:
+            if len(cell_codes) == n_cells and values.dtype != object:
+                table = np.empty(n_cells, dtype=values.dtype)
+            else:
+                # missing cells are filled with nan, just like unstack does
+                table = np.full(n_cells, np.nan, dtype=np.result_type(values.dtype, float))
+            table[cell_codes] = values
+            table = table.reshape(len(titles), len(x_values))
+            pivot_df = pd.DataFrame(table,
+                                    index=pd.Index(titles, name=self.title_key),
+                                    columns=pd.Index(x_values, name=self.x_axis_key))
+            sorted_positions = np.argsort(titles, kind="stable")
+            pivot = (pivot_df, pivot_df.columns, sorted_positions)
+
+        if question_id is not None:
+            self.question_pivots[cache_key] = pivot
+
+        return pivot
+
+    def _get_question_values(self, sub_level_df):
+        """ Get the values of a question. Integers are converted to int """
+        values = sub_level_df[self.value_key].values
+        datatype = sub_level_df[self.datatype_key].values[0]
+        if datatype == "Integer":
+            # make sure that integers are printed as integers
+            values = values.astype(int)
+        elif values.dtype.kind in "iu":
+            values = values.astype(np.int64)
+        elif values.dtype.kind == "f":
+            # the values of a compacted question_df may be stored as float32
+            values = values.astype(np.float64)
+        return values
+
+    def _get_question_series(self, sub_level_df):
+        """ Get the values of a question as a series with the option and x value as index """
+        index = pd.MultiIndex.from_arrays([sub_level_df[self.title_key].to_numpy(),
+                                           sub_level_df[self.x_axis_key].to_numpy()],
+                                          names=[self.title_key, self.x_axis_key])
+        return pd.Series(self._get_question_values(sub_level_df), index=index,
+                         name=self.value_key)
+
+    def get_plot_job(self, sub_level_df, batch_plot_data=False, question_id=None):
         """
-        Plot the data stored in the *sub_level_df* Dataframe
+        Prepare the data and settings to plot the data stored in the *sub_level_df* Dataframe
 
         Parameters
         ----------
         sub_level_df: pd.Dataframe
             Dataframe containing the data to plot
+        batch_plot_data: bool, optional
+            Store the plot data in the batch workbook of *plot_data_batch*, which is not written
+            by *render_plot* but by *write_plot_data_batches*. Default = False, which means that
+            the plot data is written to a workbook per question by *render_plot*
+        question_id: int, optional
+            The id of the question block of *sub_level_df*, which is passed to
+            *prepare_data_frame*. Default = None
 
+        Returns
+        -------
+        dict:
+            The plot job with the prepared data frame and all the settings required by
+            *render_plot*, such that the figure can be rendered in another process
         """
 
         key = sub_level_df[self.key_key].values[0]
@@ -1115,57 +2896,29 @@ class StatLineTable(object):
         if len(splitted) > 1:
             module_title = splitted[0]
             question_title = " ".join(splitted[1:])
+            show_y_axis = True
         else:
             module_title = section_title
             question_title = None
+            show_y_axis = False
 
         survey_title = self.table_infos[0]["ShortTitle"]
 
-        sub_level_df = self.prepare_data_frame(sub_level_df=sub_level_df)
+        sub_level_df = self.prepare_data_frame(sub_level_df=sub_level_df, question_id=question_id)
 
-        fig, axis = plt.subplots(nrows=1, ncols=1, figsize=(10, 6))
-        fig.subplots_adjust(left=0.4, right=0.7)
-
-        sub_level_df.plot(kind="barh", ax=axis)
-
-        axis.set_xlabel(units)
-        axis.invert_yaxis()
         if question_title is None:
             question_title = sub_level_df.index.values[0]
-            axis.get_yaxis().set_visible(False)
-        else:
-            axis.set_ylabel("")
 
-        patches, labels = axis.get_legend_handles_labels()
         if isinstance(self.selection, dict):
-            inv_map = {v: k for k, v in self.selection.items()}
-            new_labels = list()
-            for label in labels:
-                try:
-                    new_labels.append(inv_map[label])
-                except KeyError:
-                    new_labels.append(label)
-            labels = new_labels
+            label_map = {v: k for k, v in self.selection.items()}
+        else:
+            label_map = None
 
         if self.legend_title is not None:
             legend_title = self.legend_title
         else:
             legend_title = self.x_axis_key
 
-        axis.legend(patches, labels, loc="lower left", bbox_to_anchor=self.legend_position,
-                    title=legend_title)
-
-        def add_figtext(title, properties):
-            location = properties["loc"]
-            color = properties.get("color")
-            plt.figtext(location[0], location[1], title, color=color)
-
-        add_figtext(survey_title, self.survey_title_properties)
-        add_figtext(module_title, self.module_title_properties)
-        add_figtext(question_title, self.question_title_properties)
-
-        # plt.title(df["Title"].values[0])
-
         if self.apply_selection:
             suffix = "sel"
         else:
@@ -1175,155 +2928,980 @@ class StatLineTable(object):
                               re.sub("\s+", "_", question_title).lower(),
                               suffix])
         file_base = re.sub("[()/]", "", file_base)
-        file_name = Path(file_base + self.image_type)
-        image_name = self.image_dir / file_name
 
-        add_cbs_logo_to_plot(fig=fig)
+        plot_job = dict(
+            key=key,
+            data=sub_level_df,
+            units=units,
+            survey_title=survey_title,
+            module_title=module_title,
+            question_title=question_title,
+            show_y_axis=show_y_axis,
+            label_map=label_map,
+            legend_title=legend_title,
+            legend_position=self.legend_position,
+            survey_title_properties=self.survey_title_properties,
+            module_title_properties=self.module_title_properties,
+            question_title_properties=self.question_title_properties,
+            file_base=file_base,
+            image_name=self.image_dir / Path(file_base + self.image_type),
+            save_plot=self.save_plot,
+            show_plot=self.show_plot,
+            sheet_name=self.x_axis_key,
+            rotate_latex_columns=self.rotate_latex_columns,
+        )
+        if self.store_plot_data_to_xls and (self.plot_data_batch is None or not batch_plot_data):
+            plot_job["xls_file"] = self.image_dir / Path(file_base + ".xlsx")
+        elif self.store_plot_data_to_xls:
+            # the plot data is written to a workbook per module or for the whole table
+            if self.plot_data_batch == "module":
+                batch_file_base = "_".join([self.table_id,
+                                            re.sub("\s+", "_", module_title).lower(), suffix])
+                batch_file_base = re.sub("[()/]", "", batch_file_base)
+            else:
+                batch_file_base = "_".join([self.table_id, suffix])
+            plot_job["xls_batch_file"] = self.image_dir / Path(batch_file_base + ".xlsx")
+        if self.store_plot_data_to_tex:
+            plot_job["tex_file"] = self.image_dir / Path(file_base + ".tex")
+
+        return plot_job
+
+    def make_the_plot(self, sub_level_df):
+        """
+        Plot the data stored in the *sub_level_df* Dataframe
+
+        Parameters
+        ----------
+        sub_level_df: pd.Dataframe
+            Dataframe containing the data to plot
+
+        """
+        render_plot(self.get_plot_job(sub_level_df=sub_level_df))
+
+
+class PlotRenderer(object):
+    """
+    Render the figures of a batch of plot jobs in a single figure
+
+    The figure, the axis, the CBS logo and the title texts are created once. For each plot job,
+    only the axis is cleared and the bars, legend and title texts are redrawn, such that the
+    memory use does not grow with the number of figures. Use the renderer as a context manager
+    to close the figure at the end of the batch
+
+    Parameters
+    ----------
+    figsize: tuple, optional
+        Size of the figure in inch. Default = (10, 6)
+
+    Examples
+    --------
+
+    >>> with PlotRenderer() as renderer:
+    ...     for plot_job in stat.get_plot_jobs():
+    ...         renderer.render(plot_job)
+    """
+
+    def __init__(self, figsize=(10, 6)):
+        self.figsize = figsize
+        self.fig = None
+        self.axis = None
+        self.title_texts = dict()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def open(self):
+        """ Create the figure with the axis and the logo """
+        import matplotlib.pyplot as plt
+        from .plotting import add_cbs_logo_to_plot
+
+        self.fig, self.axis = plt.subplots(nrows=1, ncols=1, figsize=self.figsize)
+        self.fig.subplots_adjust(left=0.4, right=0.7)
+        add_cbs_logo_to_plot(fig=self.fig)
+        self.title_texts = dict()
+
+    def close(self):
+        """ Close the figure """
+        if self.fig is not None:
+            import matplotlib.pyplot as plt
+            plt.close(self.fig)
+        self.fig = None
+        self.axis = None
+        self.title_texts = dict()
+
+    def set_title(self, name, title, properties):
+        """ Set the title text *name* of the figure. The text is created the first time """
+        location = properties["loc"]
+        color = properties.get("color")
+        try:
+            text = self.title_texts[name]
+        except KeyError:
+            self.title_texts[name] = self.fig.text(location[0], location[1], title, color=color)
+        else:
+            text.set_position(location)
+            text.set_text(title)
+            text.set_color(color)
+
+    def render(self, plot_job):
+        """
+        Render and save the figure of a plot job
+
+        Parameters
+        ----------
+        plot_job: dict
+            The plot job as created by *StatLineTable.get_plot_job*
+
+        Returns
+        -------
+        Figure:
+            The matplotlib figure
+        """
+        if self.fig is None:
+            self.open()
+
+        sub_level_df = plot_job["data"]
+        axis = self.axis
+        axis.clear()
+
+        sub_level_df.plot(kind="barh", ax=axis)
+
+        axis.set_xlabel(plot_job["units"])
+        axis.invert_yaxis()
+        axis.get_yaxis().set_visible(plot_job["show_y_axis"])
+        if plot_job["show_y_axis"]:
+            axis.set_ylabel("")
+
+        patches, labels = axis.get_legend_handles_labels()
+        label_map = plot_job["label_map"]
+        if label_map is not None:
+            new_labels = list()
+            for label in labels:
+                try:
+                    new_labels.append(label_map[label])
+                except KeyError:
+                    new_labels.append(label)
+            labels = new_labels
+
+        axis.legend(patches, labels, loc="lower left", bbox_to_anchor=plot_job["legend_position"],
+                    title=plot_job["legend_title"])
+
+        self.set_title("survey", plot_job["survey_title"], plot_job["survey_title_properties"])
+        self.set_title("module", plot_job["module_title"], plot_job["module_title_properties"])
+        self.set_title("question", plot_job["question_title"],
+                       plot_job["question_title_properties"])
 
-        if self.save_plot:
+        image_name = plot_job["image_name"]
+        if plot_job["save_plot"]:
             logger.info(f"Saving image to {image_name}")
-            plt.savefig(image_name)
-        if self.show_plot:
+            self.fig.savefig(image_name)
+        if plot_job["show_plot"]:
+            import matplotlib.pyplot as plt
             plt.ioff()
             plt.show()
 
-        if self.store_plot_data_to_xls:
-            xls_file = Path(file_base + ".xlsx")
-            xls_file = self.image_dir / xls_file
-            logger.info(f"Saving plot data to {xls_file}")
-            with pd.ExcelWriter(xls_file) as writer:
-                sub_level_df.to_excel(writer, sheet_name=self.x_axis_key)
+        save_plot_data(plot_job)
 
-        if self.store_plot_data_to_tex:
-            tex_file = Path(file_base + ".tex")
-            tex_file = self.image_dir / tex_file
-
-            logger.info(f"Saving plot data to {tex_file}")
+        return self.fig
 
-            # for latex we transpose the matrix
-            sub_level_df = sub_level_df.T
 
-            if self.rotate_latex_columns:
-                # in order to have the \rot command to work, add the following in the preamble
+def render_plot(plot_job):
+    """
+    Render and save the figure of a single plot job
 
-                # \newcolumntype {R}[2] { %
-                #   > {\adjustbox {angle =  # 1,lap=\width-(#2)}\bgroup}%
-                #   l %
-                #   < {\egroup} %
-                #   }
-                #   \newcommand *\rot {\multicolumn {1} {R {45} {1 em}}}
+    Parameters
+    ----------
+    plot_job: dict
+        The plot job as created by *StatLineTable.get_plot_job*
 
-                rotated_columns = dict()
-                for col_name in sub_level_df.columns:
-                    rotated_columns[col_name] = r"\rot{" + col_name + r"}"
-                sub_level_df.rename(columns=rotated_columns, inplace=True)
+    Notes
+    -----
+    * The figure is closed afterwards. Use the *PlotRenderer* to render a batch of plot jobs
+    """
+    with PlotRenderer() as renderer:
+        renderer.render(plot_job)
 
-            sub_level_df.to_latex(tex_file, longtable=False, decimal=",")
-            if self.rotate_latex_columns:
-                with open(tex_file, "r") as fp:
-                    text = fp.read()
-                new_tex = text.replace("\\textbackslash rot\\{", "\\rot{")
-                new_tex = new_tex.replace("\\}", r"}")
-                with open(tex_file, "w") as fp:
-                    fp.write(new_tex)
 
+def save_plot_data(plot_job):
+    """
+    Save the data of a plot job to Excel and/or TeX
 
-class SbiInfo(object):
+    Parameters
+    ----------
+    plot_job: dict
+        The plot job as created by *StatLineTable.get_plot_job*
     """
-    Class to read the sbi coding as stored in the excel data file found on the intranet which can
-    subsequently be used to classify sbi codes into there groups
+    sub_level_df = plot_job["data"]
+
+    xls_file = plot_job.get("xls_file")
+    if xls_file is not None:
+        logger.info(f"Saving plot data to {xls_file}")
+        with pd.ExcelWriter(xls_file) as writer:
+            sub_level_df.to_excel(writer, sheet_name=plot_job["sheet_name"])
+    elif plot_job.get("xls_batch_file") is not None:
+        logger.debug(f"The plot data is written to {plot_job['xls_batch_file']} by "
+                     f"write_plot_data_batches")
+
+    tex_file = plot_job.get("tex_file")
+    if tex_file is not None:
+        logger.info(f"Saving plot data to {tex_file}")
+
+        # for latex we transpose the matrix
+        sub_level_df = sub_level_df.T
+
+        if plot_job["rotate_latex_columns"]:
+            # in order to have the \rot command to work, add the following in the preamble
+
+            # \newcolumntype {R}[2] { %
+            #   > {\adjustbox {angle =  # 1,lap=\width-(#2)}\bgroup}%
+            #   l %
+            #   < {\egroup} %
+            #   }
+            #   \newcommand *\rot {\multicolumn {1} {R {45} {1 em}}}
+
+            rotated_columns = dict()
+            for col_name in sub_level_df.columns:
+                rotated_columns[col_name] = r"\rot{" + col_name + r"}"
+            sub_level_df = sub_level_df.rename(columns=rotated_columns)
+
+        latex = sub_level_df.to_latex(longtable=False, decimal=",")
+        if plot_job["rotate_latex_columns"]:
+            # to_latex escapes the backslash and braces of the \rot commands. Undo that here
+            latex = latex.replace("\\textbackslash rot\\{", "\\rot{")
+            latex = latex.replace("\\}", r"}")
+        with open(tex_file, "w") as fp:
+            fp.write(latex)
+
+
+def write_plot_data_batches(plot_jobs, updated_file_bases=None):
+    """
+    Write the plot data of the plot jobs to the batch workbooks with one sheet per question
 
     Parameters
     ----------
-    file_name: str
-        Name of the excel file containing the Sbi codes
-    cache_filename: str, optional
-        Dump the data file to cache in order to improve reading time. Default = 'sbi_codes_df'
-    cache_filetype: str, optional
-        Type of the cache file. Default = '.pkl'
-    reset_cache: bool, optional
-        If true, force the reading of the original Excel file in stead of the cache
-    code_key: str, optional
-        Name of the column containing the full key of the sbi. Default = 'code'
-    label_key: str, optional
-        Name of the label with the sbi description. Default = 'Label'
-    compression: str
-        Type of compression to use when writing the pickle file. Default is *zip*
+    plot_jobs: list
+        The plot jobs as created by *StatLineTable.get_plot_job*. Only the plot jobs with a
+        *xls_batch_file* are written
+    updated_file_bases: list, optional
+        The file base names of the plot jobs which have been updated. Only the workbooks which
+        contain one of these plot jobs or which do not exist yet are written. Default = None,
+        which means that all workbooks are written
+    """
+    batches = collections.OrderedDict()
+    for plot_job in plot_jobs:
+        xls_batch_file = plot_job.get("xls_batch_file")
+        if xls_batch_file is not None:
+            batches.setdefault(xls_batch_file, list()).append(plot_job)
 
-    Attributes
+    if updated_file_bases is not None:
+        updated_file_bases = set(updated_file_bases)
+
+    for xls_batch_file, batch_plot_jobs in batches.items():
+        if updated_file_bases is not None and xls_batch_file.exists():
+            if not any([plot_job["file_base"] in updated_file_bases
+                        for plot_job in batch_plot_jobs]):
+                logger.debug(f"Skipping unchanged {xls_batch_file}")
+                continue
+        write_plot_data_workbook(xls_batch_file, batch_plot_jobs)
+
+
+def write_plot_data_workbook(file_name, plot_jobs):
+    """
+    Write the plot data of a list of plot jobs to a workbook with one sheet per question
+
+    Parameters
     ----------
-    data: pd.Dataframe
-        DataFrame that get the sbi codes
+    file_name: str or Path
+        Name of the Excel file
+    plot_jobs: list
+        The plot jobs as created by *StatLineTable.get_plot_job*
 
     Notes
     -----
-    * The SBI file can be downloaded from the intranet_ and is a excel file containing all the SBI
-      codes
-    * The main purpose of this class is to classify sbi codes obtained from a btw file into there
-      approriate group. The sbi codes are normally given as 5 digit string, e.g. '64191'. With
-      this class this can be directly related to group K.
-    * Also new user defined groups can be made from series of sbi codes, such as 'Banken'
+    * The workbook is written in the write-only mode of openpyxl, which streams the rows to the
+      file instead of keeping all the cells of the workbook in memory
+    * The sheet name is the question title, clipped to the 31 characters allowed by Excel
+    """
+    import openpyxl
+
+    logger.info(f"Saving plot data of {len(plot_jobs)} questions to {file_name}")
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet_names = set()
+    for plot_job in plot_jobs:
+        sheet_name = re.sub(r"[\[\]:*?/\\]", "", str(plot_job["question_title"]))[:31]
+        sheet_name = sheet_name or plot_job["sheet_name"]
+        base_name = sheet_name
+        counter = 1
+        while sheet_name.lower() in sheet_names:
+            counter += 1
+            postfix = f"_{counter}"
+            sheet_name = base_name[:31 - len(postfix)] + postfix
+        sheet_names.add(sheet_name.lower())
+
+        data = plot_job["data"]
+        if isinstance(data, pd.Series):
+            data = data.to_frame()
+
+        sheet = workbook.create_sheet(title=sheet_name)
+        index_names = [name if name is not None else "" for name in data.index.names]
+        sheet.append(index_names + [str(column) for column in data.columns])
+        index_values = data.index.tolist()
+        for index_value, row in zip(index_values, data.itertuples(index=False, name=None)):
+            if not isinstance(index_value, tuple):
+                index_value = (index_value,)
+            sheet.append([get_excel_value(value) for value in index_value + row])
+
+    workbook.save(file_name)
+
+
+def get_excel_value(value):
+    """ Convert a value of a data frame to a value which can be written by openpyxl """
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def get_plot_files(plot_job):
+    """
+    Get the files which are written for a plot job
 
-    Examples
-    --------
+    Parameters
+    ----------
+    plot_job: dict
+        The plot job as created by *StatLineTable.get_plot_job*
 
-    A minimal example of the loading of a SBI file is:
+    Returns
+    -------
+    list:
+        The image, Excel and TeX file names, depending on the settings of the plot job
+    """
+    file_names = list()
+    if plot_job["save_plot"]:
+        file_names.append(plot_job["image_name"])
+    for key in ("xls_file", "xls_batch_file", "tex_file"):
+        if plot_job.get(key) is not None:
+            file_names.append(plot_job[key])
+    return file_names
 
-    >>> file_name = '../../data/SBI 2008 versie 2018.xlsx'
-    >>> sbi = SbiInfo(file_name=file_name)
 
-    The Sbi code are now loaded to *data* attribute as a multiindex Pandas data frame.
-    To have a look at the data, use the standard Pandas tools, such as *head*:
+def get_plot_fingerprint(plot_job):
+    """
+    Get a fingerprint of all the inputs of the figure of a plot job
 
-    >>> print(tabulate(sbi.data.head(20), headers="keys", tablefmt="psql"))
-    +-------------------+---------+--------------------------------------------------------------------------+
-    |                   | code    | Label                                                                    |
-    |-------------------+---------+--------------------------------------------------------------------------|
-    | ('A', 0, 0, 0, 0) | A       | Landbouw, bosbouw en visserij                                            |
-    | ('A', 1, 0, 0, 0) | 01      | Landbouw, jacht en dienstverlening voor de landbouw en jacht             |
-    | ('A', 1, 1, 0, 0) | 01.1    | Teelt van eenjarige gewassen                                             |
-    | ('A', 1, 1, 1, 0) | 01.11   | Teelt van granen, peulvruchten en oliehoudende zaden                     |
-    | ('A', 1, 1, 3, 0) | 01.13   | Teelt van groenten en wortel- en knolgewassen                            |
-    | ('A', 1, 1, 3, 1) | 01.13.1 | Teelt van groenten in de volle grond                                     |
-    | ('A', 1, 1, 3, 2) | 01.13.2 | Teelt van groenten onder glas                                            |
-    | ('A', 1, 1, 3, 3) | 01.13.3 | Teelt van paddenstoelen                                                  |
-    | ('A', 1, 1, 3, 4) | 01.13.4 | Teelt van aardappels en overige wortel- en knolgewassen                  |
-    | ('A', 1, 1, 6, 0) | 01.16   | Teelt van vezelgewassen                                                  |
-    | ('A', 1, 1, 9, 0) | 01.19   | Teelt van overige eenjarige gewassen                                     |
-    | ('A', 1, 1, 9, 1) | 01.19.1 | Teelt van snijbloemen en snijheesters in de volle grond                  |
-    | ('A', 1, 1, 9, 2) | 01.19.2 | Teelt van snijbloemen en snijheesters onder glas                         |
-    | ('A', 1, 1, 9, 3) | 01.19.3 | Teelt van voedergewassen                                                 |
-    | ('A', 1, 1, 9, 9) | 01.19.9 | Teelt van overige eenjarige gewassen (rest)                              |
-    | ('A', 1, 2, 0, 0) | 01.2    | Teelt van meerjarige gewassen                                            |
-    | ('A', 1, 2, 1, 0) | 01.21   | Druiventeelt                                                             |
-    | ('A', 1, 2, 4, 0) | 01.24   | Teelt van appels, peren, pruimen, kersen en andere pit- en steenvruchten |
-    | ('A', 1, 2, 4, 1) | 01.24.1 | Teelt van appels en peren                                                |
-    | ('A', 1, 2, 4, 2) | 01.24.2 | Teelt van steenvruchten                                                  |
-    +-------------------+---------+--------------------------------------------------------------------------+
+    Parameters
+    ----------
+    plot_job: dict
+        The plot job as created by *StatLineTable.get_plot_job*
 
+    Returns
+    -------
+    str:
+        The sha256 hex digest of the data values, the titles, the selection, legend and file
+        settings of the plot job and the version of this package
+    """
+    data = plot_job["data"]
+    fingerprint = hashlib.sha256()
+    fingerprint.update(pd.util.hash_pandas_object(data, index=True).values.tobytes())
+    if isinstance(data, pd.DataFrame):
+        names = [list(map(str, data.columns)), list(map(str, data.index.names))]
+    else:
+        names = [str(data.name), list(map(str, data.index.names))]
 
-    It is now easy to get a group, e.g. "F"
+    settings = {key: value for key, value in plot_job.items() if key != "data"}
+    settings["names"] = names
+    settings["version"] = __version__
+    fingerprint.update(json.dumps(settings, sort_keys=True, default=str).encode("utf-8"))
+    return fingerprint.hexdigest()
 
-    >>> sbi_F = sbi.data.loc["F"]
-    >>> print(tabulate(sbi_F.head(5), headers="keys", tablefmt="psql"))
-    +---------------+--------+---------------------------------------------------------------+
-    |               | code   | Label                                                         |
-    |---------------+--------+---------------------------------------------------------------|
-    | (0, 0, 0, 0)  | F      | Bouwnijverheid                                                |
-    | (41, 0, 0, 0) | 41     | Algemene burgerlijke en utiliteitsbouw en projectontwikkeling |
-    | (41, 1, 0, 0) | 41.1   | Projectontwikkeling                                           |
-    | (41, 2, 0, 0) | 41.2   | Algemene burgerlijke en utiliteitsbouw                        |
-    | (42, 0, 0, 0) | 42     | Grond-, water- en wegenbouw (geen grondverzet)                |
-    +---------------+--------+---------------------------------------------------------------+
 
+def init_plot_worker():
+    """
+    Initialise a process which renders figures: use the non-interactive Agg backend and create the
+    renderer which is used for all the plot jobs of this process
+    """
+    global _worker_renderer
+    import matplotlib.pyplot as plt
+    plt.switch_backend("Agg")
+    _worker_renderer = PlotRenderer()
+    atexit.register(_worker_renderer.close)
 
-    Or to get a group based on the second level, e.g. all 64 codes. Note that you need to use
-    the slice method from pandas. Use the slice(None) on the first level in order to capture the
-    all range, and slice(64, 64) to get the 64 levels only
 
+def render_plot_job(plot_job):
+    """
+    Render and save the figure of a plot job in a worker process
 
-    >>> sbi_64 = sbi.data.loc[(slice(None), slice(64, 64)), :]
-    >>> print(tabulate(sbi_64, headers="keys", tablefmt="psql"))
+    Parameters
+    ----------
+    plot_job: dict
+        The plot job as created by *StatLineTable.get_plot_job*
+
+    Returns
+    -------
+    str:
+        The file base name of the figure
+    """
+    if _worker_renderer is None:
+        render_plot(plot_job)
+    else:
+        _worker_renderer.render(plot_job)
+    return plot_job["file_base"]
+
+
+class SbiLookup(object):
+    """
+    Dense lookup table of the columns of the sbi data, indexed by the numerical sbi code
+
+    Parameters
+    ----------
+    columns: list
+        The names of the columns in the table, such as ['Grp', 'code', 'Label', 'group_key']
+    categories: list
+        The distinct values per column
+    table: np.ndarray
+        Integer array of shape (n_columns, SBI_DENSE_SIZE + 1) with the position of the value in
+        the categories of the column for each dense code position. Codes which are not in the sbi
+        data have -1. The last position is always -1 and belongs to the codes which can not be
+        stored in the table
+
+    Notes
+    -----
+    * The dense position of a code is given by *sbi_keys_to_positions* and is equal to the five
+      digit code, so '74283' and '7428' are found at the positions 74283 and 74280. Looking up the
+      values of an array of codes is therefore one fancy index per column
+    * The table can be written to a npy file with *save* and read as a memory map with *load*,
+      such that many processes can share one table without parsing the sbi data themselves
+    * Create the lookup from the data of a *SbiInfo* with *SbiInfo.get_lookup*
+
+    Examples
+    --------
+
+    >>> sbi = SbiInfo(file_name)
+    >>> sbi.get_lookup().save("sbi_lookup.npy")
+
+    and in the worker processes
+
+    >>> lookup = SbiLookup.load("sbi_lookup.npy")
+    >>> groups = lookup.get_sbi_groups(code_array, columns="Grp")
+    """
+
+    __slots__ = ("columns", "categories", "table")
+
+    def __init__(self, columns, categories, table):
+        self.columns = list(columns)
+        self.categories = [np.asarray(values) for values in categories]
+        self.table = table
+
+    @classmethod
+    def from_data_frame(cls, data, level_names, columns=None):
+        """
+        Create the lookup from the sbi data of *SbiInfo*
+
+        Parameters
+        ----------
+        data: pd.DataFrame
+            The sbi data with the levels *level_names* as multi index
+        level_names: list
+            The names of the levels, such as ['Grp', 'L1', 'L2', 'L3', 'L4']
+        columns: list, optional
+            The columns to store. Default = None, which means the first level and all the columns
+
+        Returns
+        -------
+        SbiLookup:
+            The lookup
+
+        Raises
+        ------
+        ValueError:
+            In case the sbi data contains a code which does not fit in the dense table
+        """
+        if columns is None:
+            columns = level_names[:1] + list(data.columns)
+
+        # the main groups (A, B, etc) have no numerical code and are not stored. For a code which
+        # occurs more than once, the first row is used
+        data = data.reset_index()
+        data = data[data[level_names[1]] != 0]
+        keys = pack_sbi_levels(*[data[name].to_numpy(dtype=np.int64)
+                                 for name in level_names[1:]])
+        positions = sbi_keys_to_positions(keys)
+        does_not_fit = positions == SBI_DENSE_SIZE
+        if does_not_fit.any():
+            raise ValueError("The sbi codes {} do not fit in the dense lookup table".format(
+                data.loc[does_not_fit, level_names[1:]].values.tolist()))
+        positions, rows = np.unique(positions, return_index=True)
+
+        codes_per_column = list()
+        categories = list()
+        for column in columns:
+            codes, values = pd.factorize(data[column].to_numpy()[rows])
+            if (codes < 0).any():
+                # keep the missing values as a category of their own, such that -1 only means
+                # that the code is not in the sbi data
+                codes[codes < 0] = len(values)
+                values = np.append(np.asarray(values, dtype=object), np.nan)
+            codes_per_column.append(codes)
+            categories.append(np.asarray(values))
+
+        max_categories = max([len(values) for values in categories], default=0)
+        dtype = np.int16 if max_categories <= np.iinfo(np.int16).max else np.int32
+        table = np.full((len(columns), SBI_DENSE_SIZE + 1), -1, dtype=dtype)
+        for column_table, codes in zip(table, codes_per_column):
+            column_table[positions] = codes
+
+        return cls(columns=columns, categories=categories, table=table)
+
+    def save(self, file_name):
+        """
+        Write the table to a npy file and the columns and categories to a json file next to it
+
+        Parameters
+        ----------
+        file_name: Path
+            The name of the npy file. The json file gets the same name with the suffix '.json'
+        """
+        file_name = Path(file_name)
+        np.save(file_name, self.table, allow_pickle=False)
+        meta = dict(columns=self.columns,
+                    categories=[values.tolist() for values in self.categories],
+                    dtypes=[str(values.dtype) for values in self.categories])
+        with open(file_name.with_suffix(".json"), "w") as stream:
+            json.dump(meta, stream)
+
+    @classmethod
+    def load(cls, file_name, mmap_mode="r"):
+        """
+        Read the lookup written by *save*
+
+        Parameters
+        ----------
+        file_name: Path
+            The name of the npy file
+        mmap_mode: str or None, optional
+            The mode of the memory map of the table. Default = "r", which shares the pages of the
+            file between all processes reading it. Use None to read the table into memory
+
+        Returns
+        -------
+        SbiLookup:
+            The lookup
+        """
+        file_name = Path(file_name)
+        table = np.load(file_name, mmap_mode=mmap_mode, allow_pickle=False)
+        with open(file_name.with_suffix(".json"), "r") as stream:
+            meta = json.load(stream)
+        categories = [np.array(values, dtype=dtype)
+                      for values, dtype in zip(meta["categories"], meta["dtypes"])]
+        return cls(columns=meta["columns"], categories=categories, table=table)
+
+    def get_positions(self, code_array):
+        """ Get the dense positions of the sbi codes such as '72431' in the table """
+        return sbi_keys_to_positions(sbi_codes_to_keys(code_array))
+
+    def get_codes(self, positions, column):
+        """
+        Get the category codes of *column* at the dense *positions*
+
+        Parameters
+        ----------
+        positions: np.ndarray
+            The dense positions as obtained with *get_positions*
+        column: str
+            The name of the column
+
+        Returns
+        -------
+        np.ndarray:
+            The position of the value in the categories of the column, or -1 for the codes which
+            are not in the sbi data
+        """
+        return self.table[self.columns.index(column)][positions]
+
+    def get_values(self, positions, column):
+        """ Get the values of *column* at the dense *positions*, with nan for the missing codes """
+        return pd.api.extensions.take(self.categories[self.columns.index(column)],
+                                      self.get_codes(positions, column), allow_fill=True)
+
+    def get_sbi_groups(self, code_array, columns="Grp"):
+        """
+        Get the values of *columns* belonging to the sbi codes in *code_array*
+
+        Parameters
+        ----------
+        code_array: np.array
+            Array with strings with all the sbi numbers stored as 4 or 5 character strings or
+            byte-arrays. Examples of the elements: '72431', '2781'. The dots are not included.
+        columns: str or list
+            The column or columns to get
+
+        Returns
+        -------
+        nd.array
+            Array with the values of the column, or a 2D array in case a list of columns is given.
+            The codes which are not in the sbi data get a nan
+        """
+        code_keys = sbi_codes_to_keys(code_array)
+        positions = sbi_keys_to_positions(code_keys)
+
+        # all the columns have the same missing codes, so use the first one to report them
+        found = self.table[0][positions] >= 0
+        if not found.all():
+            missing = [unpack_sbi_key(key) for key in np.unique(code_keys[~found])]
+            logger.info("The following entries were missing in the sbi codes:\n"
+                        "{}".format(missing))
+
+        if isinstance(columns, str):
+            return self.get_values(positions, columns)
+        sbi_groups = pd.concat([pd.Series(self.get_values(positions, column))
+                                for column in columns], axis=1)
+        return sbi_groups.values
+
+
+class SbiGroupSpec(object):
+    """
+    Compiled specification of sbi groups, which assigns the groups to the rows of the sbi data
+
+    Parameters
+    ----------
+    names: list
+        The names of the groups, in the order of the specification
+    labels: list
+        The label per group, or None in case the group has no label
+    interval_lows: np.ndarray
+        The first packed key of each numerical range, such as '64.19' in '64.19-64.92'
+    interval_highs: np.ndarray
+        The last packed key of each numerical range
+    interval_groups: np.ndarray
+        The position of the group of each numerical range in *names*
+    main_lows: np.ndarray
+        The first main group of each range of main groups, such as 'A' in 'A-C'
+    main_highs: np.ndarray
+        The last main group of each range of main groups
+    main_groups: np.ndarray
+        The position of the group of each range of main groups in *names*
+    level_rules: list
+        Tuples (group position, levels) with the allowed values per level, or None for all values
+
+    Notes
+    -----
+    * Create the specification with *compile_sbi_group_spec* and apply it with
+      *SbiInfo.create_sbi_groups*
+    * The numerical ranges are compiled into inclusive intervals over the keys of
+      *pack_sbi_levels*, which sort in the order of the sbi codes. A row belongs to a range if its
+      key is between the bounds, so all the rows are tested against all the ranges at once
+    * A row which belongs to more than one group gets the last group of the specification, as if
+      *SbiInfo.create_sbi_group* was called for each group in turn
+    """
+
+    __slots__ = ("names", "labels", "interval_lows", "interval_highs", "interval_groups",
+                 "main_lows", "main_highs", "main_groups", "level_rules")
+
+    def __init__(self, names, labels, interval_lows, interval_highs, interval_groups,
+                 main_lows, main_highs, main_groups, level_rules):
+        self.names = list(names)
+        self.labels = list(labels)
+        self.interval_lows = np.asarray(interval_lows, dtype=np.int64)
+        self.interval_highs = np.asarray(interval_highs, dtype=np.int64)
+        self.interval_groups = np.asarray(interval_groups, dtype=np.int64)
+        self.main_lows = np.asarray(main_lows, dtype=object)
+        self.main_highs = np.asarray(main_highs, dtype=object)
+        self.main_groups = np.asarray(main_groups, dtype=np.int64)
+        self.level_rules = list(level_rules)
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_groups(cls, groups):
+        """
+        Compile the groups of a specification normalized by *normalize_sbi_group_spec*
+
+        Parameters
+        ----------
+        groups: list
+            The dict per group with the *name*, *label*, *indices* and *levels*
+
+        Returns
+        -------
+        SbiGroupSpec:
+            The compiled specification
+        """
+        intervals = list()
+        main_ranges = list()
+        level_rules = list()
+        for group, definition in enumerate(groups):
+            if definition["levels"] is not None:
+                level_rules.append((group, definition["levels"]))
+                continue
+            for index_range in definition["indices"]:
+                if re.match("^[A-Z]", index_range):
+                    main_ranges.extend([(low, high, group)
+                                        for low, high in sbi_main_range_to_bounds(index_range)])
+                else:
+                    intervals.append(sbi_range_to_keys(index_range) + (group,))
+
+        interval_lows, interval_highs, interval_groups = \
+            [list(values) for values in zip(*intervals)] if intervals else ([], [], [])
+        main_lows, main_highs, main_groups = \
+            [list(values) for values in zip(*main_ranges)] if main_ranges else ([], [], [])
+
+        return cls(names=[definition["name"] for definition in groups],
+                   labels=[definition["label"] for definition in groups],
+                   interval_lows=interval_lows, interval_highs=interval_highs,
+                   interval_groups=interval_groups, main_lows=main_lows, main_highs=main_highs,
+                   main_groups=main_groups, level_rules=level_rules)
+
+    def get_group_positions(self, data, level_names):
+        """
+        Get the group of each row of the sbi data
+
+        Parameters
+        ----------
+        data: pd.DataFrame
+            The sbi data with the levels *level_names* as multi index
+        level_names: list
+            The names of the levels, such as ['Grp', 'L1', 'L2', 'L3', 'L4']
+
+        Returns
+        -------
+        tuple:
+            Two arrays with the position of the group in *names* per row, or -1 for the rows
+            without a group. The second array only takes the groups with a label into account, as
+            the label of a row is kept if a later group without a label is assigned
+        """
+        index = data.index
+        levels = [index.get_level_values(name).to_numpy() for name in level_names]
+        keys = pack_sbi_levels(*[level.astype(np.int64) for level in levels[1:]])
+
+        # the coverage of all the rows by all the rules with one column per rule
+        covers = [(keys[:, np.newaxis] >= self.interval_lows) &
+                  (keys[:, np.newaxis] <= self.interval_highs)]
+        rule_groups = [self.interval_groups]
+        if len(self.main_groups) > 0:
+            main_groups = levels[0].astype(object)[:, np.newaxis]
+            covers.append((main_groups >= self.main_lows) & (main_groups <= self.main_highs))
+            rule_groups.append(self.main_groups)
+        for group, rule_levels in self.level_rules:
+            mask = np.ones(len(keys), dtype=bool)
+            for level, values in zip(levels, rule_levels):
+                if values is not None:
+                    mask &= np.isin(level, values)
+            covers.append(mask[:, np.newaxis])
+            rule_groups.append([group])
+        covers = np.hstack(covers)
+        rule_groups = np.concatenate(rule_groups).astype(np.int64)
+
+        # the groups are applied in order, so the last group of a row is the one with the highest
+        # position
+        has_label = np.array([label is not None for label in self.labels] + [False])
+        positions = list()
+        for groups in (rule_groups, np.where(has_label[rule_groups], rule_groups, -1)):
+            if covers.shape[1] > 0:
+                positions.append(np.where(covers, groups, -1).max(axis=1))
+            else:
+                positions.append(np.full(len(keys), -1, dtype=np.int64))
+
+        return tuple(positions)
+
+
+def normalize_sbi_group_spec(group_spec):
+    """
+    Turn a specification of sbi groups into a list with one dict per group
+
+    Parameters
+    ----------
+    group_spec: dict or str
+        The definition per group name, or the name of a yaml file with this dict. See
+        *SbiInfo.create_sbi_groups*
+
+    Returns
+    -------
+    list:
+        The dict per group with the *name*, the *label* (or None), the *indices* as a list of
+        range strings and the *levels* as a list of five lists (or None for all values), or None
+        in case the group is defined by the indices
+    """
+    if isinstance(group_spec, (str, Path)):
+        with open(group_spec, "r") as stream:
+            group_spec = yaml.safe_load(stream)
+
+    level_keys = ["level_{}".format(cnt) for cnt in range(5)]
+    groups = list()
+    for name, definition in group_spec.items():
+        name = str(name)
+        if definition is None:
+            definition = dict()
+        elif isinstance(definition, str):
+            definition = dict(label=definition)
+        elif not isinstance(definition, dict):
+            raise ValueError("The definition of sbi group {} should be None, a label or a dict, "
+                             "not {}".format(name, definition))
+        unknown = set(definition.keys()).difference(["label", "indices"] + level_keys)
+        if unknown:
+            raise ValueError("Unknown keys {} in the definition of sbi group {}"
+                             "".format(sorted(unknown), name))
+
+        levels = list()
+        for level_key in level_keys:
+            values = definition.get(level_key)
+            if values is not None:
+                if isinstance(values, (str, int, np.integer)):
+                    # make sure the level is a list, even only one value is given
+                    values = [values]
+                values = [value if isinstance(value, str) else int(value) for value in values]
+            levels.append(values)
+        if all(values is None for values in levels):
+            levels = None
+
+        indices = definition.get("indices")
+        if indices is None:
+            # the name of the group gives the range, such as '64.19-64.92'
+            indices = [name]
+        elif isinstance(indices, str):
+            indices = [indices]
+        indices = [str(index_range) for index_range in indices]
+
+        label = definition.get("label")
+        groups.append(dict(name=name, label=None if label is None else str(label),
+                           indices=indices if levels is None else None, levels=levels))
+
+    return groups
+
+
+def compile_sbi_group_spec(group_spec):
+    """
+    Compile a specification of sbi groups, or get it from the cache of compiled specifications
+
+    Parameters
+    ----------
+    group_spec: dict or str
+        The definition per group name, or the name of a yaml file with this dict. See
+        *SbiInfo.create_sbi_groups*
+
+    Returns
+    -------
+    SbiGroupSpec:
+        The compiled specification
+
+    Notes
+    -----
+    * The cache keeps the *SBI_GROUP_SPEC_CACHE_SIZE* most recently used specifications
+    """
+    groups = normalize_sbi_group_spec(group_spec)
+    spec_hash = hashlib.sha256(json.dumps(groups).encode("utf-8")).hexdigest()
+    try:
+        spec = _sbi_group_specs[spec_hash]
+    except KeyError:
+        spec = SbiGroupSpec.from_groups(groups)
+        _sbi_group_specs[spec_hash] = spec
+        if len(_sbi_group_specs) > SBI_GROUP_SPEC_CACHE_SIZE:
+            _sbi_group_specs.popitem(last=False)
+    else:
+        _sbi_group_specs.move_to_end(spec_hash)
+    return spec
+
+
+class SbiInfo(object):
+    """
+    Class to read the sbi coding as stored in the excel data file found on the intranet which can
+    subsequently be used to classify sbi codes into there groups
+
+    Parameters
+    ----------
+    file_name: str
+        Name of the excel file containing the Sbi codes
+    cache_filename: str, optional
+        Dump the data file to cache in order to improve reading time. Default = 'sbi_codes_df'
+    cache_filetype: str, optional
+        Type of the cache file. Default = '.pkl'
+    reset_cache: bool, optional
+        If true, force the reading of the original Excel file in stead of the cache
+    code_key: str, optional
+        Name of the column containing the full key of the sbi. Default = 'code'
+    label_key: str, optional
+        Name of the label with the sbi description. Default = 'Label'
+    compression: str
+        Type of compression to use when writing the pickle file. Default is *zip*
+
+    Attributes
+    ----------
+    data: pd.Dataframe
+        DataFrame that get the sbi codes
+
+    Notes
+    -----
+    * The SBI file can be downloaded from the intranet_ and is a excel file containing all the SBI
+      codes
+    * The main purpose of this class is to classify sbi codes obtained from a btw file into there
+      approriate group. The sbi codes are normally given as 5 digit string, e.g. '64191'. With
+      this class this can be directly related to group K.
+    * Also new user defined groups can be made from series of sbi codes, such as 'Banken'
+
+    Examples
+    --------
+
+    A minimal example of the loading of a SBI file is:
+
+    >>> file_name = '../../data/SBI 2008 versie 2018.xlsx'
+    >>> sbi = SbiInfo(file_name=file_name)
+
+    The Sbi code are now loaded to *data* attribute as a multiindex Pandas data frame.
+    To have a look at the data, use the standard Pandas tools, such as *head*:
+
+    >>> print(tabulate(sbi.data.head(20), headers="keys", tablefmt="psql"))
+    +-------------------+---------+--------------------------------------------------------------------------+
+    |                   | code    | Label                                                                    |
+    |-------------------+---------+--------------------------------------------------------------------------|
+    | ('A', 0, 0, 0, 0) | A       | Landbouw, bosbouw en visserij                                            |
+    | ('A', 1, 0, 0, 0) | 01      | Landbouw, jacht en dienstverlening voor de landbouw en jacht             |
+    | ('A', 1, 1, 0, 0) | 01.1    | Teelt van eenjarige gewassen                                             |
+    | ('A', 1, 1, 1, 0) | 01.11   | Teelt van granen, peulvruchten en oliehoudende zaden                     |
+    | ('A', 1, 1, 3, 0) | 01.13   | Teelt van groenten en wortel- en knolgewassen                            |
+    | ('A', 1, 1, 3, 1) | 01.13.1 | Teelt van groenten in de volle grond                                     |
+    | ('A', 1, 1, 3, 2) | 01.13.2 | Teelt van groenten onder glas                                            |
+    | ('A', 1, 1, 3, 3) | 01.13.3 | Teelt van paddenstoelen                                                  |
+    | ('A', 1, 1, 3, 4) | 01.13.4 | Teelt van aardappels en overige wortel- en knolgewassen                  |
+    | ('A', 1, 1, 6, 0) | 01.16   | Teelt van vezelgewassen                                                  |
+    | ('A', 1, 1, 9, 0) | 01.19   | Teelt van overige eenjarige gewassen                                     |
+    | ('A', 1, 1, 9, 1) | 01.19.1 | Teelt van snijbloemen en snijheesters in de volle grond                  |
+    | ('A', 1, 1, 9, 2) | 01.19.2 | Teelt van snijbloemen en snijheesters onder glas                         |
+    | ('A', 1, 1, 9, 3) | 01.19.3 | Teelt van voedergewassen                                                 |
+    | ('A', 1, 1, 9, 9) | 01.19.9 | Teelt van overige eenjarige gewassen (rest)                              |
+    | ('A', 1, 2, 0, 0) | 01.2    | Teelt van meerjarige gewassen                                            |
+    | ('A', 1, 2, 1, 0) | 01.21   | Druiventeelt                                                             |
+    | ('A', 1, 2, 4, 0) | 01.24   | Teelt van appels, peren, pruimen, kersen en andere pit- en steenvruchten |
+    | ('A', 1, 2, 4, 1) | 01.24.1 | Teelt van appels en peren                                                |
+    | ('A', 1, 2, 4, 2) | 01.24.2 | Teelt van steenvruchten                                                  |
+    +-------------------+---------+--------------------------------------------------------------------------+
+
+
+    It is now easy to get a group, e.g. "F"
+
+    >>> sbi_F = sbi.data.loc["F"]
+    >>> print(tabulate(sbi_F.head(5), headers="keys", tablefmt="psql"))
+    +---------------+--------+---------------------------------------------------------------+
+    |               | code   | Label                                                         |
+    |---------------+--------+---------------------------------------------------------------|
+    | (0, 0, 0, 0)  | F      | Bouwnijverheid                                                |
+    | (41, 0, 0, 0) | 41     | Algemene burgerlijke en utiliteitsbouw en projectontwikkeling |
+    | (41, 1, 0, 0) | 41.1   | Projectontwikkeling                                           |
+    | (41, 2, 0, 0) | 41.2   | Algemene burgerlijke en utiliteitsbouw                        |
+    | (42, 0, 0, 0) | 42     | Grond-, water- en wegenbouw (geen grondverzet)                |
+    +---------------+--------+---------------------------------------------------------------+
+
+
+    Or to get a group based on the second level, e.g. all 64 codes. Note that you need to use
+    the slice method from pandas. Use the slice(None) on the first level in order to capture the
+    all range, and slice(64, 64) to get the 64 levels only
+
+
+    >>> sbi_64 = sbi.data.loc[(slice(None), slice(64, 64)), :]
+    >>> print(tabulate(sbi_64, headers="keys", tablefmt="psql"))
     +--------------------+---------+-----------------------------------------------------------------+
     |                    | code    | Label                                                           |
     |--------------------+---------+-----------------------------------------------------------------|
@@ -1421,6 +3999,12 @@ class SbiInfo(object):
 
     It can be seen that the index *61* is expanded to all its subgroups.
 
+    A complete grouping of many groups is created at once with *create_sbi_groups*, which takes a
+    dict (or yaml file) with the definition per group name:
+
+    >>> sbi.create_sbi_groups({"10-12": "Voedingsindustrie", "26-27": "Elektrotechnische industrie",
+    ...                        "ICT": dict(label="ICT-sector", indices=["26.80", "61"])})
+
     The main purpose of the *SbiInfo* class is to convert series of SBI codes which are obtained
     from a data file into sbi class. Lets say we have a data frame with sbi codes which are stored
     as five digit elements
@@ -1476,6 +4060,10 @@ class SbiInfo(object):
         self.info = None
         self.levels = list()
         self.data = None
+        # the dense lookup of the columns of data, created by get_lookup
+        self.lookup = None
+        # the sorted codes of the rows of data, created by get_code_order
+        self.code_order = None
 
         try:
             file_extension = os.path.splitext(self.cache_filename)[1][1:]
@@ -1568,8 +4156,6 @@ class SbiInfo(object):
         xls_df.rename(columns={xls_df.columns[0]: self.code_key, xls_df.columns[1]: self.label_key},
                       inplace=True)
 
-        group_char = None
-
         # only if both the index and column contain a valid value this line can be processed.
         # To check this in one go, first change the index to a column, drop the lines with
         # at least one nan, and then convert the first column back to the index
@@ -1578,48 +4164,11 @@ class SbiInfo(object):
         # make sure the index is a string, not int (which could happen for the codes without '.'
         xls_df.index = xls_df.index.values.astype(str)
 
-        # create new columns to store the level values stored in *level_names* (L0, L1, L2, L3)
-        for name in self.level_names:
-            # use 0 for the non existing level, not nan, such that we can maintain integers (using
-            # nan will convert the format to floats)
-            xls_df[name] = 0
-
-        # loop over all the rows in the data base and see if we can get the level values
-        for code, label in xls_df.iterrows():
-            is_level0 = re.match("^\s*[a-zA-Z]", code)
-            if bool(is_level0):
-                # this is a row with the main character, indicating we are entering a new group
-                group_char = code.strip()
-                xls_df.loc[code, self.level_names[0]] = group_char
-            else:
-                # we have entered the group, now we assume we are analyse the code xx.xx.xx
-                # where the code can have zero dots, one dot, or two dots. Use strip to remove
-                # all the leading and trailing blancs
-                digits = [v.strip() for v in code.split('.')]
-
-                # always store the group character + the first digits of the code
-                xls_df.loc[code, self.level_names[0]] = group_char
-
-                # the fist digit stored as the first level
-                xls_df.loc[code, self.level_names[1]] = int(digits[0])
-
-                if len(digits) > 1:
-                    # in case we have at least two digits, also store the second level. See note
-                    # above that we can have two levels in this number
-                    if len(digits[1]) == 1:
-                        # in case we have a single digit, append a zero
-                        number = digits[1] + "0"
-                    elif len(digits[1]) == 2:
-                        number = digits[1]
-                    else:
-                        raise AssertionError("Should at max have two digits")
-
-                    xls_df.loc[code, self.level_names[2]] = int(number[0])
-                    xls_df.loc[code, self.level_names[3]] = int(number[1])
-
-                if len(digits) > 2:
-                    # in case we have at least three digits, also store the third level
-                    xls_df.loc[code, self.level_names[4]] = int(digits[2])
+        # get the level values for all the rows at once. Use 0 for the non existing level, not
+        # nan, such that we can maintain integers (using nan will convert the format to floats)
+        levels = sbi_codes_to_levels(xls_df.index.to_series())
+        for name, values in zip(self.level_names, levels):
+            xls_df[name] = values
 
         logger.debug("Turn all dicts into a multindex data frame")
         logger.debug(xls_df.head())
@@ -1728,6 +4277,7 @@ class SbiInfo(object):
         # put back the columns as index
         self.data.set_index(self.level_names, inplace=True, drop=True)
         self.data.sort_index(inplace=True)
+        self.lookup = None
 
         logger.debug("Done")
 
@@ -1766,61 +4316,85 @@ class SbiInfo(object):
         label_column_key: str
             Name of the column to store the group label. If it does not yet exist, create it
 
+        Notes
+        -----
+        * The group is compiled into a specification of one group and assigned with
+          *create_sbi_groups*. To create many groups, pass them to *create_sbi_groups* at once
         """
 
-        # the pandas slicer for creating slices on the index
-        ind_slice = pd.IndexSlice
-
-        # create empty column to store the group name if it does not yet exist
-        if name_column_key not in self.data.columns.values:
-            self.data[name_column_key] = ""
-        # create empty column to store the label name if it does not yet exist
-        if label_column_key is not None and label_column_key not in self.data.columns.values:
-            self.data[label_column_key] = ""
+        definition = dict(label=group_label, indices=indices, level_0=level_0, level_1=level_1,
+                          level_2=level_2, level_3=level_3, level_4=level_4)
+        self.create_sbi_groups({group_name: definition}, name_column_key=name_column_key,
+                               label_column_key=label_column_key)
 
-        levels = [level_0, level_1, level_2, level_3, level_4]
-        if sum([bool(l) for l in levels]) == 0:
-            # all the levels are None (therefore the sum is zero). Set levels to None
-            levels = None
+    def create_sbi_groups(self,
+                          group_spec,
+                          name_column_key="group_key",
+                          label_column_key="group_label"):
+        """
+        Create all the groups of a specification in one go
 
-        index_list = list()
-        if levels is not None:
-            # store all the level list passed via the input argument into a single list
-
-            # get all the levels of the level we want to make groups for.
-            level_sets = [set(self.data.index.get_level_values(lvl)) for lvl in range(len(levels))]
-            # loop over all the level passed via the input argument and  create a list of indices
-            # for each level. In case a level is None, just add all the indicides of that level
-            ind = list()
-            for cnt, level in enumerate(levels):
-                if level is None:
-                    # the level is None, so add all the indices of this level
-                    ind.append(level_sets[cnt])
-                else:
-                    if not isinstance(level, list):
-                        # make sure the level is a list, even only one value is given
-                        level = [level]
-                    # add all the indices for this level that intersect with our input level values
-                    ind.append(level_sets[cnt].intersection(set(level)))
-
-            # create a index to slice the data frame with
-            index_list.append(ind_slice[ind[0], ind[1], ind[2], ind[3], ind[4]])
-        elif indices is not None:
-            # not validated
-            for index_str in indices:
-                index_list.append(self.get_index_from_string(index_str))
-        else:
-            index_list.append(self.get_index_from_string(group_name))
+        Parameters
+        ----------
+        group_spec: dict or str
+            The definition per group name, or the name of a yaml file with this dict. The
+            definition of a group can be
+
+            * None: the group name is the range, such as '26-27', '64.19-64.92' or 'A-C'
+            * a str: the label of the group, where the group name is the range
+            * a dict with the optional keys *label*, *indices* (one range or a list of ranges)
+              and *level_0* up to *level_4*, as the arguments of *create_sbi_group*
+        name_column_key: str
+            Name of the column to store the group name. If it does not yet exist, create it
+        label_column_key: str
+            Name of the column to store the group label. If it does not yet exist, create it
 
-        # set all values of the name_column_key with the indices given by the levels to 'group_name'
-        for index in index_list:
-            self.data.loc[index, name_column_key] = group_name
+        Notes
+        -----
+        * The groups are assigned in the order of the specification, so a code which belongs to
+          more than one group gets the last one, just as with consecutive calls to
+          *create_sbi_group*
+        * The specification is compiled by *compile_sbi_group_spec* into intervals of packed keys,
+          which are tested against all the rows at once. The compiled specification is cached, so
+          a specification which is used again is not parsed again
+
+        Examples
+        --------
+
+        The groups can be given in a yaml file such as::
+
+            10-12: Voedings- en genotsmiddelenindustrie
+            26-27: Elektrotechnische industrie
+            64.19-64.92: Banken
+            ICT:
+                label: ICT-sector
+                indices: ["26.80", "61"]
+
+        >>> sbi.create_sbi_groups("sbi_groups.yml")
+        """
+        spec = compile_sbi_group_spec(group_spec)
 
-            # do the same for the label_column in case a group label has been passed via the input
-            if group_label is not None:
-                self.data.loc[index, label_column_key] = group_label
+        # create empty column to store the group name if it does not yet exist
+        if name_column_key not in self.data.columns.values:
+            self.data[name_column_key] = ""
+        # create empty column to store the label name if it does not yet exist
+        if label_column_key is not None and label_column_key not in self.data.columns.values:
+            self.data[label_column_key] = ""
+
+        groups, label_groups = spec.get_group_positions(self.data, self.level_names)
+
+        column_values = [(name_column_key, spec.names, groups)]
+        if label_column_key is not None:
+            column_values.append((label_column_key, spec.labels, label_groups))
+        for column_key, values, positions in column_values:
+            in_group = positions >= 0
+            column = self.data[column_key].to_numpy(dtype=object, copy=True)
+            column[in_group] = np.array(values, dtype=object)[positions[in_group]]
+            self.data[column_key] = column
 
-        # Done, now the data frame has labeled all the indices of sbi codes
+        # Done, now the data frame has labeled all the indices of sbi codes. The lookup has to be
+        # created again to include the new groups
+        self.lookup = None
         logger.debug("Done")
 
     def get_index_from_string(self, index_range):
@@ -1834,6 +4408,35 @@ class SbiInfo(object):
             # started with a number. Use the numerical string branch
             return self.get_index_from_numerical_string(index_range)
 
+    def get_code_order(self):
+        """
+        Get the rows of *data* sorted by their code, which is used to resolve ranges of codes
+
+        Returns
+        -------
+        dict:
+            The sorted packed keys of the levels L1 .. L4 (*keys*) with the row positions in this
+            order (*key_order*), and the sorted main groups (*main_groups*) with the row positions
+            in this order (*main_order*)
+
+        Notes
+        -----
+        * The order is stored in the *code_order* attribute and created again if the index of
+          *data* has been replaced, for instance by *merge_groups*
+        * As the keys sort as the codes, all the rows of a range of codes are a contiguous slice
+          of the sorted keys, which is found with two binary searches
+        """
+        index = self.data.index
+        if self.code_order is None or self.code_order["index"] is not index:
+            levels = [index.get_level_values(name).to_numpy() for name in self.level_names]
+            keys = pack_sbi_levels(*[level.astype(np.int64) for level in levels[1:]])
+            key_order = np.argsort(keys, kind="stable")
+            main_groups = levels[0].astype(str)
+            main_order = np.argsort(main_groups, kind="stable")
+            self.code_order = dict(index=index, keys=keys[key_order], key_order=key_order,
+                                   main_groups=main_groups[main_order], main_order=main_order)
+        return self.code_order
+
     def get_index_from_group_string(self, index_range):
         """
         Get the indices from the data dataframe usig the alphanumeric selection string
@@ -1850,34 +4453,17 @@ class SbiInfo(object):
             Multiindex of all the items that belong to the group
         """
 
-        # first check if we did not give group characters
-        match = re.match("([A-Z])([-[A-Z]*]*)", index_range)
-        assert match, "No match found at all for alphanumeric"
+        code_order = self.get_code_order()
+        main_groups = code_order["main_groups"]
 
-        fl = match.group(1)
-        make_range = False
-        try:
-            el = match.group(2)
-            # check if the next character is a dash. If so, make a range
-            if re.match("^-", el):
-                el = el[1:]
-                make_range = True
-        except IndexError:
-            el = None
-
-        ind = pd.IndexSlice
-
-        if el is None:
-            # only one char was given. Just return the indices for this character
-            index = self.data.loc[ind[fl], :].index
-        else:
-            # two chars are given, so return the indices for a range
-            if make_range:
-                index = self.data.loc[ind[fl:el], :].index
-            else:
-                index = self.data.loc[ind[list(index_range)], :].index
+        # each range of main groups is a slice of the sorted main groups
+        positions = list()
+        for first, last in sbi_main_range_to_bounds(index_range):
+            start = np.searchsorted(main_groups, first, side="left")
+            stop = np.searchsorted(main_groups, last, side="right")
+            positions.append(code_order["main_order"][start:stop])
 
-        return index
+        return self.data.index[np.unique(np.concatenate(positions))]
 
     def get_index_from_numerical_string(self, index_range):
         """
@@ -1894,59 +4480,22 @@ class SbiInfo(object):
         -------
         Index:
             Multiindex of all the items that belong to the group
-        """
 
-        match = re.match("([\d\.]+)([-[\d\.]*]*)", index_range)
-        assert match, "No match found at all"
+        Notes
+        -----
+        * The range is turned into the first and last packed key by *sbi_range_to_keys*, so the
+          rows of the range are found with two binary searches in the sorted keys of
+          *get_code_order*
+        """
 
-        sbi_code_start = match.group(1)
+        code_order = self.get_code_order()
+        first, last = sbi_range_to_keys(index_range)
 
-        inx = pd.IndexSlice
+        start = np.searchsorted(code_order["keys"], first, side="left")
+        stop = np.searchsorted(code_order["keys"], last, side="right")
+        positions = np.sort(code_order["key_order"][start:stop])
 
-        ii = sbi_code_to_indices(sbi_code_start)
-
-        sbi_code_end = match.group(2)
-        if sbi_code_end != "":
-            sbi_code_end = sbi_code_end[1:]
-            jj = sbi_code_to_indices(sbi_code_end)
-        else:
-            jj = None
-
-        if jj is None:
-            if ii[4] is not None:
-                index = self.data.loc[inx[:, ii[1], ii[2], ii[3], ii[4]], :].index
-            elif ii[3] is not None:
-                index = self.data.loc[inx[:, ii[1], ii[2], ii[3], :], :].index
-            elif ii[2] is not None:
-                index = self.data.loc[inx[:, ii[1], ii[2], :, :], :].index
-            elif ii[1] is not None:
-                index = self.data.loc[inx[:, ii[1], :, :, :], :].index
-            else:
-                raise AssertionError("Something is wrong here")
-        else:
-            # jj is defined as well. We need a range.
-            index = self.data.loc[inx[:, ii[1]:jj[1]], :].index
-            if ii[2] is not None and ii[2] > 0:
-                indexi2 = self.data.loc[inx[:, ii[1], :ii[2] - 1], :].index
-                index = index.difference(indexi2)
-            if ii[3] is not None and ii[3] > 0:
-                index3 = self.data.loc[inx[:, ii[1], ii[2], :ii[3] - 1], :].index
-                index = index.difference(index3)
-            if ii[4] is not None and ii[4] > 0:
-                index4 = self.data.loc[inx[:, ii[1], ii[2], :ii[3], :ii[4] - 1], :].index
-                index = index.difference(index4)
-
-            if jj[2] is not None:
-                indexj2 = self.data.loc[inx[:, jj[1], jj[2] + 1:], :].index
-                index = index.difference(indexj2)
-            if jj[3] is not None:
-                indexj3 = self.data.loc[inx[:, jj[1], jj[2], jj[3] + 1:], :].index
-                index = index.difference(indexj3)
-            if jj[4] is not None:
-                indexj4 = self.data.loc[inx[:, jj[1], jj[2], jj[3], jj[4] + 1:], :].index
-                index = index.difference(indexj4)
-
-        return index
+        return self.data.index[positions]
 
     def read_from_cache(self):
         """
@@ -2007,76 +4556,1081 @@ class SbiInfo(object):
           *name_column_key* parametr to this columns, and array of strings corresponding to these
           new groups is return
 
+        * The codes are converted to their position in the dense table of *get_lookup*, so the
+          values of each column are obtained with one fancy index, without a python loop over
+          the codes
+
         Returns
         -------
         nd.array
             Array with all the sbi groups names
         """
 
-        sbi_group = list()
-        for code_str in code_array:
-            try:
-                code_str = code_str.decode()
-            except AttributeError:
-                # probably already a proper string
-                pass
+        return self.get_lookup().get_sbi_groups(code_array, columns=columns)
 
-            # get the first two digits of the string
-            try:
-                main = int(code_str[0:2])
-            except (IndexError, ValueError):
-                main = 0
+    def get_lookup(self):
+        """
+        Get the dense lookup table of all the columns of the sbi data
 
-            # get the second pair of digits from the string. In case is does not exist, set 0
-            try:
-                second = int(code_str[2])
-            except (IndexError, ValueError):
-                second = 0
-            try:
-                third = int(code_str[3])
-            except (IndexError, ValueError):
-                third = 0
+        Returns
+        -------
+        SbiLookup:
+            The lookup of the first level and all the columns of *data*
+
+        Notes
+        -----
+        * The lookup is created on the first call and stored in the *lookup* attribute. It is
+          created again after *create_sbi_group* or *merge_groups* or when the columns of *data*
+          have changed. Changing the values of *data* directly requires to set *lookup* to None
+        * Use *SbiLookup.save* to share the lookup with other processes
+        """
+        columns = self.level_names[:1] + list(self.data.columns)
+        if self.lookup is None or self.lookup.columns != columns:
+            logger.debug("Creating the dense sbi lookup")
+            self.lookup = SbiLookup.from_data_frame(self.data, self.level_names, columns=columns)
+        return self.lookup
+
+
+def load_statline_tables(table_ids, workers=None, download_workers=None, **kwargs):
+    """
+    Read a batch of StatLine tables concurrently
+
+    Parameters
+    ----------
+    table_ids: list
+        The ids of the tables to read
+    workers: int, optional
+        Number of processes used to build the data frames of the tables. In case *workers* is 1,
+        all the tables are built in the current process. Default = None, which means the number
+        of processors
+    download_workers: int, optional
+        Number of threads used to download the json files of the tables. Default = None, which
+        means the same as *workers*
+    **kwargs:
+        The arguments passed to each *StatLineTable*, such as *cache_dir_name*, *cache_format* or
+        *source_dir*. All tables share the same cache directory
+
+    Returns
+    -------
+    tuple (dict, DataFrame):
+        The tables which have been read with the table id as key and a report with one row per
+        table id with the columns *download_time* and *build_time* in seconds, *status* and
+        *error*
+
+    Notes
+    -----
+    * The download of the json files is I/O bound and carried out in threads. The building of
+      the data frames is CPU bound and carried out in a process pool, after which the tables are
+      sent back to the current process
+    * A table which fails to download or build is reported in the *status* and *error* column of
+      the report, but does not abort the other tables
+
+    Examples
+    --------
+
+    Read two tables from a directory with json files dumped by *cbsodata.get_data*
+
+    >>> tables, report = load_statline_tables(["84410NED", "84408NED"], workers=2,
+    ...                                       source_dir="dumps")
+    >>> tables["84410NED"].question_df
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if download_workers is None:
+        download_workers = workers
+
+    # these arguments are set by the loader itself
+    for key in ("table_id", "lazy", "make_the_plots", "describe_the_data"):
+        if key in kwargs:
+            raise ValueError(f"The argument {key} can not be passed to load_statline_tables")
+
+    table_ids = list(collections.OrderedDict.fromkeys(table_ids))
+    report = pd.DataFrame(index=pd.Index(table_ids, name="table_id"),
+                          columns=["download_time", "build_time", "status", "error"])
+    report["status"] = "pending"
+
+    def record_failure(table_id, stage, err):
+        logger.warning(f"Failed to {stage} table {table_id}: {err}")
+        report.loc[table_id, "status"] = f"{stage} failed"
+        report.loc[table_id, "error"] = f"{type(err).__name__}: {err}"
+
+    # first get all the json files of the tables using threads
+    downloaded = list()
+    with ThreadPoolExecutor(max_workers=max(download_workers, 1)) as executor:
+        futures = collections.OrderedDict()
+        for table_id in table_ids:
+            futures[table_id] = executor.submit(download_statline_table, table_id, kwargs)
+        for table_id, future in futures.items():
             try:
-                fourth = int(code_str[4:])
-            except (IndexError, ValueError):
-                fourth = 0
-
-            # store the digits as tuples in a list (example : (1, 2, 2, 4))
-            sbi_group.append((main, second, third, fourth))
-
-        # create a multiindex array with all the indices obtained from the sbi codes
-        mi = pd.MultiIndex.from_tuples(sbi_group)
-        original_order = list(range(len(sbi_group)))
-        sbi_df = pd.DataFrame(original_order, index=mi, columns=["original_order"])
-        sbi_df.index.names = self.level_names[1:]
-
-        sbi_df_unique = sbi_df.sort_index()
-        sbi_df_unique.reset_index(inplace=True)
-        sbi_df_unique.drop_duplicates(subset=sbi_df.index.names, inplace=True)
-        sbi_df_unique.set_index(self.level_names[1:], inplace=True)
-        sbi_df_unique.sort_index(inplace=True)
-
-        # remove the first level of the sbi multindex data array which contains
-        # the alphanumeric character (A, B,) adn set that a column
-        data = self.data.reset_index()
-        not_a_main_sbi = data[self.level_names[1]] != 0
-        data = data[not_a_main_sbi]
-        data.set_index(self.level_names[1:], inplace=True)
-        data = data.sort_index()
-        data_sbi = data.reindex(sbi_df_unique.index)
-
-        diff = data_sbi.index.difference(data.index)
-        if diff.values.size > 0:
-            logger.info("The following entries were missing in the sbi codes:\n"
-                        "{}".format(diff.to_series().values))
+                report.loc[table_id, "download_time"] = future.result()
+            except Exception as err:
+                record_failure(table_id, "download", err)
+            else:
+                downloaded.append(table_id)
 
-        # now select all the indices using the multi-index. Note the sbi_group is as long as the
-        # size of the input string array *code_array*
-        codes = data_sbi.loc[sbi_group]
+    # then build the data frames in the process pool. The json files are in the cache now, so
+    # there is no need to download or check them again
+    build_kwargs = dict(kwargs)
+    if build_kwargs.pop("reset", False):
+        build_kwargs["reset_pickles"] = True
+    build_kwargs["check_upstream"] = False
 
-        sbi_groups = codes[columns]
+    tables = collections.OrderedDict()
 
-        return sbi_groups.values
+    def record_build(table_id, get_result):
+        try:
+            table, build_time = get_result()
+        except Exception as err:
+            record_failure(table_id, "build", err)
+        else:
+            tables[table_id] = table
+            report.loc[table_id, "build_time"] = build_time
+            report.loc[table_id, "status"] = "ok"
+
+    if workers > 1 and len(downloaded) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(downloaded))) as executor:
+            futures = collections.OrderedDict()
+            for table_id in downloaded:
+                futures[table_id] = executor.submit(build_statline_table, table_id, build_kwargs)
+            for table_id, future in futures.items():
+                record_build(table_id, future.result)
+    else:
+        for table_id in downloaded:
+            record_build(table_id, lambda: build_statline_table(table_id, build_kwargs))
+
+    n_failed = (report["status"] != "ok").sum()
+    logger.info(f"Read {len(tables)} tables, {n_failed} failed")
+
+    return tables, report
+
+
+def download_statline_table(table_id, table_kwargs):
+    """
+    Get the json files of a StatLine table into the cache
+
+    Parameters
+    ----------
+    table_id: str
+        The id of the table
+    table_kwargs: dict
+        The arguments passed to the *StatLineTable*
+
+    Returns
+    -------
+    float:
+        The time in seconds it took to get the json files
+    """
+    start = time.time()
+    table = StatLineTable(table_id=table_id, lazy=True, **table_kwargs)
+    table.materialize(stages=["raw"])
+    return time.time() - start
+
+
+def build_statline_table(table_id, table_kwargs):
+    """
+    Build the data frames of a StatLine table of which the json files are in the cache
+
+    Parameters
+    ----------
+    table_id: str
+        The id of the table
+    table_kwargs: dict
+        The arguments passed to the *StatLineTable*
+
+    Returns
+    -------
+    tuple (StatLineTable, float):
+        The table and the time in seconds it took to build it
+    """
+    start = time.time()
+    table = StatLineTable(table_id=table_id, lazy=True, **table_kwargs)
+    table.materialize()
+    # the raw data set is not needed anymore and does not have to be sent to the main process
+    table.typed_data_set = None
+    return table, time.time() - start
+
+
+@contextlib.contextmanager
+def sql_transaction(connection):
+    """
+    Context manager which carries out all the statements in a single sqlite transaction
+
+    The transaction is committed at the end of the block or rolled back in case of an exception.
+    The connection must be opened with *isolation_level=None*, such that sqlite3 does not start and
+    commit the transactions implicitly
+
+    Parameters
+    ----------
+    connection: sqlite3.Connection
+        The connection to the database
+    """
+    connection.execute("BEGIN")
+    try:
+        yield connection
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+    else:
+        connection.execute("COMMIT")
+
+
+def quote_sql_name(name):
+    """ Quote a table or column name for a sqlite statement """
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def get_sql_type(column):
+    """
+    Get the sqlite type of a column in the same way as *DataFrame.to_sql* does
+
+    Parameters
+    ----------
+    column: pd.Series
+        The column of the data frame
+
+    Returns
+    -------
+    str:
+        The sqlite type: INTEGER, REAL or TEXT
+    """
+    inferred_type = pd.api.types.infer_dtype(column, skipna=True)
+    if inferred_type in ("integer", "boolean"):
+        return "INTEGER"
+    elif inferred_type in ("floating", "mixed-integer-float", "decimal"):
+        return "REAL"
+    return "TEXT"
+
+
+def get_sql_values(column, sql_type):
+    """
+    Get the values of a column as a list of python objects which can be inserted by sqlite3
+
+    Parameters
+    ----------
+    column: pd.Series
+        The column of the data frame
+    sql_type: str
+        The sqlite type of the column as obtained by *get_sql_type*
+
+    Returns
+    -------
+    list:
+        The values of the column with the missing values replaced by None
+    """
+    # converting a numeric column to objects gives python types, but an object column may still
+    # contain numpy scalars which can not be stored by sqlite3
+    values = column.to_numpy(dtype=object)
+    missing = pd.isna(values)
+    if missing.any():
+        values[missing] = None
+
+    if sql_type == "INTEGER":
+        convert = int
+    elif sql_type == "REAL":
+        convert = float
+    else:
+        convert = None
+
+    if convert is not None and not set(map(type, values)).issubset(SQL_PYTHON_TYPES):
+        return [None if value is None else convert(value) for value in values]
+
+    return values.tolist()
+
+
+def write_sql_table(connection, table_name, data_frame, if_exists="replace",
+                    index_columns=None, replace_columns=None):
+    """
+    Write a data frame to a sqlite table with a single *executemany*
+
+    Parameters
+    ----------
+    connection: sqlite3.Connection
+        The connection to the database
+    table_name: str
+        The name of the table
+    data_frame: pd.DataFrame
+        The data to write. The index is written as well, in the same way as *DataFrame.to_sql*
+    if_exists: {"replace", "append"}, optional
+        Replace the table in case it exists already, or append the rows. Default = "replace"
+    index_columns: list, optional
+        List of column lists. For each column list an index is created on the table.
+        Default = None
+    replace_columns: list, optional
+        Only used to append. Rows in the table with the same values in these columns as one of the
+        rows of the data frame are deleted first, such that e.g. a period can be updated.
+        Default = None, which means that all rows are appended
+
+    Returns
+    -------
+    int:
+        The number of rows written
+
+    Notes
+    -----
+    * The statements are not committed. Use *sql_transaction* to carry out the writing in a
+      single transaction
+    """
+    if if_exists not in ("replace", "append"):
+        raise ValueError(f"if_exists must be replace or append. Found {if_exists}")
+
+    data = data_frame.reset_index()
+    columns = list(data.columns)
+    table = quote_sql_name(table_name)
+    column_names = ", ".join([quote_sql_name(column) for column in columns])
+
+    table_exists = connection.execute("SELECT name FROM sqlite_master "
+                                      "WHERE type='table' AND name=?",
+                                      (table_name,)).fetchone() is not None
+
+    sql_types = [get_sql_type(data[column]) for column in columns]
+
+    if table_exists and if_exists == "replace":
+        connection.execute(f"DROP TABLE {table}")
+        table_exists = False
+
+    if not table_exists:
+        column_definitions = ", ".join([" ".join([quote_sql_name(column), sql_type])
+                                        for column, sql_type in zip(columns, sql_types)])
+        connection.execute(f"CREATE TABLE {table} ({column_definitions})")
+    else:
+        existing_columns = [row[1] for row in connection.execute(f"PRAGMA table_info({table})")]
+        missing_columns = [column for column in columns if column not in existing_columns]
+        if missing_columns:
+            raise ValueError(f"Can not append to {table_name}: columns {missing_columns} do not "
+                             f"exist in the table")
+        if replace_columns:
+            # delete the rows which are going to be replaced using a temporary table with the
+            # unique values of the replace columns
+            replace_names = ", ".join([quote_sql_name(column) for column in replace_columns])
+            replace_values = data[replace_columns].drop_duplicates()
+            connection.execute("DROP TABLE IF EXISTS temp._replace_keys")
+            connection.execute(f"CREATE TEMP TABLE _replace_keys ({replace_names})")
+            connection.executemany(
+                f"INSERT INTO temp._replace_keys VALUES "
+                f"({', '.join(['?'] * len(replace_columns))})",
+                zip(*[get_sql_values(replace_values[column],
+                                     get_sql_type(replace_values[column]))
+                      for column in replace_columns]))
+            # use IS instead of = (or IN) such that missing dimension values are matched as well
+            matches = " AND ".join([f"keys.{quote_sql_name(column)} IS "
+                                    f"{table}.{quote_sql_name(column)}"
+                                    for column in replace_columns])
+            connection.execute(f"DELETE FROM {table} WHERE EXISTS "
+                               f"(SELECT 1 FROM temp._replace_keys AS keys WHERE {matches})")
+            connection.execute("DROP TABLE temp._replace_keys")
+
+    rows = zip(*[get_sql_values(data[column], sql_type)
+                 for column, sql_type in zip(columns, sql_types)])
+    connection.executemany(f"INSERT INTO {table} ({column_names}) "
+                           f"VALUES ({', '.join(['?'] * len(columns))})", rows)
+
+    if index_columns is not None:
+        for index_column_list in index_columns:
+            index_column_list = [column for column in index_column_list if column in columns]
+            if not index_column_list:
+                continue
+            index_name = quote_sql_name("_".join(["ix", table_name] + list(index_column_list)))
+            index_names = ", ".join([quote_sql_name(column) for column in index_column_list])
+            connection.execute(f"CREATE INDEX IF NOT EXISTS {index_name} "
+                               f"ON {table} ({index_names})")
+
+    return len(data)
+
+
+def get_file_hash(file_name, block_size=1 << 20):
+    """
+    Calculate the sha256 hash of the content of a file
+
+    Parameters
+    ----------
+    file_name: str or Path
+        Name of the file
+    block_size: int, optional
+        Number of bytes to read at once. Default = 1 MB
+
+    Returns
+    -------
+    str:
+        The hex digest of the file content
+    """
+    file_hash = hashlib.sha256()
+    with open(file_name, "rb") as stream:
+        for block in iter(lambda: stream.read(block_size), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def compact_data_frame(data_frame, value_key=None, datatype_key=None, max_unique_fraction=0.5):
+    """
+    Convert the columns of a data frame to the smallest dtype which holds the data without loss
+
+    Parameters
+    ----------
+    data_frame: pd.DataFrame
+        The data frame to compact
+    value_key: str, optional
+        The column with the values. Default = None
+    datatype_key: str, optional
+        The column with the StatLine data type of the values, such as Double or Integer.
+        Default = None
+    max_unique_fraction: float, optional
+        Only convert the string columns of which the number of unique values is at most this
+        fraction of the number of rows to a category. Default = 0.5
+
+    Returns
+    -------
+    pd.DataFrame:
+        The compacted data frame. The index and the input data frame are not modified
+
+    Notes
+    -----
+    * The object columns with only integers are converted to the smallest integer type. The
+      other object columns with repeated values, such as the titles, keys and units which are
+      copied for each dimension value, are converted to a category
+    * The values are converted to the smallest integer type in case the data type of all values
+      is an integer type, such as Integer or Long, and no value is missing. Otherwise, the values
+      are stored as float32 in case this gives exactly the same values, or as float64
+    """
+    columns = collections.OrderedDict()
+    n_rows = len(data_frame)
+    for column_name, column in data_frame.items():
+        if column_name == value_key:
+            if datatype_key in data_frame.columns:
+                datatypes = set(data_frame[datatype_key].dropna().unique())
+            else:
+                datatypes = set()
+            column = compact_values(column, all_integers=bool(datatypes) and
+                                    datatypes.issubset(STATLINE_INTEGER_TYPES),
+                                    max_unique_fraction=max_unique_fraction)
+        elif column.dtype == object:
+            inferred_type = pd.api.types.infer_dtype(column, skipna=True)
+            if inferred_type == "integer" and not column.isnull().any():
+                column = pd.to_numeric(column, downcast="integer")
+            elif n_rows > 0 and column.nunique(dropna=True) <= max_unique_fraction * n_rows:
+                column = column.astype("category")
+        elif column.dtype.kind in "iu":
+            column = pd.to_numeric(column, downcast="integer")
+        columns[column_name] = column
+
+    return pd.DataFrame(columns, index=data_frame.index)
+
+
+def compact_values(column, all_integers=False, max_unique_fraction=0.5):
+    """
+    Convert a column with values to the smallest numeric dtype which holds them without loss
+
+    Parameters
+    ----------
+    column: pd.Series
+        The values
+    all_integers: bool, optional
+        The data type of all the values is an integer type. Default = False
+    max_unique_fraction: float, optional
+        A column which can not be converted to numbers is converted to a category in case the
+        number of unique values is at most this fraction of the number of rows. Default = 0.5
+
+    Returns
+    -------
+    pd.Series:
+        The converted values
+    """
+    if column.dtype == object:
+        inferred_type = pd.api.types.infer_dtype(column, skipna=True)
+        if inferred_type not in ("integer", "floating", "mixed-integer-float", "empty"):
+            if len(column) > 0 and column.nunique(dropna=True) <= max_unique_fraction * len(column):
+                column = column.astype("category")
+            return column
+        column = pd.to_numeric(column)
+
+    if column.dtype.kind not in "iuf":
+        return column
+
+    values = column.to_numpy()
+    if all_integers and column.dtype.kind == "f":
+        if not np.isnan(values).any() and (values == np.round(values)).all():
+            column = column.astype(np.int64)
+            values = column.to_numpy()
+
+    if column.dtype.kind in "iu":
+        return pd.to_numeric(column, downcast="integer")
+
+    values_32 = values.astype(np.float32)
+    if np.array_equal(values_32.astype(values.dtype), values, equal_nan=True):
+        return column.astype(np.float32)
+
+    return column
+
+
+def write_arrow_data_frame(data_frame, file_name, file_format="parquet"):
+    """
+    Write a data frame to a parquet or feather file
+
+    Parameters
+    ----------
+    data_frame: pd.DataFrame
+        The data frame to write
+    file_name: str or Path
+        Name of the output file
+    file_format: {"parquet", "feather"}
+        Format of the output file. Default = "parquet"
+
+    Notes
+    -----
+    * The index is stored as normal columns, such that the rows can be filtered on the index
+      levels while reading. The names of the index columns are stored in the schema metadata
+    * Feather files are stored uncompressed, such that they can be memory-mapped
+    """
+    index_names = list(data_frame.index.names)
+    if isinstance(data_frame.index, pd.MultiIndex):
+        index_dtypes = [str(level.dtype) for level in data_frame.index.levels]
+    else:
+        index_dtypes = [str(data_frame.index.dtype)]
+    data_frame = data_frame.reset_index()
+    index_columns = [str(name) for name in data_frame.columns[:len(index_names)]]
+
+    table = pa.Table.from_pandas(data_frame, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[ARROW_INDEX_METADATA_KEY] = json.dumps(dict(index_columns=index_columns,
+                                                         index_names=index_names,
+                                                         index_dtypes=index_dtypes)).encode()
+    table = table.replace_schema_metadata(metadata)
+
+    if file_format == "parquet":
+        pq.write_table(table, str(file_name))
+    elif file_format == "feather":
+        feather.write_feather(table, str(file_name), compression="uncompressed")
+    else:
+        raise ValueError(f"file_format must be parquet or feather. Found {file_format}")
+
+
+def read_arrow_data_frame(file_name, file_format="parquet", columns=None, filters=None,
+                          memory_map=True):
+    """
+    Read a data frame written by *write_arrow_data_frame*
+
+    Parameters
+    ----------
+    file_name: str or Path
+        Name of the parquet or feather file
+    file_format: {"parquet", "feather"}
+        Format of the file. Default = "parquet"
+    columns: list, optional
+        Only read these columns. The index columns are always read. Default = None (all columns)
+    filters: list, optional
+        Only read the rows which match the filters, given in the form of
+        *pyarrow.parquet.read_table*, e.g. [("L0", "==", 15)]. Default = None
+    memory_map: bool, optional
+        Memory-map the file. Default = True
+
+    Returns
+    -------
+    pd.DataFrame:
+        The data frame with the original index restored
+
+    Notes
+    -----
+    * Columns which had the object dtype (such as the level columns with integers and None) are
+      converted back to the object dtype
+    """
+    file_name = str(file_name)
+    if file_format == "parquet":
+        schema = pq.read_schema(file_name, memory_map=memory_map)
+    elif file_format == "feather":
+        with pa.memory_map(file_name, "r") as source:
+            schema = pa.ipc.open_file(source).schema
+    else:
+        raise ValueError(f"file_format must be parquet or feather. Found {file_format}")
+
+    index_info = json.loads(schema.metadata[ARROW_INDEX_METADATA_KEY].decode())
+    index_columns = index_info["index_columns"]
+
+    if columns is not None:
+        columns = index_columns + [col for col in columns
+                                   if col in schema.names and col not in index_columns]
+
+    if file_format == "parquet":
+        table = pq.read_table(file_name, columns=columns, filters=filters,
+                              memory_map=memory_map)
+    else:
+        table = feather.read_table(file_name, columns=columns, memory_map=memory_map)
+        if filters is not None:
+            table = table.filter(pq.filters_to_expression(filters))
+
+    data_frame = table.to_pandas()
+
+    # restore the columns which were stored as objects in the original data frame. The integer
+    # index levels with missing values are restored as objects as well, such that the levels of
+    # the multi index get integer values again
+    integer_columns = [name for name, dtype in zip(index_columns, index_info["index_dtypes"])
+                       if dtype.startswith("int")]
+    for column_info in schema.pandas_metadata["columns"]:
+        name = column_info["name"]
+        if name not in data_frame.columns:
+            continue
+        if column_info["numpy_type"] != "object" and name not in integer_columns:
+            continue
+        column = data_frame[name]
+        if column.dtype == object:
+            continue
+        is_null = column.isnull().values
+        if column_info["pandas_type"] == "int64" or name in integer_columns:
+            values = column.fillna(0).astype(np.int64).values.astype(object)
+        else:
+            values = column.values.astype(object)
+        values[is_null] = None
+        data_frame[name] = values
+
+    data_frame.set_index(index_columns, inplace=True, drop=True)
+    data_frame.index.names = index_info["index_names"]
+
+    return data_frame
+
+
+def iter_json_array(file_name, chunk_size=65536):
+    """
+    Iterate over the items of the array stored in a json file without loading the whole file
+
+    Parameters
+    ----------
+    file_name: str or Path
+        The json file. The file either contains an array, or an object with the array stored in the
+        *value* field, as returned by the OData api
+    chunk_size: int, optional
+        Number of bytes which are read from the file at once. Default = 65536
+
+    Yields
+    ------
+    object:
+        The items of the array
+
+    Notes
+    -----
+    * If the *ijson* module is installed this is used for parsing. Otherwise the items are decoded
+      one by one with the *raw_decode* method of the standard json decoder
+    * The file is opened once in binary mode, as ijson parses the bytes directly. For the
+      standard json decoder the bytes are decoded as utf-8 text
+    """
+    with open(file_name, "rb") as byte_stream:
+        first_char = byte_stream.read(1)
+        while first_char.isspace():
+            first_char = byte_stream.read(1)
+        byte_stream.seek(0)
+
+        if first_char == b"[":
+            prefix = "item"
+        elif first_char == b"{":
+            prefix = "value.item"
+        else:
+            raise ValueError(f"No json array found in {file_name}")
+
+        if ijson is not None:
+            yield from ijson.items(byte_stream, prefix, buf_size=chunk_size, use_float=True)
+            return
+
+        stream = io.TextIOWrapper(byte_stream, encoding="utf-8")
+        decoder = json.JSONDecoder()
+        buffer = ""
+        position = 0
+        end_of_file = False
+
+        def read_chunk():
+            """ Append the next chunk to the buffer and drop the part which has been parsed """
+            nonlocal buffer, position, end_of_file
+            if end_of_file:
+                raise ValueError(f"Incomplete json array in {file_name}")
+            chunk = stream.read(chunk_size)
+            end_of_file = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+
+        def skip(characters=""):
+            """ Move the position over the white space and the *characters* """
+            nonlocal position
+            while True:
+                while position < len(buffer) and (buffer[position].isspace() or
+                                                  buffer[position] in characters):
+                    position += 1
+                if position < len(buffer) or end_of_file:
+                    return
+                read_chunk()
+
+        def decode_value():
+            """ Decode the value at the position and move the position to the end of it """
+            nonlocal position
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    value, end = None, None
+                if end is None or (not end_of_file and (end == len(buffer) or
+                                                        buffer[end] in NUMBER_CHARACTERS)):
+                    # the value is not complete yet, or it is a number which may continue in the
+                    # next chunk, such as '2' of '2.5'. Read the next chunk and try again
+                    read_chunk()
+                    continue
+                position = end
+                return value
+
+        # move the position to the first item of the array. For an object, the keys of the top
+        # level are decoded one by one until the 'value' key is found, such that a 'value' in one
+        # of the other fields is skipped
+        skip()
+        position += 1
+        if prefix == "value.item":
+            while True:
+                skip(",")
+                if position >= len(buffer) or buffer[position] != '"':
+                    raise ValueError(f"No json array found in {file_name}")
+                key = decode_value()
+                skip(":")
+                if key == "value":
+                    if position >= len(buffer) or buffer[position] != "[":
+                        raise ValueError(f"No json array found in {file_name}")
+                    position += 1
+                    break
+                decode_value()
+
+        while True:
+            # skip the white space and the comma's between the items
+            skip(",")
+            if position >= len(buffer):
+                raise ValueError(f"Incomplete json array in {file_name}")
+            if buffer[position] == "]":
+                break
+            yield decode_value()
+
+def copy_question_dfs(question_dfs):
+    """ Copy the data frame or the list of data frames returned by *get_question_df* """
+    if isinstance(question_dfs, list):
+        return [question_df.copy() for question_df in question_dfs]
+    return question_dfs.copy()
+
+
+def add_new_keys(columns, indicator):
+    """
+    Append the keys of the *indicator* dict which are not yet in the *columns* list
+
+    Parameters
+    ----------
+    columns: list
+        List of column names, which is extended in place
+    indicator: dict
+        A block of the DataProperties json file
+    """
+    for key in indicator.keys():
+        if key not in columns:
+            columns.append(key)
+
+
+def records_to_data_frame(records, columns, n_blocks):
+    """
+    Turn a dict of records into a DataFrame with one row per record
+
+    Parameters
+    ----------
+    records: OrderedDict
+        The records per row label in the order in which they were found
+    columns: list
+        The column names of the data frame
+    n_blocks: int
+        The number of blocks which were used to fill the records
+
+    Returns
+    -------
+    pd.DataFrame:
+        Data frame with the records as rows and all values stored as objects
+
+    Notes
+    -----
+    * The row order is the same as the order obtained by filling a data frame with the initial
+      index 1 .. *n_blocks* - 1 cell by cell: the labels inside this range are sorted, the labels
+      outside the range are appended in the order they were found
+    """
+    initial_labels = range(1, n_blocks)
+    labels = sorted([label for label in records.keys() if label in initial_labels])
+    labels += [label for label in records.keys() if label not in initial_labels]
+
+    return pd.DataFrame([records[label] for label in labels], index=labels, columns=columns,
+                        dtype=object)
+
+
+def sbi_codes_to_levels(codes):
+    """
+    Get the levels of the hierarchy of the sbi codes as found in the sbi excel file
+
+    Parameters
+    ----------
+    codes: pd.Series
+        The codes of the excel file in the order of the file, such as 'A', '01', '01.1', '01.11'
+        and '01.13.1'
+
+    Returns
+    -------
+    list:
+        An array per level: the group character and the levels L1 .. L4 as integers. A level
+        which is not given by the code is 0
+
+    Raises
+    ------
+    AssertionError:
+        In case the number after the first dot has more than two digits
+
+    Notes
+    -----
+    * A code starting with a character opens a new group. The group of the other codes is found
+      by forward filling the group characters
+    * The code is split on the dots. The first number gives L1. The number after the first dot
+      gives L2 and L3, where a single digit is appended with a zero. The number after the second
+      dot gives L4. See *SbiInfo.parse_sbi_excel_database*
+    """
+    codes = codes.astype(str)
+    n_codes = len(codes)
+    is_group = codes.str.match(r"^\s*[a-zA-Z]").to_numpy(dtype=bool)
+
+    group_chars = codes.str.strip().where(is_group).ffill()
+    group_chars = group_chars.astype(object).where(group_chars.notnull(), None).to_numpy()
+
+    level_values = [np.zeros(n_codes, dtype=np.int64) for cnt in range(4)]
+    if is_group.all():
+        return [group_chars] + level_values
+
+    # split the codes xx.xx.xx into its numbers, removing the blanks around each number
+    numbers = codes[~is_group].str.split(".", expand=True)
+    numbers = [numbers[column].str.strip() for column in numbers.columns[:3]]
+
+    in_group = ~is_group
+    level_values[0][in_group] = numbers[0].astype(np.int64).to_numpy()
+    if len(numbers) > 1:
+        second = numbers[1]
+        has_second = second.notnull().to_numpy()
+        second = second[has_second]
+        n_digits = second.str.len()
+        if (n_digits > 2).any() or (n_digits < 1).any():
+            raise AssertionError("Should at max have two digits")
+        # in case we have a single digit, append a zero
+        second = second.where(n_digits == 2, second + "0")
+        positions = np.flatnonzero(in_group)[has_second]
+        level_values[1][positions] = second.str[0].astype(np.int64).to_numpy()
+        level_values[2][positions] = second.str[1].astype(np.int64).to_numpy()
+    if len(numbers) > 2:
+        third = numbers[2]
+        has_third = third.notnull().to_numpy()
+        positions = np.flatnonzero(in_group)[has_third]
+        level_values[3][positions] = third[has_third].astype(np.int64).to_numpy()
+
+    return [group_chars] + level_values
+
+
+def pack_sbi_levels(main, second, third, fourth):
+    """
+    Pack the levels of sbi codes into one integer key per code
+
+    Parameters
+    ----------
+    main, second, third, fourth: np.ndarray
+        The integer levels L1 .. L4 of the codes
+
+    Returns
+    -------
+    np.ndarray:
+        The keys as int64, which sort in the same order as the levels. Codes with a negative level
+        or a fourth level of SBI_FOURTH_LEVEL_SIZE or higher can not be packed and get the key -1
+    """
+    main, second, third, fourth = [np.asarray(level, dtype=np.int64)
+                                   for level in (main, second, third, fourth)]
+    keys = ((main * 10 + second) * 10 + third) * SBI_FOURTH_LEVEL_SIZE + fourth
+    invalid = ((main < 0) | (second < 0) | (second > 9) | (third < 0) | (third > 9) |
+               (fourth < 0) | (fourth >= SBI_FOURTH_LEVEL_SIZE))
+    keys[invalid] = -1
+    return keys
+
+
+def sbi_keys_to_positions(keys):
+    """
+    Get the positions of packed sbi keys in the dense table of *SbiLookup*
+
+    Parameters
+    ----------
+    keys: np.ndarray
+        The keys as created by *pack_sbi_levels*
+
+    Returns
+    -------
+    np.ndarray:
+        The position of each key, which is the five digit code (L1, L2, L3, L4). The keys which
+        can not be stored in the table, such as a fourth level of two digits, get the last
+        position SBI_DENSE_SIZE, which is never filled
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    prefix, fourth = np.divmod(keys, SBI_FOURTH_LEVEL_SIZE)
+    positions = prefix * 10 + fourth
+    positions[(keys < 0) | (fourth > 9) | (positions >= SBI_DENSE_SIZE)] = SBI_DENSE_SIZE
+    return positions
+
+
+def unpack_sbi_key(key):
+    """ Get the tuple of the levels (L1, L2, L3, L4) from a key created by *pack_sbi_levels* """
+    key = int(key)
+    fourth = key % SBI_FOURTH_LEVEL_SIZE
+    key //= SBI_FOURTH_LEVEL_SIZE
+    return key // 100, (key // 10) % 10, key % 10, fourth
+
+
+def sbi_codes_to_keys(code_array):
+    """
+    Convert an array of sbi codes such as '72431' into packed integer keys
+
+    Parameters
+    ----------
+    code_array: np.ndarray or list
+        The sbi codes as strings or bytes without dots, such as '6210' or b'74283'
+
+    Returns
+    -------
+    np.ndarray:
+        The key of each code as created by *pack_sbi_levels*
+
+    Notes
+    -----
+    * The first two characters are the main group (L1), the third and the fourth character the
+      sub groups (L2 and L3) and the rest the fourth level (L4). A level which is not given or
+      can not be read as an integer is 0
+    * The codes are converted to a 2D array with the character number per position by viewing the
+      fixed width *S* or *U* array as integers, so the digits of all codes are read at once. Only
+      the codes with other characters than digits, such as blanks, are converted one by one
+    """
+    codes = np.asarray(code_array)
+    if codes.dtype == object:
+        # the elements may be bytes or strings
+        codes = np.array([code.decode() if isinstance(code, bytes) else str(code)
+                          for code in codes.ravel()], dtype=str)
+    elif codes.dtype.kind not in "SU":
+        codes = codes.astype(str)
+    codes = codes.ravel()
+
+    n_codes = len(codes)
+    n_chars = codes.dtype.itemsize
+    if codes.dtype.kind == "U":
+        n_chars //= 4
+        char_type = np.uint32
+    else:
+        char_type = np.uint8
+    if n_codes == 0 or n_chars == 0:
+        return pack_sbi_levels(*[np.zeros(n_codes, dtype=np.int64)] * 4)
+
+    chars = np.ascontiguousarray(codes).view(char_type).reshape(n_codes, n_chars)
+    is_digit = (chars >= ord("0")) & (chars <= ord("9"))
+    is_padding = chars == 0
+    digits = np.where(is_digit, chars - ord("0"), 0).astype(np.int8)
+
+    # the fast conversion is only valid for codes with digits followed by the padding of the
+    # fixed width array
+    simple = (is_digit | is_padding).all(axis=1)
+    if n_chars > 1:
+        simple &= ~(is_padding[:, :-1] & is_digit[:, 1:]).any(axis=1)
+
+    def get_number(first, last):
+        """ Get the integer of the characters first up to last, where the padding is skipped """
+        number = np.zeros(n_codes, dtype=np.int64)
+        for position in range(first, min(last, n_chars)):
+            if position == first:
+                number += digits[:, position]
+            else:
+                number = np.where(is_digit[:, position], number * 10 + digits[:, position],
+                                  number)
+        return number
+
+    levels = [get_number(0, 2), get_number(2, 3), get_number(3, 4), get_number(4, n_chars)]
+
+    for position in np.flatnonzero(~simple):
+        code_str = codes[position]
+        if isinstance(code_str, bytes):
+            code_str = code_str.decode()
+        code_levels = sbi_code_str_to_levels(code_str)
+        for level, value in zip(levels, code_levels):
+            level[position] = value
+
+    return pack_sbi_levels(*levels)
+
+
+def sbi_code_str_to_levels(code_str):
+    """
+    Get the levels of one sbi code such as '74283' as used by *SbiInfo.get_sbi_groups*
+
+    Parameters
+    ----------
+    code_str: str
+        The code without dots
+
+    Returns
+    -------
+    tuple:
+        The levels (L1, L2, L3, L4). A level which is not given or can not be read as an integer is
+        0
+    """
+    levels = list()
+    for first, last in ((0, 2), (2, 3), (3, 4), (4, None)):
+        try:
+            levels.append(int(code_str[first:last]))
+        except ValueError:
+            levels.append(0)
+    return tuple(levels)
+
+
+def sbi_range_to_keys(index_range):
+    """
+    Get the bounds of a numerical range of sbi codes as packed keys
+
+    Parameters
+    ----------
+    index_range: str
+        Numerical selection, such as '10' (group 10), '10-12' (group 10, 11, 12) or
+        '62.19-62.93.4' (all codes between 62.1.9 and 62.9.3.4)
+
+    Returns
+    -------
+    tuple:
+        The first and the last key of *pack_sbi_levels* in the range. The levels which are not
+        given, are 0 for the first key and include all values for the last key
+    """
+    match = re.match(r"([\d\.]+)([-[\d\.]*]*)", index_range)
+    assert match, "No match found at all"
+
+    first = sbi_code_to_indices(match.group(1))
+    sbi_code_end = match.group(2)
+    if sbi_code_end != "":
+        last = sbi_code_to_indices(sbi_code_end[1:])
+    else:
+        last = first
+
+    low = pack_sbi_levels(*[[0 if level is None else level] for level in first[1:]])
+    high = pack_sbi_levels(*[[maximum if level is None else level]
+                             for level, maximum in zip(last[1:],
+                                                       (99, 9, 9, SBI_FOURTH_LEVEL_SIZE - 1))])
+    return int(low[0]), int(high[0])
+
+
+def sbi_main_range_to_bounds(index_range):
+    """
+    Get the bounds of a selection of main sbi groups
+
+    Parameters
+    ----------
+    index_range: str
+        Alphanumeric selection, such as 'A' (group A), 'AQ' (group A and Q), or 'A-C' (group A,
+        B, and C)
+
+    Returns
+    -------
+    list:
+        The first and the last main group per range, such as [('A', 'A'), ('Q', 'Q')] for 'AQ'
+    """
+    match = re.match("([A-Z])([-[A-Z]*]*)", index_range)
+    assert match, "No match found at all for alphanumeric"
+
+    if match.group(2).startswith("-"):
+        return [(match.group(1), match.group(2)[1:])]
+    return [(main_group, main_group) for main_group in index_range]
 
 
 def sbi_code_to_indices(code):
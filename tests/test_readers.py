@@ -1,11 +1,20 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import json
 import logging
 import os
+import sqlite3
+import subprocess
+from contextlib import closing
 
+import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
+import pytest
 import sys
+import time
+import yaml
 from pandas.util.testing import assert_frame_equal
 
 from cbs_utils.misc import range1
@@ -16,7 +25,11 @@ _logger = logging.getLogger(__name__)
 try:
     # this import is used when running python setup.py test or when running from within pycharm
     _logger.debug(sys.path)
-    from cbs_utils.readers import SbiInfo
+    from cbs_utils.readers import (PlotRenderer, SbiInfo, SbiLookup, StatLineTable,
+                                compile_sbi_group_spec, iter_json_array, load_statline_tables,
+                                read_dimension_lookups, sbi_codes_to_keys, sbi_codes_to_levels,
+                                unpack_sbi_key)
+    from cbs_utils import readers
 except ImportError:
     # if the import fails we are running this script from the command line and need to include the
     # current path
@@ -24,12 +37,101 @@ except ImportError:
     sys.path.insert(0, real_path)
     _logger.debug("Import cbs_utils from {}".format(sys.path[0]))
     # the double mlab_mdfreader is needed in case we are running the script from the command line
-    from cbs_utils.readers import SbiInfo
+    from cbs_utils.readers import (PlotRenderer, SbiInfo, SbiLookup, StatLineTable,
+                                compile_sbi_group_spec, iter_json_array, load_statline_tables,
+                                read_dimension_lookups, sbi_codes_to_keys, sbi_codes_to_levels,
+                                unpack_sbi_key)
+    from cbs_utils import readers
 
     sys.path.pop()
 
 DATA_DIR = "data"
 SBI_FILE = "SBI 2008 versie 2018.xlsx"
+STATLINE_TABLE_ID = "00000TST"
+BENCHMARK_DIR = os.path.join(os.path.dirname(__file__), "..", "benchmarks")
+
+
+def write_statline_json(cache_dir, table_id=STATLINE_TABLE_ID, periods=None):
+    """
+    Write a small statline table to *cache_dir* in the same way as cbsodata.get_data dumps it
+
+    The table has two modules: module A with the question directly under the module and module B
+    with the question nested in a chapter and a paragraph, such that all levels L0 - L4 are used.
+    In case *periods* is given, a second dimension 'Perioden' with these periods is added, where
+    the values of each next period are 1 higher
+    """
+    output_directory = os.path.join(cache_dir, table_id)
+    os.makedirs(output_directory, exist_ok=True)
+
+    def group(group_id, parent_id, title):
+        return {"odata.type": "Cbs.OData.TopicGroup", "ID": group_id, "ParentID": parent_id,
+                "Type": "TopicGroup", "Key": "", "Title": title, "Description": None}
+
+    def topic(topic_id, position, parent_id, key, title):
+        return {"odata.type": "Cbs.OData.Topic", "ID": topic_id, "Position": position,
+                "ParentID": parent_id, "Type": "Double", "Key": key, "Title": title,
+                "Description": None, "Datatype": "Double", "Unit": "%", "Decimals": 1,
+                "Default": "Impossible"}
+
+    data_properties = [
+        {"odata.type": "Cbs.OData.Dimension", "ID": 0, "Position": 0, "ParentID": None,
+         "Type": "Dimension", "Key": "Bedrijfsgrootte", "Title": "Bedrijfsgrootte",
+         "Description": "Grootte van het bedrijf", "Default": "None"},
+        group(1, None, "Module A"),
+        group(2, 1, "Vraag 1"),
+        topic(3, 1, 2, "V1_1", "Ja"),
+        topic(4, 2, 2, "V1_2", "Nee"),
+        group(5, None, "Module B"),
+        group(6, 5, "Hoofdstuk B1"),
+        group(7, 6, "Paragraaf B1.1"),
+        group(8, 7, "Vraag 2"),
+        topic(9, 3, 8, "V2_1", "Ja"),
+        topic(10, 4, 8, "V2_2", "Nee"),
+    ]
+    dimension = [{"Key": "GK1", "Title": "Klein", "Description": None},
+                 {"Key": "GK2", "Title": "Groot", "Description": None}]
+    typed_data_set = [
+        {"ID": 0, "Bedrijfsgrootte": "GK1", "V1_1": 10.0, "V1_2": 90.0, "V2_1": 20.0,
+         "V2_2": 80.0},
+        {"ID": 1, "Bedrijfsgrootte": "GK2", "V1_1": 30.0, "V1_2": 70.0, "V2_1": 40.0,
+         "V2_2": 60.0},
+    ]
+    dimensions = [("Bedrijfsgrootte", dimension)]
+    if periods is not None:
+        data_properties.insert(1, {"odata.type": "Cbs.OData.Dimension", "ID": 11,
+                                   "Position": 1, "ParentID": None, "Type": "Dimension",
+                                   "Key": "Perioden", "Title": "Perioden", "Description": None,
+                                   "Default": "None"})
+        dimensions.append(("Perioden", [{"Key": f"{period}JJ00", "Title": period,
+                                         "Description": None} for period in periods]))
+        records = list()
+        for cnt, period in enumerate(periods):
+            for record in typed_data_set:
+                record = {key: value + cnt if isinstance(value, float) else value
+                          for key, value in record.items()}
+                record["ID"] = len(records)
+                record["Perioden"] = f"{period}JJ00"
+                records.append(record)
+        typed_data_set = records
+    table_infos = [{"ID": 1, "Title": "Test tabel voor de StatLine reader",
+                    "ShortTitle": "Test tabel", "Identifier": table_id,
+                    "Modified": "2019-06-01T02:00:00"}]
+
+    for name, data in [("DataProperties", data_properties),
+                       ("TypedDataSet", typed_data_set),
+                       ("TableInfos", table_infos)] + dimensions:
+        with open(os.path.join(output_directory, name + ".json"), "w") as stream:
+            json.dump(data, stream)
+
+    return output_directory
+
+
+def read_statline_table(tmp_path, periods=None, **kwargs):
+    """ Write the test table to *tmp_path* and read it with StatLineTable """
+    cache_dir = str(tmp_path / "cache")
+    write_statline_json(cache_dir, periods=periods)
+    return StatLineTable(table_id=STATLINE_TABLE_ID, cache_dir_name=cache_dir,
+                         image_dir_name=str(tmp_path / "images"), **kwargs)
 
 
 def write_data():
@@ -70,6 +172,136 @@ def test_sbi_info():
     assert_frame_equal(sbi_df, sbi_df_expected)
 
 
+def test_sbi_codes_to_levels():
+    codes = pd.Series(["01", "A", "01\xa0", "01.1", "01.13", "01.13.2 ", "\xa0B", "6", "06.10"])
+    group_chars, level_1, level_2, level_3, level_4 = sbi_codes_to_levels(codes)
+
+    assert list(group_chars) == [None, "A", "A", "A", "A", "A", "B", "B", "B"]
+    assert list(level_1) == [1, 0, 1, 1, 1, 1, 0, 6, 6]
+    assert list(level_2) == [0, 0, 0, 1, 1, 1, 0, 0, 1]
+    assert list(level_3) == [0, 0, 0, 0, 3, 3, 0, 0, 0]
+    assert list(level_4) == [0, 0, 0, 0, 0, 2, 0, 0, 0]
+
+    with pytest.raises(AssertionError):
+        sbi_codes_to_levels(pd.Series(["A", "01.123"]))
+
+
+def test_sbi_get_sbi_groups():
+    data_location = os.path.realpath(os.path.join(os.path.dirname(__file__), "..", DATA_DIR))
+    sbi = SbiInfo(os.path.join(data_location, SBI_FILE))
+
+    code_array = np.array(["6201", "0111", "4711", "9999", "62", "1"])
+    groups = sbi.get_sbi_groups(code_array)
+    assert list(groups[:3]) == ["J", "A", "G"]
+    assert pd.isna(groups[3])
+    assert list(groups[4:]) == ["J", "A"]
+
+    # byte arrays and lists give the same groups
+    assert_frame_equal(pd.DataFrame(sbi.get_sbi_groups(code_array.astype("S5"))),
+                       pd.DataFrame(groups))
+    assert_frame_equal(pd.DataFrame(sbi.get_sbi_groups(list(code_array))), pd.DataFrame(groups))
+
+    # the codes are packed into integer keys, where blanks are handled like int() does
+    keys = sbi_codes_to_keys(np.array(["74283", "7428", " 7428", "74 28"]))
+    assert [unpack_sbi_key(key) for key in keys] == [(74, 2, 8, 3), (74, 2, 8, 0),
+                                                     (7, 4, 2, 8), (74, 0, 2, 8)]
+
+
+def test_sbi_lookup(tmp_path):
+    data_location = os.path.realpath(os.path.join(os.path.dirname(__file__), "..", DATA_DIR))
+    sbi = SbiInfo(os.path.join(data_location, SBI_FILE))
+
+    # the lookup is created again after a new group has been added
+    lookup = sbi.get_lookup()
+    assert sbi.get_lookup() is lookup
+    sbi.create_sbi_group(group_name="ICT", group_label="ICT-sector", indices=("26.80", "61"))
+    lookup = sbi.get_lookup()
+    assert lookup.columns == ["Grp", "code", "Label", "group_key", "group_label"]
+    assert lookup.table.dtype == np.int16
+
+    code_array = np.array(["6110", "26800", "6201", "9999", "742831"])
+    groups = sbi.get_sbi_groups(code_array, columns=["Grp", "group_key"])
+    assert list(groups[:3, 0]) == ["J", "C", "J"]
+    assert list(groups[:3, 1]) == ["ICT", "ICT", ""]
+    assert pd.isna(groups[3:]).all()
+
+    # the lookup read as a memory map from file gives the same groups
+    file_name = tmp_path / "sbi_lookup.npy"
+    lookup.save(file_name)
+    loaded = SbiLookup.load(file_name)
+    assert isinstance(loaded.table, np.memmap)
+    assert_frame_equal(pd.DataFrame(loaded.get_sbi_groups(code_array, ["Grp", "group_key"])),
+                       pd.DataFrame(groups))
+
+
+def test_sbi_create_sbi_groups(tmp_path):
+    data_location = os.path.realpath(os.path.join(os.path.dirname(__file__), "..", DATA_DIR))
+    sbi_file_name = os.path.join(data_location, SBI_FILE)
+
+    group_spec = {"10-12": "Voeding", "A-C": None, 28: "Machine-industrie",
+                  "ICT": {"label": "ICT-sector", "indices": ["26.80", "61"]},
+                  "Text13-15": {"level_1": range1(13, 15)}}
+
+    # creating the groups in one go is the same as creating them one by one
+    sbi = SbiInfo(sbi_file_name)
+    sbi.create_sbi_group(group_name="10-12", group_label="Voeding")
+    sbi.create_sbi_group(group_name="A-C")
+    sbi.create_sbi_group(group_name="28", group_label="Machine-industrie")
+    sbi.create_sbi_group(group_name="ICT", group_label="ICT-sector", indices=("26.80", "61"))
+    sbi.create_sbi_group(group_name="Text13-15", level_1=range1(13, 15))
+
+    spec_file = tmp_path / "sbi_groups.yml"
+    with open(spec_file, "w") as stream:
+        yaml.dump(group_spec, stream, sort_keys=False)
+    sbi_batch = SbiInfo(sbi_file_name)
+    sbi_batch.create_sbi_groups(str(spec_file))
+    assert_frame_equal(sbi_batch.data, sbi.data)
+
+    # the later group wins, but keeps the label of an earlier group if it has no label itself
+    data = sbi_batch.data
+    assert data.loc[("C", 10, 1, 1, 0), "group_key"] == "A-C"
+    assert data.loc[("C", 10, 1, 1, 0), "group_label"] == "Voeding"
+    assert data.loc[("C", 13, 0, 0, 0), "group_key"] == "Text13-15"
+    assert data.loc[("J", 61, 0, 0, 0), "group_label"] == "ICT-sector"
+
+    # the compiled specification is cached
+    assert compile_sbi_group_spec(group_spec) is compile_sbi_group_spec(str(spec_file))
+
+
+def test_sbi_compile_sbi_group_spec_cache(monkeypatch):
+    # only the most recently used specifications are kept
+    monkeypatch.setattr(readers, "SBI_GROUP_SPEC_CACHE_SIZE", 2)
+    monkeypatch.setattr(readers, "_sbi_group_specs", readers.collections.OrderedDict())
+    specs = [compile_sbi_group_spec({str(code): None}) for code in (10, 11)]
+    assert compile_sbi_group_spec({"10": None}) is specs[0]
+    compile_sbi_group_spec({"12": None})
+    assert len(readers._sbi_group_specs) == 2
+    assert compile_sbi_group_spec({"10": None}) is specs[0]
+    assert compile_sbi_group_spec({"11": None}) is not specs[1]
+
+
+def test_sbi_get_index_from_string():
+    data_location = os.path.realpath(os.path.join(os.path.dirname(__file__), "..", DATA_DIR))
+    sbi = SbiInfo(os.path.join(data_location, SBI_FILE))
+
+    # the numerical ranges include the sub levels of the last code, and start at the first code
+    assert sbi.get_index_from_string("62.01.2-62.03").tolist() == [("J", 62, 0, 2, 0),
+                                                                  ("J", 62, 0, 3, 0)]
+    assert sbi.get_index_from_string("62").tolist()[:2] == [("J", 62, 0, 0, 0),
+                                                             ("J", 62, 0, 1, 0)]
+    assert len(sbi.get_index_from_string("99.99")) == 0
+
+    # the main groups can be given as a range or as separate characters
+    index = sbi.get_index_from_string("A-C")
+    assert [index[0], index[-1]] == [("A", 0, 0, 0, 0), ("C", 33, 2, 9, 0)]
+    assert len(sbi.get_index_from_string("AQ")) == len(sbi.get_index_from_string("A")) + len(
+        sbi.get_index_from_string("Q"))
+
+    # the order of the codes follows the merged groups
+    sbi.merge_groups(new_name="D-E", group_list=["D", "E"])
+    assert sbi.get_index_from_string("D-E")[0] == ("D-E", 0, 0, 0, 0)
+
+
 def test_sbi_merge_groups():
     # name of the example xls file
     data_location = os.path.realpath(os.path.join(os.path.dirname(__file__), "..", DATA_DIR))
@@ -113,6 +345,608 @@ def test_sbi_merge_groups():
     pass
 
 
+def test_statline_table(tmp_path):
+    statline = read_statline_table(tmp_path, to_pickle=False)
+
+    question_df = statline.question_df
+    assert question_df.shape == (8, 12)
+    assert question_df.index.names == ["L0", "L1", "L2", "L3", "L4"]
+    assert question_df["Key"].tolist() == ["V1_1", "V1_2", "V2_1", "V2_2"] * 2
+    assert question_df["Bedrijfsgrootte"].tolist() == ["Klein"] * 4 + ["Groot"] * 4
+    assert question_df["Bedrijfsgrootte_Key"].tolist() == ["GK1"] * 4 + ["GK2"] * 4
+    assert question_df["Values"].tolist() == [10, 90, 20, 80, 30, 70, 40, 60]
+    assert question_df.index[0][:3] == (1, 2, 3)
+    assert question_df.index[2] == (5, 6, 7, 8, 9)
+    assert question_df["Section"].tolist()[1:3] == [
+        "Module A\nVraag 1", "Module B\nHoofdstuk B1\nParagraaf B1.1\nVraag 2"]
+
+    assert statline.section_df.index.tolist() == [1, 2, 5, 6, 7, 8]
+    assert statline.section_df["Title"].tolist()[:2] == ["Module A", "Vraag 1"]
+    assert statline.dimension_df["Key"].tolist() == ["Bedrijfsgrootte"]
+    assert statline.x_axis_key == "Bedrijfsgrootte"
+
+
+def test_statline_table_streaming(tmp_path):
+    statline = read_statline_table(tmp_path / "load", to_pickle=False)
+    statline_streamed = read_statline_table(tmp_path / "stream", to_pickle=False, chunk_size=16)
+
+    assert statline_streamed.typed_data_set is None
+    assert_frame_equal(statline_streamed.question_df, statline.question_df)
+
+
+def test_iter_json_array(tmp_path, monkeypatch):
+    items = [{"ID": 0, "Value": 1.5, "Key": "A [,]"}, {"ID": 1, "Value": None, "Key": "B"}, 12345,
+             2.5e3]
+    for name, data in (("array.json", items),
+                       ("odata.json", {"odata.metadata": "https://opendata.cbs.nl",
+                                       "odata.note": {"value": [1, 2], "text": '"value": ['},
+                                       "value": items})):
+        file_name = tmp_path / name
+        with open(file_name, "w") as stream:
+            json.dump(data, stream, indent=4)
+
+        assert list(iter_json_array(file_name)) == items
+
+        # the file is opened once, for both finding the array and parsing it
+        opened = list()
+        builtin_open = open
+
+        def counting_open(*args, **kwargs):
+            opened.append(args)
+            return builtin_open(*args, **kwargs)
+
+        monkeypatch.setattr("builtins.open", counting_open)
+        assert list(iter_json_array(file_name)) == items
+        assert opened == [(file_name, "rb")]
+        monkeypatch.undo()
+
+        # force the use of the pure python parser with a small chunk size
+        monkeypatch.setattr("cbs_utils.readers.ijson", None)
+        for chunk_size in (1, 7, 1000):
+            assert list(iter_json_array(file_name, chunk_size=chunk_size)) == items
+        monkeypatch.undo()
+
+
+def test_statline_table_dimensions(tmp_path):
+    stat = read_statline_table(tmp_path, dimension_workers=2)
+
+    lookup = stat.dimensions["Bedrijfsgrootte"]
+    assert list(lookup.keys) == ["GK1", "GK2"]
+    assert list(lookup.get_titles(["GK2", "GK1", "GK2"])) == ["Groot", "Klein", "Groot"]
+    with pytest.raises(KeyError):
+        lookup.get_positions(["GK3"])
+
+    dimension_files = {key: stat.output_directory / f"{key}.json" for key in ["Bedrijfsgrootte"]}
+    lookups = read_dimension_lookups(dimension_files, workers=2)
+    assert list(lookups["Bedrijfsgrootte"].titles) == ["Klein", "Groot"]
+
+    assert list(stat.question_df["Bedrijfsgrootte"].unique()) == ["Klein", "Groot"]
+
+
+@pytest.mark.parametrize("cache_format", ["parquet", "feather"])
+def test_statline_table_arrow_cache(tmp_path, cache_format):
+    pytest.importorskip("pyarrow")
+
+    statline = read_statline_table(tmp_path, cache_format="pickle")
+
+    # the first time the cache is created, the second time it is read
+    for cnt in range(2):
+        statline_arrow = read_statline_table(tmp_path, cache_format=cache_format,
+                                             compact_dtypes=False)
+        assert statline_arrow.cache_files["question"].exists()
+        assert_frame_equal(statline_arrow.question_df, statline.question_df)
+        assert_frame_equal(statline_arrow.section_df, statline.section_df)
+        assert_frame_equal(statline_arrow.dimension_df, statline.dimension_df)
+
+    # only read a selection of the columns and the rows of module B
+    statline_selection = read_statline_table(tmp_path, cache_format=cache_format,
+                                             columns=["Key", "Values"], filters=[("L0", "==", 5)],
+                                             compact_dtypes=False)
+    expected_df = statline.question_df.loc[5, ["Key", "Values"]]
+    assert_frame_equal(statline_selection.question_df.droplevel(0), expected_df)
+
+
+def test_statline_table_compact_dtypes(tmp_path):
+    pytest.importorskip("pyarrow")
+
+    statline = read_statline_table(tmp_path, cache_format="pickle")
+    assert statline.question_df["Title"].dtype == object
+
+    # the compaction is on by default for the arrow cache formats, also after reading the cache
+    for cnt in range(2):
+        statline_compact = read_statline_table(tmp_path, cache_format="parquet")
+        question_df = statline_compact.question_df
+        assert isinstance(question_df["Section"].dtype, pd.CategoricalDtype)
+        assert isinstance(question_df["Bedrijfsgrootte"].dtype, pd.CategoricalDtype)
+        assert question_df["ID"].dtype == np.int8
+        assert question_df["Values"].dtype == np.float32
+        assert list(question_df["Values"]) == list(statline.question_df["Values"])
+
+    # the data of the plots is the same
+    plot_job = statline_compact.get_plot_jobs()[0]
+    assert_frame_equal(plot_job["data"], statline.get_plot_jobs()[0]["data"])
+
+    report = statline_compact.memory_report()
+    assert list(report.columns) == ["before", "after", "ratio"]
+    assert list(report.index) == ["Index"] + list(question_df.columns) + ["Total"]
+    assert report.loc["Total", "after"] < report.loc["Total", "before"]
+
+
+def test_statline_table_manifest(tmp_path, monkeypatch):
+    statline = read_statline_table(tmp_path)
+    assert statline.manifest_file.exists()
+    assert statline.typed_data_set is not None
+
+    # the json files are written again with the same content, so the cache is still valid and
+    # the TypedDataSet does not need to be read
+    statline = read_statline_table(tmp_path)
+    assert statline.typed_data_set is None
+    assert statline.question_df["Values"].tolist()[0] == 10
+
+    # the new file times are stored in the manifest, so the next check does not hash the files
+    typed_data_set_file = statline.output_directory / "TypedDataSet.json"
+    os.utime(typed_data_set_file, ns=(0, 0))
+    assert statline.cache_is_valid()
+    hashed = list()
+    monkeypatch.setattr("cbs_utils.readers.get_file_hash", hashed.append)
+    assert statline.cache_is_valid()
+    assert hashed == []
+    monkeypatch.undo()
+
+    # change a value of the table: the cache needs to be rebuild
+    with open(typed_data_set_file, "r") as stream:
+        typed_data_set = json.load(stream)
+    typed_data_set[0]["V1_1"] = 15.0
+    with open(typed_data_set_file, "w") as stream:
+        json.dump(typed_data_set, stream)
+
+    def read_from_cache(**kwargs):
+        return StatLineTable(table_id=STATLINE_TABLE_ID, cache_dir_name=str(tmp_path / "cache"),
+                             image_dir_name=str(tmp_path / "images"), **kwargs)
+
+    statline = read_from_cache()
+    assert statline.typed_data_set is not None
+    assert statline.question_df["Values"].tolist()[0] == 15
+    assert read_from_cache().typed_data_set is None
+
+    # an option which changes the data frames also invalidates the cache
+    statline = read_from_cache(value_key="Waarde")
+    assert statline.typed_data_set is not None
+    assert "Waarde" in statline.question_df.columns
+
+
+def test_statline_table_lazy(tmp_path):
+    stat = read_statline_table(tmp_path, lazy=True)
+
+    # nothing has been read yet
+    assert stat.stages_done == set()
+
+    # accessing the question data frame creates it, but not the info data frames
+    assert stat.question_df.shape == (8, 12)
+    assert stat.stages_done == {"raw", "frames"}
+    assert stat.x_axis_key == "Bedrijfsgrootte"
+
+    stat.materialize(stages=["info"])
+    assert stat.stages_done == {"raw", "frames", "info"}
+    assert list(stat.question_info_df[stat.key_key]) == ["V1_1", "V1_2", "V2_1", "V2_2"]
+
+    with pytest.raises(ValueError):
+        stat.materialize(stages=["plots"])
+
+    # the second lazy table reads the data frames from the cache
+    stat2 = read_statline_table(tmp_path, lazy=True)
+    assert_frame_equal(stat2.question_df, stat.question_df)
+
+
+def test_load_statline_tables(tmp_path):
+    source_dir = str(tmp_path / "dumps")
+    table_ids = [STATLINE_TABLE_ID, "00001TST"]
+    for table_id in table_ids:
+        write_statline_json(source_dir, table_id)
+
+    expected = read_statline_table(tmp_path / "expected")
+
+    # the last table does not exist in the source directory and should fail without aborting
+    tables, report = load_statline_tables(table_ids + ["00002TST"], workers=2,
+                                          source_dir=source_dir,
+                                          cache_dir_name=str(tmp_path / "cache"),
+                                          image_dir_name=str(tmp_path / "images"))
+
+    assert list(tables.keys()) == table_ids
+    for table_id in table_ids:
+        assert_frame_equal(tables[table_id].question_df, expected.question_df)
+        assert report.loc[table_id, "status"] == "ok"
+        assert report.loc[table_id, "build_time"] > 0
+    assert report.loc["00002TST", "status"] == "download failed"
+    assert "FileNotFoundError" in report.loc["00002TST", "error"]
+
+    # the second time the tables are read from the cache in the current process
+    tables, report = load_statline_tables(table_ids, workers=1, source_dir=source_dir,
+                                          cache_dir_name=str(tmp_path / "cache"),
+                                          image_dir_name=str(tmp_path / "images"))
+    assert (report["status"] == "ok").all()
+    assert_frame_equal(tables["00001TST"].question_df, expected.question_df)
+
+
+def test_statline_table_sql(tmp_path):
+    stat = read_statline_table(tmp_path)
+    sqlite_db = stat.cache_dir / "sqlite.db"
+    table_name = "_".join([STATLINE_TABLE_ID, "question"])
+
+    # the bulk export gives the same table as the export with to_sql
+    stat.write_sql_data(bulk=False)
+    with closing(sqlite3.connect(sqlite_db)) as connection:
+        expected = pd.read_sql(f'SELECT * FROM "{table_name}"', connection)
+    stat.write_sql_data(write_questions_only=False)
+    with closing(sqlite3.connect(sqlite_db)) as connection:
+        assert_frame_equal(pd.read_sql(f'SELECT * FROM "{table_name}"', connection), expected)
+        indices = [row[1] for row in connection.execute(f'PRAGMA index_list("{table_name}")')]
+        assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert sorted(indices) == sorted([f"ix_{table_name}_L0_L1_L2_L3_L4", f"ix_{table_name}_Key",
+                                      f"ix_{table_name}_Bedrijfsgrootte_Key"])
+
+    # appending replaces the rows of the same dimension value and adds the new dimension values
+    question_df = stat.question_df
+    update_df = question_df[question_df["Bedrijfsgrootte_Key"] == "GK1"].copy()
+    update_df["Values"] = [1, 2, 3, 4]
+    new_df = update_df.copy()
+    new_df["Bedrijfsgrootte_Key"] = "GK3"
+    stat.question_df = pd.concat([update_df, new_df])
+    stat.write_sql_data(if_exists="append")
+    with closing(sqlite3.connect(sqlite_db)) as connection:
+        result = pd.read_sql(f'SELECT * FROM "{table_name}"', connection)
+    assert len(result) == 12
+    values = result.groupby("Bedrijfsgrootte_Key")["Values"].apply(list)
+    assert values["GK1"] == [1, 2, 3, 4]
+    assert values["GK2"] == list(expected.loc[expected["Bedrijfsgrootte_Key"] == "GK2", "Values"])
+    assert values["GK3"] == [1, 2, 3, 4]
+
+    # the rows with a missing dimension value are replaced as well
+    null_df = update_df.copy()
+    null_df["Bedrijfsgrootte_Key"] = None
+    stat.question_df = null_df
+    for _ in range(2):
+        stat.write_sql_data(if_exists="append")
+    with closing(sqlite3.connect(sqlite_db)) as connection:
+        result = pd.read_sql(f'SELECT * FROM "{table_name}"', connection)
+    assert len(result) == 16
+    assert result["Bedrijfsgrootte_Key"].isna().sum() == 4
+
+    # without dimension key columns the rows can not be matched, so the table is replaced
+    stat.question_df = null_df.drop(columns="Bedrijfsgrootte_Key")
+    for _ in range(2):
+        stat.write_sql_data(if_exists="append")
+    with closing(sqlite3.connect(sqlite_db)) as connection:
+        result = pd.read_sql(f'SELECT * FROM "{table_name}"', connection)
+    assert len(result) == 4
+    assert "Bedrijfsgrootte_Key" not in result.columns
+
+
+def test_statline_table_get_question_df(tmp_path):
+    stat = read_statline_table(tmp_path)
+
+    question_df = stat.get_question_df(2)
+    assert list(question_df[stat.key_key]) == ["V1_1", "V1_2", "V1_1", "V1_2"]
+    assert question_df.index.names == ["L2", "L3", "L4"]
+
+    # the result is stored and returned again, unless a copy is asked for which can be modified
+    assert stat.get_question_df(2) is question_df
+    question_copy = stat.get_question_df(2, copy=True)
+    assert question_copy is not question_df
+    question_copy.iloc[0, question_copy.columns.get_loc("Values")] = -999
+    assert_frame_equal(stat.get_question_df(2), question_df)
+    assert question_df["Values"].iloc[0] != -999
+
+    # the question in module B is nested in a chapter and a paragraph
+    assert list(stat.get_question_df(6)[stat.key_key]) == ["V2_1", "V2_2", "V2_1", "V2_2"]
+    assert_frame_equal(stat.get_question_df(8), stat.get_question_df(6))
+    assert stat.get_question_tree().get_node(8).level == 3
+
+    assert stat.get_question_df(999) is None
+
+    # assigning a new question_df resets the tree
+    stat.question_df = stat.question_df.iloc[:4]
+    assert stat.question_tree is None
+    assert len(stat.get_question_df(6)) == 2
+
+
+def test_statline_table_level_titles(tmp_path):
+    stat = read_statline_table(tmp_path, add_level_titles=True)
+    question_df = stat.question_df.reset_index()
+
+    # the last level only contains topics, so its title column is dropped
+    title_columns = ["L0_title", "L1_title", "L2_title", "L3_title"]
+    location = list(question_df.columns).index("Section")
+    assert list(question_df.columns[location + 1: location + 5]) == title_columns
+
+    module_a = question_df[question_df["L0"] == 1]
+    assert list(module_a.iloc[0][title_columns]) == ["Module A", "Vraag 1", None, None]
+    module_b = question_df[question_df["L0"] == 5]
+    assert list(module_b.iloc[0][title_columns]) == ["Module B", "Hoofdstuk B1", "Paragraaf B1.1",
+                                                     "Vraag 2"]
+
+    # the section is the join of the titles of all levels
+    for _, row in question_df.iterrows():
+        titles = [title for title in row[title_columns] if title is not None]
+        assert row["Section"] == "\n".join(titles)
+
+
+def test_statline_table_unknown_level(tmp_path, monkeypatch, caplog):
+    # remove the paragraph of module B from the sections, such that its level id is unknown
+    records_to_data_frame = readers.records_to_data_frame
+
+    def records_without_paragraph(records, columns, n_blocks):
+        data_frame = records_to_data_frame(records, columns, n_blocks)
+        return data_frame[data_frame["ID"] != 7]
+
+    monkeypatch.setattr(readers, "records_to_data_frame", records_without_paragraph)
+    stat = read_statline_table(tmp_path, to_pickle=False)
+    assert "level ids [7]" in caplog.text
+    module_b = stat.question_df.reset_index()
+    module_b = module_b[module_b["L0"] == 5]
+    assert (module_b["Section"] == "Module B\nHoofdstuk B1\nVraag 2").all()
+
+
+def test_statline_table_fill_question_list_performance(tmp_path, monkeypatch):
+    # the section titles are resolved per level column. With a lookup per row, this table with
+    # 5000 topics in 7 section levels took about 2 s, so the bound is generous
+    monkeypatch.syspath_prepend(BENCHMARK_DIR)
+    from synthetic_statline import write_synthetic_statline
+    n_topics = write_synthetic_statline(tmp_path / "cache", table_id="99998NED", n_modules=40,
+                                        n_questions=25, n_options=5, deep_every=1,
+                                        n_deep_levels=6)
+    stat = StatLineTable(table_id="99998NED", cache_dir_name=str(tmp_path / "cache"),
+                         image_dir_name=str(tmp_path / "images"), max_levels=9, lazy=True,
+                         to_pickle=False, write_info_to_image_dir=False)
+    stat.materialize(stages=["raw"])
+    stat.initialize_dataframes()
+    start = time.perf_counter()
+    stat.fill_question_list()
+    duration = time.perf_counter() - start
+    assert len(stat.question_df) == n_topics
+    assert duration < 1.0, f"fill_question_list of {n_topics} topics took {duration:.2f} s"
+
+
+def test_statline_table_plot_workers(tmp_path):
+    stat = read_statline_table(tmp_path, save_plot=True, store_plot_data_to_xls=True)
+
+    file_names = sorted(job["image_name"].name for job in stat.get_plot_jobs())
+    assert file_names == ["00000TST_module_a_vraag_1_all.png"]
+
+    # rendering with workers gives the same files as rendering in the current process
+    assert stat.plot(workers=2) == {}
+    images = sorted(file_name.name for file_name in stat.image_dir.glob("*_all.*"))
+    assert images == ["00000TST_module_a_vraag_1_all.png", "00000TST_module_a_vraag_1_all.xlsx"]
+
+    # the errors are collected per figure
+    stat.image_dir = tmp_path / "does_not_exist"
+    errors = stat.plot(workers=2)
+    assert list(errors.keys()) == ["00000TST_module_a_vraag_1_all"]
+
+
+def test_statline_table_incremental_plots(tmp_path):
+    stat = read_statline_table(tmp_path, save_plot=True, incremental_plots=True)
+    image_name = stat.image_dir / "00000TST_module_a_vraag_1_all.png"
+
+    stat.plot()
+    assert image_name.exists()
+    with open(stat.plot_manifest_file, "r") as stream:
+        assert list(json.load(stream).keys()) == ["00000TST_module_a_vraag_1_all"]
+
+    # nothing has changed, so the figure is not rendered again
+    os.utime(image_name, ns=(0, 0))
+    stat.plot()
+    assert image_name.stat().st_mtime_ns == 0
+
+    # a change of the plot settings renders the figure again
+    stat.legend_title = "Grootte"
+    stat.plot()
+    assert image_name.stat().st_mtime_ns > 0
+
+    # and so does a change of the data
+    os.utime(image_name, ns=(0, 0))
+    stat.question_df.iloc[0, stat.question_df.columns.get_loc("Values")] = 11
+    stat.plot()
+    assert image_name.stat().st_mtime_ns > 0
+
+    # a missing output file is rendered again as well
+    image_name.unlink()
+    stat.plot()
+    assert image_name.exists()
+
+
+def test_statline_table_plot_renderer(tmp_path):
+    stat = read_statline_table(tmp_path, save_plot=True)
+    plot_job = stat.get_plot_jobs()[0]
+    open_figures = plt.get_fignums()
+
+    with PlotRenderer() as renderer:
+        fig = renderer.render(plot_job)
+        n_artists = len(fig.get_children()) + len(renderer.axis.get_children())
+        assert renderer.render(plot_job) is fig
+        # the second figure reuses the logo and the titles and has the same artists
+        assert len(fig.get_children()) + len(renderer.axis.get_children()) == n_artists
+        assert [text.get_text() for text in fig.texts] == ["Test tabel", "Module A", "Vraag 1"]
+
+    # all the figures are closed again
+    assert plt.get_fignums() == open_figures
+    assert plot_job["image_name"].exists()
+
+
+def test_statline_table_plot_data_batch(tmp_path):
+    stat = read_statline_table(tmp_path, store_plot_data_to_xls=True, store_plot_data_to_tex=True,
+                               rotate_latex_columns=True, plot_data_batch="table")
+    stat.plot()
+
+    # all questions are written to one workbook with a sheet per question
+    xls_file = stat.image_dir / "00000TST_all.xlsx"
+    assert not (stat.image_dir / "00000TST_module_a_vraag_1_all.xlsx").exists()
+    plot_data = pd.read_excel(xls_file, sheet_name=None, index_col=0)
+    assert list(plot_data.keys()) == ["Vraag 1"]
+    expected = stat.get_plot_jobs()[0]["data"]
+    assert list(plot_data["Vraag 1"].columns) == list(expected.columns)
+    assert (plot_data["Vraag 1"].values == expected.values).all()
+
+    with open(stat.image_dir / "00000TST_module_a_vraag_1_all.tex", "r") as stream:
+        latex = stream.read()
+    assert r"\rot{Ja}" in latex
+    assert "textbackslash" not in latex
+
+    # a figure made outside plot writes its own workbook, as no batch workbook is written
+    stat.image_dir = tmp_path / "single"
+    stat.image_dir.mkdir()
+    _, _, sub_level_df = next(stat.iter_question_sub_level_dfs())
+    stat.make_the_plot(sub_level_df)
+    assert (stat.image_dir / "00000TST_module_a_vraag_1_all.xlsx").exists()
+    assert not (stat.image_dir / "00000TST_all.xlsx").exists()
+    assert "xls_file" not in stat.get_plot_jobs(batch_plot_data=True)[0]
+
+    with pytest.raises(ValueError):
+        read_statline_table(tmp_path, plot_data_batch="question")
+
+
+def test_statline_table_iter_question_frames(tmp_path):
+    stat = read_statline_table(tmp_path, save_plot=True)
+
+    question_frames = stat.iter_question_frames()
+    module_id, question_id, question_df = next(question_frames)
+    assert (module_id, question_id) == (1, 2)
+    assert list(question_df.columns) == ["Klein", "Groot"]
+    assert list(question_df.index) == ["Ja", "Nee"]
+    assert list(question_df["Klein"]) == [10, 90]
+    assert_frame_equal(question_df, stat.get_plot_jobs()[0]["data"])
+
+    # a change of the question_df in place is not hidden by the stored pivot table
+    stat.question_df.iloc[0, stat.question_df.columns.get_loc("Values")] = 11
+    question_df = next(stat.iter_question_frames())[2]
+    assert list(question_df["Klein"]) == [11, 90]
+
+    assert list(stat.iter_question_frames(modules=[5])) == []
+    assert list(stat.iter_question_frames(questions=[999])) == []
+
+    # iterating over the question frames does not import matplotlib
+    script = "\n".join([
+        "import sys",
+        "from cbs_utils.readers import StatLineTable",
+        f"stat = StatLineTable(table_id='{STATLINE_TABLE_ID}',",
+        f"                     cache_dir_name=r'{stat.cache_dir}',",
+        f"                     image_dir_name=r'{tmp_path / 'images'}')",
+        "assert len(list(stat.iter_question_frames())) == 1",
+        "assert 'matplotlib' not in sys.modules",
+    ])
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    subprocess.run([sys.executable, "-c", script], env=env, check=True)
+
+
+def test_statline_table_question_blocks(tmp_path):
+    stat = read_statline_table(tmp_path)
+
+    question_blocks = stat.get_question_blocks()
+    assert [block[:2] for block in question_blocks] == [(1, 2)]
+    module_id, question_id, positions, first_level = question_blocks[0]
+    assert list(stat.question_df.take(positions)["Key"]) == list(stat.get_question_df(2)["Key"])
+    assert stat.get_question_blocks() is question_blocks
+
+    # the question is found by its own id or the id of its module, but not by an unknown id
+    assert [block[:2] for block in stat.get_question_blocks(questions=[2])] == [(1, 2)]
+    assert [block[:2] for block in stat.get_question_blocks(questions=[1])] == [(1, 2)]
+    assert stat.get_question_blocks(questions=[999]) == []
+
+    _, _, sub_level_df = next(stat.iter_question_sub_level_dfs())
+    assert stat._has_equal_number_of_nans(question_id, sub_level_df)
+    unequal_index = pd.MultiIndex.from_tuples([(3, None), (3, 4)])
+    assert not stat._has_equal_number_of_nans(question_id, pd.DataFrame(index=unequal_index))
+    assert not stat._has_equal_number_of_nans(question_id, sub_level_df.reset_index(drop=True))
+
+    # assigning a new question_df resets the stored blocks
+    stat.question_df = stat.question_df.copy()
+    assert stat.question_blocks is None
+
+
+def test_statline_table_question_tree(tmp_path):
+    stat = read_statline_table(tmp_path)
+    tree = stat.question_tree
+
+    assert [node.id for node in tree.walk()] == [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+    assert [node.id for node in tree.walk(6)] == [6, 7, 8, 9, 10]
+    assert [node.title for node in tree.modules] == ["Module A", "Module B"]
+
+    node = tree.find("V2_1")
+    assert (node.id, node.level, node.title, node.is_leaf) == (9, 4, "Ja", True)
+    assert [parent.id for parent in node.ancestors] == [5, 6, 7, 8]
+    assert [child.key for child in node.parent.children] == ["V2_1", "V2_2"]
+    assert tree.find("V3_1") is None
+    assert 8 in tree and 11 not in tree
+
+    # the rows of a node and its sub nodes are in the order of the question_df
+    assert_frame_equal(tree.subtree_frame(2), stat.question_df.iloc[[0, 1, 4, 5]])
+    assert tree.get_node(5).n_rows == 4
+
+    # the tree is stored with the cache and read again
+    assert stat.tree_file.exists()
+    stat_cached = read_statline_table(tmp_path)
+    cached_tree = stat_cached.question_tree
+    assert [node.id for node in cached_tree.walk()] == [node.id for node in tree.walk()]
+    assert cached_tree.find("V1_2").id == 4
+    assert_frame_equal(cached_tree.subtree_frame(8), tree.subtree_frame(8))
+
+
+def test_statline_table_prepare_data_frame(tmp_path):
+    stat = read_statline_table(tmp_path)
+    module_id, question_id, sub_level_df = next(stat.iter_question_sub_level_dfs())
+    original_df = sub_level_df.copy()
+
+    question_df = stat.prepare_data_frame(sub_level_df, question_id=question_id)
+    assert_frame_equal(sub_level_df, original_df)
+    assert list(question_df.columns) == ["Klein", "Groot"]
+    assert list(question_df.index) == ["Ja", "Nee"]
+    assert len(stat.question_pivots) == 1
+
+    # the result is a new data frame, so modifying it does not change the stored pivot table
+    expected_df = question_df.copy()
+    question_df.iloc[0, 0] = -999
+    question_df *= 100
+    assert_frame_equal(stat.prepare_data_frame(sub_level_df, question_id=question_id),
+                       expected_df)
+
+    # another selection and sorting reuses the stored pivot table
+    pivot_df = list(stat.question_pivots.values())[0][0]
+    stat.apply_selection = True
+    stat.selection = {"Groot bedrijf": "Groot"}
+    stat.sort_choices = True
+    question_df = stat.prepare_data_frame(sub_level_df, question_id=question_id)
+    assert list(question_df.columns) == ["Groot"]
+    assert list(question_df["Groot"]) == [30, 70]
+    assert list(stat.question_pivots.values())[0][0] is pivot_df
+
+    # an option with two values for the same x axis value can not be put in a table
+    stat.question_pivots = None
+    duplicated_df = pd.concat([sub_level_df, sub_level_df.iloc[:1]])
+    assert isinstance(stat.prepare_data_frame(duplicated_df), pd.Series)
+
+
+def test_statline_table_prepare_data_frame_periods(tmp_path):
+    stat = read_statline_table(tmp_path, periods=["2018", "2019"])
+    module_id, question_id, sub_level_df = next(stat.iter_question_sub_level_dfs())
+    assert len(sub_level_df) == 8
+
+    # the pivot table of the whole question block is stored
+    question_df = stat.prepare_data_frame(sub_level_df.iloc[:4])
+    assert stat.question_pivots is None
+    stat.prepare_data_frame(sub_level_df, question_id=question_id)
+    assert len(stat.question_pivots) == 1
+
+    # each subset of the rows gets its own values, not the ones of another subset or the block
+    for cnt, period in enumerate(["2018", "2019"]):
+        period_df = stat.prepare_data_frame(sub_level_df[sub_level_df["Perioden"] == period])
+        assert list(period_df.columns) == ["Klein", "Groot"]
+        assert list(period_df["Klein"]) == [10 + cnt, 90 + cnt]
+        assert list(period_df["Groot"]) == [30 + cnt, 70 + cnt]
+    assert_frame_equal(question_df, stat.prepare_data_frame(
+        sub_level_df[sub_level_df["Perioden"] == "2018"]))
+    assert len(stat.question_pivots) == 1
+
+
 def main():
     if "--debug" in sys.argv:
         _logger.setLevel(logging.DEBUG)